@@ -0,0 +1,95 @@
+"""Admission control for upstream LLM calls.
+
+At most ``max_concurrency`` calls run at once and at most ``max_queue``
+more wait for a slot. A request that finds the queue full is rejected
+straight away (429), and one that waits past its deadline gives up (503);
+both carry a Retry-After estimate derived from recent call durations. This
+keeps overload visible as bounded queueing delay instead of an unbounded
+pile of pending coroutines.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Optional
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int = 32, max_queue: int = 128, queue_timeout: float = 30.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        # Exponentially weighted average of how long a slot is held, for Retry-After
+        self._service_seconds = 1.0
+        self._wait_ms = deque(maxlen=1000)
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained"""
+        backlog = self.waiting + 1
+        return max(1, math.ceil(self._service_seconds * backlog / self.max_concurrency))
+
+    async def acquire(self, timeout: Optional[float] = None):
+        """Take a slot, waiting at most ``timeout`` (default ``queue_timeout``) seconds"""
+        start = time.perf_counter()
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                self.rejected_queue_full += 1
+                raise AdmissionRejected(429, "Too many requests waiting for the model", self.retry_after())
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(
+                    self._semaphore.acquire(),
+                    timeout=self.queue_timeout if timeout is None else timeout
+                )
+            except asyncio.TimeoutError:
+                self.rejected_timeout += 1
+                raise AdmissionRejected(503, "Timed out waiting for the model", self.retry_after())
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+
+        self.in_flight += 1
+        self.admitted += 1
+        self._wait_ms.append((time.perf_counter() - start) * 1000)
+        return time.perf_counter()
+
+    def release(self, acquired_at: float):
+        held = time.perf_counter() - acquired_at
+        self._service_seconds = 0.9 * self._service_seconds + 0.1 * held
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        waits = sorted(self._wait_ms)
+
+        def percentile(q: float) -> float:
+            return waits[min(len(waits) - 1, int(len(waits) * q))] if waits else 0.0
+
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "wait_ms_p50": percentile(0.5),
+            "wait_ms_p99": percentile(0.99),
+            "wait_ms_max": waits[-1] if waits else 0.0,
+        }
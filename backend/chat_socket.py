@@ -0,0 +1,125 @@
+"""Building blocks of the WebSocket chat channel.
+
+Every connection writes through one ``SocketOutbox``: a small buffer of
+outgoing frames that a single sender task drains into the socket. While the
+client reads slower than the model writes, consecutive ``token`` frames are
+merged into one, so a slow reader costs one growing frame instead of a frame
+per token. An outbox that still grows past ``maxsize`` frames or
+``max_chars`` characters of token text overflows, and the connection is
+dropped rather than buffering without bound. When nothing has been sent for
+``heartbeat_interval`` seconds the sender emits a ``ping`` frame instead.
+
+``SocketHub`` caps the connections of one worker and keeps their counters.
+"""
+
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Optional
+
+
+class OutboxOverflow(Exception):
+    """The client is not reading its frames fast enough"""
+
+
+class SocketOutbox:
+    def __init__(self, maxsize: int = 64, max_chars: int = 1_000_000):
+        self.maxsize = maxsize
+        self.max_chars = max_chars
+        # Token frames are kept as lists of parts until they are sent
+        self._frames: deque = deque()
+        self._chars = 0
+        self._ready = asyncio.Event()
+        self.closed = False
+        self.overflowed = False
+        self.merged = 0
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def put(self, frame: dict):
+        """Queue a frame without waiting; raises OutboxOverflow when the client is too slow"""
+        if self.closed:
+            return
+        if frame["type"] == "token" and self._frames and isinstance(self._frames[-1], list):
+            self._frames[-1].append(frame["text"])
+            self.merged += 1
+        elif len(self._frames) >= self.maxsize:
+            self._overflow()
+        else:
+            self._frames.append([frame["text"]] if frame["type"] == "token" else frame)
+        if frame["type"] == "token":
+            self._chars += len(frame["text"])
+            if self._chars > self.max_chars:
+                self._overflow()
+        self._ready.set()
+
+    def _overflow(self):
+        self.overflowed = True
+        self.close()
+        self._frames.clear()
+        self._chars = 0
+        raise OutboxOverflow("Client is not reading fast enough")
+
+    def close(self):
+        """Stop accepting frames; the sender still drains what is queued"""
+        self.closed = True
+        self._ready.set()
+
+    async def frames(self, heartbeat_interval: Optional[float] = None) -> AsyncIterator[dict]:
+        """Yield the frames to send until the outbox is closed and drained.
+
+        Yields a ``ping`` frame whenever nothing was queued for ``heartbeat_interval`` seconds.
+        """
+        while True:
+            if self._frames:
+                frame = self._frames.popleft()
+                if isinstance(frame, list):
+                    text = "".join(frame)
+                    self._chars -= len(text)
+                    frame = {"type": "token", "text": text}
+                yield frame
+                continue
+            if self.closed:
+                return
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), heartbeat_interval)
+            except asyncio.TimeoutError:
+                yield {"type": "ping"}
+
+
+class SocketHub:
+    """Admits at most ``max_connections`` WebSocket connections per worker"""
+
+    def __init__(self, max_connections: int = 10000):
+        self.max_connections = max_connections
+        self.open = 0
+        self.opened = 0
+        self.rejected = 0
+        self.turns = 0
+        self.cancelled = 0
+        self.dropped_slow = 0
+        self.dropped_idle = 0
+
+    def admit(self) -> bool:
+        if self.open >= self.max_connections:
+            self.rejected += 1
+            return False
+        self.open += 1
+        self.opened += 1
+        return True
+
+    def leave(self):
+        self.open -= 1
+
+    def stats(self) -> dict:
+        return {
+            "open": self.open,
+            "max_connections": self.max_connections,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "turns": self.turns,
+            "cancelled": self.cancelled,
+            "dropped_slow": self.dropped_slow,
+            "dropped_idle": self.dropped_idle,
+        }
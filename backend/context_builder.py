@@ -0,0 +1,227 @@
+"""Token-budgeted prompt assembly with an incremental rolling summary.
+
+The prompt is a list of role-tagged messages: the rolling summary (as a
+``system`` message), the history not yet folded into it as ``user`` and
+``assistant`` turns, then the new user message. Each turn therefore repeats
+the previous request and appends to it, so a provider-side prompt cache can
+skip the shared prefix. Only when the unfolded history outgrows the window
+(``max_messages`` or the token budget) are its oldest messages folded into
+the summary, one line per message, down to half the window; the prefix
+changes at those compactions rather than on every turn. Folding only ever
+touches the newly folded messages; the stored summary is never rebuilt from
+scratch.
+
+``prompt_fingerprint`` digests a request message by message, so the part of
+a prompt shared with the session's previous request can be measured without
+keeping the previous request around.
+"""
+
+import hashlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+# Rough characters-per-token ratio for English text; exact counts are not
+# needed to keep prompt size predictable.
+CHARS_PER_TOKEN = 4
+
+# Each summary line keeps at most this many tokens of the original message
+SUMMARY_LINE_TOKENS = 60
+
+SUMMARY_HEADER = "Summary of earlier conversation:"
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+# Tokens the summary message costs beyond the summary itself
+SUMMARY_HEADER_TOKENS = estimate_tokens(SUMMARY_HEADER) + 2
+
+
+def clip_text(text: str, max_tokens: int) -> str:
+    """Truncate text to roughly ``max_tokens`` tokens"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + " [...]"
+
+
+def format_message(msg: dict) -> str:
+    role = "User" if msg['role'] == "user" else "Assistant"
+    return f"{role}: {msg['content']}"
+
+
+def fold_into_summary(summary: str, messages: List[dict], max_tokens: int) -> str:
+    """Append one condensed line per message, dropping the oldest lines over budget"""
+    lines = summary.splitlines() if summary else []
+    for msg in messages:
+        lines.append(clip_text(" ".join(format_message(msg).split()), SUMMARY_LINE_TOKENS))
+
+    total = sum(estimate_tokens(line) + 1 for line in lines)
+    while lines and total > max_tokens:
+        total -= estimate_tokens(lines.pop(0)) + 1
+    return "\n".join(lines)
+
+
+def message_tokens(msg: dict) -> int:
+    text = msg['content'] if msg['role'] == "system" else format_message(msg)
+    return estimate_tokens(text) + 1
+
+
+def flatten_messages(messages: List[dict]) -> str:
+    """The messages as one text: summary, previous conversation, then the new message"""
+    *earlier, last = messages
+    sections = [msg['content'] for msg in earlier if msg['role'] == "system"]
+    turns = [format_message(msg) for msg in earlier if msg['role'] != "system"]
+    if turns:
+        sections.append("Previous conversation:\n" + "\n".join(turns))
+    if not sections:
+        return last['content']
+    sections.append(format_message(last))
+    return "\n\n".join(sections)
+
+
+def prompt_fingerprint(messages: List[dict]) -> List[Tuple[str, int]]:
+    """Running digest and token count after each message of a request"""
+    digest = hashlib.sha256()
+    fingerprint = []
+    tokens = 0
+    for msg in messages:
+        digest.update(f"{msg['role']}:{len(msg['content'])}:{msg['content']}".encode())
+        tokens += message_tokens(msg)
+        fingerprint.append((digest.hexdigest()[:16], tokens))
+    return fingerprint
+
+
+def shared_prefix_tokens(previous: Optional[List[Tuple[str, int]]], current: List[Tuple[str, int]]) -> int:
+    """Tokens of the leading messages two fingerprinted requests have in common"""
+    tokens = 0
+    for (previous_digest, _), (digest, count) in zip(previous or [], current):
+        if digest != previous_digest:
+            break
+        tokens = count
+    return tokens
+
+
+@dataclass
+class ContextWindow:
+    # Role-tagged messages to send: summary, unfolded history, new message
+    messages: List[dict]
+    # The same messages flattened into one text (cache keys, single-message clients)
+    prompt: str
+    prompt_tokens: int
+    summary: str
+    summary_until: Optional[datetime]
+    # True when messages were folded this turn and the summary must be saved
+    summary_changed: bool = False
+    # True when the session had no earlier messages
+    first_turn: bool = False
+    fingerprint: List[Tuple[str, int]] = field(default_factory=list)
+    # Estimated tokens at the start of the prompt identical to the previous request
+    reused_tokens: int = 0
+    # Set once the prompt has been sent to the model
+    sent: bool = False
+
+
+def build_context(
+    history: List[dict],
+    message: str,
+    summary: str = "",
+    summary_until: Optional[datetime] = None,
+    max_messages: int = 10,
+    token_budget: int = 4000,
+    summary_budget: int = 500,
+    message_token_limit: int = 1000,
+    previous_fingerprint: Optional[List[Tuple[str, int]]] = None,
+) -> ContextWindow:
+    """Assemble the prompt for ``message`` from chronological ``history``.
+
+    ``summary_until`` is the timestamp of the newest message already folded
+    into ``summary``; older messages in ``history`` are never folded twice,
+    and all newer ones are sent verbatim until the next compaction. The
+    summary budget is always reserved so the prompt stays within
+    ``token_budget`` whatever the summary size. ``previous_fingerprint`` is
+    the fingerprint of the session's previous request, if known.
+    """
+    new_message = {"role": "user", "content": message}
+    remaining = token_budget - message_tokens(new_message)
+    if summary_budget > 0:
+        remaining -= summary_budget + SUMMARY_HEADER_TOKENS
+
+    unfolded = [
+        {"role": msg['role'], "content": clip_text(msg['content'], message_token_limit)}
+        for msg in history
+        if summary_until is None or msg['timestamp'] > summary_until
+    ]
+    costs = [message_tokens(msg) for msg in unfolded]
+    keep = len(unfolded)
+    if keep > max_messages or sum(costs) > remaining:
+        # Compact: fold the oldest messages until half the window is left,
+        # starting on a user turn and within the budget
+        keep = min(keep, max(max_messages, 0) // 2)
+        while keep and (sum(costs[len(costs) - keep:]) > remaining or unfolded[-keep]['role'] != "user"):
+            keep -= 1
+    kept = unfolded[len(unfolded) - keep:]
+
+    to_fold = [msg for msg in history[:len(history) - keep] if summary_until is None or msg['timestamp'] > summary_until]
+    # The new window start is saved even without a summary so the prefix stays put
+    summary_changed = bool(to_fold)
+    if summary_changed:
+        summary = fold_into_summary(summary, to_fold, summary_budget)
+        summary_until = to_fold[-1]['timestamp']
+
+    messages = []
+    if summary and summary_budget > 0:
+        messages.append({"role": "system", "content": f"{SUMMARY_HEADER}\n{summary}"})
+    messages += kept
+    messages.append(new_message)
+
+    fingerprint = prompt_fingerprint(messages)
+    return ContextWindow(
+        messages=messages,
+        prompt=flatten_messages(messages),
+        prompt_tokens=fingerprint[-1][1],
+        summary=summary,
+        summary_until=summary_until,
+        summary_changed=summary_changed,
+        first_turn=not history and not summary,
+        fingerprint=fingerprint,
+        reused_tokens=shared_prefix_tokens(previous_fingerprint, fingerprint),
+    )
+
+
+class PromptStats:
+    """Running totals of the prompts sent to the model.
+
+    ``reused_tokens`` are the estimated prompt tokens each request shares with
+    the previous request of its session; ``cached_input_tokens`` are the ones
+    the provider reported reading from its prompt cache, when it reports usage.
+    """
+
+    def __init__(self):
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.reused_tokens = 0
+        self.input_tokens = 0
+        self.cached_input_tokens = 0
+
+    def record(self, window: ContextWindow, usage: dict):
+        """Count a prompt sent to the model with the usage the provider reported"""
+        window.sent = True
+        self.turns += 1
+        self.prompt_tokens += window.prompt_tokens
+        self.reused_tokens += window.reused_tokens
+        self.input_tokens += usage.get('input_tokens') or 0
+        self.cached_input_tokens += usage.get('cached_input_tokens') or 0
+
+    def stats(self) -> dict:
+        return {
+            "turns": self.turns,
+            "prompt_tokens": self.prompt_tokens,
+            "reused_tokens": self.reused_tokens,
+            "reuse_ratio": round(self.reused_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            "input_tokens": self.input_tokens,
+            "cached_input_tokens": self.cached_input_tokens,
+            "cache_hit_ratio": round(self.cached_input_tokens / self.input_tokens, 3) if self.input_tokens else 0.0,
+        }
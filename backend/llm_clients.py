@@ -0,0 +1,273 @@
+"""LLM providers behind the chat endpoints.
+
+Every provider answers the role-tagged messages of a session (see
+``context_builder``), either in one piece (``complete``) or as a stream of
+chunks (``stream``), and adds its own system message in front. When a
+``usage`` dict is passed, the provider fills in the ``input_tokens`` and
+``cached_input_tokens`` it reports for the call:
+
+- ``EmergentLlmProvider``: the real model, called through litellm (or the
+  emergentintegrations SDK for Emergent universal keys without a proxy URL)
+- ``FakeLlmProvider``: a local stand-in with configurable time-to-first-token,
+  token rate, errors and streaming, and a simulated prompt prefix cache, for
+  benchmarks and offline runs
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional
+
+from context_builder import flatten_messages, prompt_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Emergent universal keys are only accepted by Emergent's proxy
+UNIVERSAL_KEY_PREFIX = "sk-emergent-"
+
+
+class LlmProvider:
+    """Interface of the LLM providers"""
+
+    name = "none"
+    model = "none"
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def check(self):
+        """Raise RuntimeError when the provider cannot serve requests"""
+
+    async def complete(self, session_id: str, messages: List[dict], usage: Optional[dict] = None) -> str:
+        raise NotImplementedError
+
+    async def stream(self, session_id: str, messages: List[dict], usage: Optional[dict] = None) -> AsyncIterator[str]:
+        """Yield the reply in chunks; providers without streaming yield it whole"""
+        yield await self.complete(session_id, messages, usage)
+
+
+def read_usage(reported, usage: Optional[dict]):
+    """Copy the token counts of a litellm ``Usage`` into ``usage``"""
+    if usage is None or reported is None:
+        return
+    usage['input_tokens'] = getattr(reported, "prompt_tokens", None) or 0
+    cached = getattr(reported, "cache_read_input_tokens", None)
+    if cached is None:
+        cached = getattr(getattr(reported, "prompt_tokens_details", None), "cached_tokens", None)
+    usage['cached_input_tokens'] = cached or 0
+
+
+class EmergentLlmProvider(LlmProvider):
+    """The real model, configured once at startup.
+
+    Calls go straight to ``litellm.acompletion`` with the configured key,
+    model and optional ``api_base``; ``stream`` passes ``stream=True`` and
+    relays the text deltas as the provider produces them. litellm keeps one
+    cached HTTP client per provider, so connections are reused across calls
+    without a pool of our own. The system message and the turns are sent as
+    separate messages with a cache breakpoint on the last one, so the next
+    turn of the session, which repeats this request, reads it from the
+    provider's prompt cache. Emergent universal keys only work through
+    Emergent's proxy, so without an ``api_base`` for it they go through the
+    emergentintegrations SDK instead, which takes one flattened message and
+    has no streaming call: ``stream`` then yields the whole reply at once.
+    """
+
+    name = "emergent"
+
+    def __init__(
+        self,
+        api_key: Optional[str],
+        provider: str,
+        model: str,
+        system_message: str,
+        api_base: Optional[str] = None,
+        timeout: float = 120.0,
+    ):
+        self.api_key = api_key
+        self.provider = provider
+        self.model = model
+        self.system_message = system_message
+        self.api_base = api_base
+        self.timeout = timeout
+
+    @property
+    def streams(self) -> bool:
+        """Whether calls go through litellm (and ``stream`` really streams)"""
+        return bool(self.api_base) or not (self.api_key or "").startswith(UNIVERSAL_KEY_PREFIX)
+
+    async def start(self):
+        if not self.streams:
+            logger.warning("Emergent universal key without LLM_API_BASE: streamed replies arrive in one piece")
+
+    def check(self):
+        if not self.api_key:
+            raise RuntimeError("API key not configured")
+
+    async def _sdk_complete(self, session_id: str, messages: List[dict]) -> str:
+        from emergentintegrations.llm.chat import LlmChat, UserMessage
+
+        chat_instance = LlmChat(
+            api_key=self.api_key,
+            session_id=session_id,
+            system_message=self.system_message
+        ).with_model(self.provider, self.model)
+        return await chat_instance.send_message(UserMessage(text=flatten_messages(messages)))
+
+    def _request_messages(self, messages: List[dict]) -> List[dict]:
+        *earlier, last = messages
+        return [
+            {"role": "system", "content": self.system_message},
+            *earlier,
+            {
+                "role": last['role'],
+                "content": [{"type": "text", "text": last['content'], "cache_control": {"type": "ephemeral"}}],
+            },
+        ]
+
+    async def _acompletion(self, messages: List[dict], stream: bool):
+        import litellm
+
+        return await litellm.acompletion(
+            model=f"{self.provider}/{self.model}",
+            messages=self._request_messages(messages),
+            api_key=self.api_key,
+            api_base=self.api_base,
+            timeout=self.timeout,
+            stream=stream,
+            **({"stream_options": {"include_usage": True}} if stream else {}),
+        )
+
+    async def complete(self, session_id: str, messages: List[dict], usage: Optional[dict] = None) -> str:
+        self.check()
+        if not self.streams:
+            return await self._sdk_complete(session_id, messages)
+        response = await self._acompletion(messages, stream=False)
+        read_usage(getattr(response, "usage", None), usage)
+        return response.choices[0].message.content or ""
+
+    async def stream(self, session_id: str, messages: List[dict], usage: Optional[dict] = None) -> AsyncIterator[str]:
+        self.check()
+        if not self.streams:
+            yield await self._sdk_complete(session_id, messages)
+            return
+        response = await self._acompletion(messages, stream=True)
+        async for chunk in response:
+            read_usage(getattr(chunk, "usage", None), usage)
+            text = chunk.choices[0].delta.content if chunk.choices else None
+            if text:
+                yield text
+
+
+class FakeLlmError(RuntimeError):
+    """Failure injected by the fake provider"""
+
+
+# Words the fake replies are made of
+FAKE_VOCABULARY = (
+    "the", "a", "model", "answer", "context", "session", "message", "token", "stream", "reply",
+    "is", "of", "and", "to", "in", "that", "with", "for", "as", "on",
+)
+
+
+class FakeLlmProvider(LlmProvider):
+    """Local stand-in for the model with realistic timing.
+
+    The reply is a deterministic function of the messages. The first token
+    arrives after ``ttft_ms``, plus ``prefill_ms_per_1k_tokens`` for every
+    thousand input tokens not found in its prompt cache, and the rest at
+    ``tokens_per_second``; all are spread by ``±jitter`` (a fraction). Like a
+    provider prompt cache, it remembers the last ``prefix_cache_size``
+    requests and reports the longest of them that starts the next request
+    as ``cached_input_tokens``. ``error_rate`` of the calls fail with
+    FakeLlmError, part way through the reply when streaming. With
+    ``streaming`` off, ``stream`` yields the whole reply at the end like a
+    non-streaming provider. ``seed`` makes timing and failures repeatable.
+    """
+
+    name = "fake"
+    model = "fake"
+
+    def __init__(
+        self,
+        ttft_ms: float = 300.0,
+        tokens_per_second: float = 50.0,
+        reply_tokens: int = 100,
+        jitter: float = 0.1,
+        error_rate: float = 0.0,
+        streaming: bool = True,
+        seed: Optional[int] = None,
+        prefill_ms_per_1k_tokens: float = 0.0,
+        prefix_cache_size: int = 10000,
+    ):
+        self.ttft = ttft_ms / 1000
+        self.prefill_per_token = prefill_ms_per_1k_tokens / 1_000_000
+        self.prefix_cache_size = prefix_cache_size
+        self._prefixes: OrderedDict = OrderedDict()
+        self.token_interval = 1 / tokens_per_second if tokens_per_second > 0 else 0.0
+        self.reply_tokens = max(1, reply_tokens)
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.streaming = streaming
+        self._random = random.Random(seed)
+
+    def _spread(self, seconds: float) -> float:
+        return max(0.0, seconds * (1 + self._random.uniform(-self.jitter, self.jitter)))
+
+    def _reply(self, messages: List[dict]) -> list:
+        words = random.Random(hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).digest())
+        return [
+            ("" if i == 0 else " ") + words.choice(FAKE_VOCABULARY)
+            for i in range(self.reply_tokens)
+        ]
+
+    def _failure_point(self) -> Optional[int]:
+        """Index of the token before which this call fails, or None"""
+        if self._random.random() >= self.error_rate:
+            return None
+        return self._random.randrange(self.reply_tokens)
+
+    def _read_prefix_cache(self, messages: List[dict]) -> tuple:
+        """``(input_tokens, cached_input_tokens)`` of a request, which is cached in turn"""
+        fingerprint = prompt_fingerprint(messages)
+        cached = 0
+        for digest, tokens in reversed(fingerprint):
+            if digest in self._prefixes:
+                self._prefixes.move_to_end(digest)
+                cached = tokens
+                break
+        if self.prefix_cache_size > 0:
+            self._prefixes[fingerprint[-1][0]] = True
+            self._prefixes.move_to_end(fingerprint[-1][0])
+            if len(self._prefixes) > self.prefix_cache_size:
+                self._prefixes.popitem(last=False)
+        return fingerprint[-1][1], cached
+
+    async def _tokens(self, messages: List[dict], usage: Optional[dict]) -> AsyncIterator[str]:
+        fail_at = self._failure_point()
+        input_tokens, cached = self._read_prefix_cache(messages)
+        if usage is not None:
+            usage.update(input_tokens=input_tokens, cached_input_tokens=cached)
+        await asyncio.sleep(self._spread(self.ttft + (input_tokens - cached) * self.prefill_per_token))
+        for i, token in enumerate(self._reply(messages)):
+            if i == fail_at:
+                raise FakeLlmError(f"Injected failure after {i} tokens")
+            if i > 0:
+                await asyncio.sleep(self._spread(self.token_interval))
+            yield token
+
+    async def complete(self, session_id: str, messages: List[dict], usage: Optional[dict] = None) -> str:
+        return "".join([token async for token in self._tokens(messages, usage)])
+
+    async def stream(self, session_id: str, messages: List[dict], usage: Optional[dict] = None) -> AsyncIterator[str]:
+        if not self.streaming:
+            yield await self.complete(session_id, messages, usage)
+            return
+        async for token in self._tokens(messages, usage):
+            yield token
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Convert ISO-string timestamps written by older versions of the backend into
+native BSON dates.
+
+Safe to run repeatedly and while the server is up: only fields still stored
+as strings are touched, in batches, so memory stays constant however many
+documents there are. Run it once after upgrading, from the backend directory:
+
+    python migrate_timestamps.py
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+# Collection -> timestamp fields that used to be written with isoformat()
+TIMESTAMP_FIELDS = {
+    "status_checks": ["timestamp"],
+    "chat_sessions": ["created_at", "updated_at", "summary_until"],
+    "chat_messages": ["timestamp"],
+}
+
+BATCH_SIZE = 1000
+
+
+async def migrate_field(collection, field: str, batch_size: int = BATCH_SIZE) -> int:
+    """Rewrite every string value of ``field`` as a date; returns the number converted"""
+    converted = 0
+    batch = []
+    cursor = collection.find({field: {"$type": "string"}}, {"_id": 1, field: 1}).batch_size(batch_size)
+    async for doc in cursor:
+        batch.append(UpdateOne(
+            {"_id": doc['_id'], field: doc[field]},
+            {"$set": {field: datetime.fromisoformat(doc[field])}}
+        ))
+        if len(batch) >= batch_size:
+            converted += (await collection.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        converted += (await collection.bulk_write(batch, ordered=False)).modified_count
+    return converted
+
+
+async def migrate_timestamps(db, batch_size: int = BATCH_SIZE) -> dict:
+    results = {}
+    for collection_name, fields in TIMESTAMP_FIELDS.items():
+        for field in fields:
+            converted = await migrate_field(db[collection_name], field, batch_size)
+            results[f"{collection_name}.{field}"] = converted
+            logger.info(f"Converted {converted} {collection_name}.{field} values to dates")
+    return results
+
+
+async def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True)
+    try:
+        await migrate_timestamps(client[os.environ['DB_NAME']])
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
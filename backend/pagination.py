@@ -0,0 +1,99 @@
+"""Keyset (cursor) pagination helpers.
+
+A cursor is an opaque, URL-safe token holding the sort key and the unique
+tie-breaker of the last item on a page. The next page is then a range scan
+starting right after that item, so page cost does not depend on how deep
+the client has paged.
+"""
+
+import base64
+import json
+import math
+from datetime import datetime
+from typing import Any, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+
+
+def _encode(payload: dict) -> str:
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(cursor: str, kind: str) -> Tuple[Any, str]:
+    """Return the raw ``(v, id)`` of a cursor of the given kind with a string tie-breaker"""
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    payload = json.loads(raw)
+    sort_value, tie_breaker = payload["v"], payload["id"]
+    if payload.get("t") != kind or not isinstance(tie_breaker, str):
+        raise ValueError("unexpected cursor fields")
+    return sort_value, tie_breaker
+
+
+def encode_cursor(sort_value: datetime, tie_breaker: str) -> str:
+    return _encode({"v": sort_value.isoformat(), "t": "datetime", "id": tie_breaker})
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Return ``(sort_value, tie_breaker)``; raises ValueError on malformed cursors.
+
+    Only cursors written by ``encode_cursor`` are accepted: a timezone-aware
+    datetime sort value and a string tie-breaker. Anything else would reach
+    the storage query as an arbitrary JSON value (on Mongo, possibly an
+    operator document).
+    """
+    try:
+        sort_value, tie_breaker = _decode(cursor, "datetime")
+        if not isinstance(sort_value, str):
+            raise ValueError("cursor timestamp is not a string")
+        sort_value = datetime.fromisoformat(sort_value)
+        if sort_value.tzinfo is None:
+            raise ValueError("cursor timestamp has no timezone")
+        return sort_value, tie_breaker
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def encode_score_cursor(score: float, tie_breaker: str) -> str:
+    """Cursor of a ranked listing (search hits), ordered by score then id"""
+    return _encode({"v": score, "t": "score", "id": tie_breaker})
+
+
+def decode_score_cursor(cursor: str) -> Tuple[float, str]:
+    """Return ``(score, tie_breaker)``; raises ValueError unless the score is a finite number"""
+    try:
+        score, tie_breaker = _decode(cursor, "score")
+        if isinstance(score, bool) or not isinstance(score, (int, float)) or not math.isfinite(score):
+            raise ValueError("cursor score is not a number")
+        return float(score), tie_breaker
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_query(
+    base_filter: dict,
+    sort_field: str,
+    id_field: str,
+    cursor: Tuple[Any, str],
+    older: bool,
+) -> Tuple[dict, List[Tuple[str, int]]]:
+    """Build the filter and sort for items strictly before/after a decoded cursor.
+
+    ``older`` pages scan descending from the cursor, newer pages ascending;
+    callers reverse the results when that differs from the listing order.
+    """
+    sort_value, tie_breaker = cursor
+    op = "$lt" if older else "$gt"
+    query = {
+        **base_filter,
+        "$or": [
+            {sort_field: {op: sort_value}},
+            {sort_field: sort_value, id_field: {op: tie_breaker}},
+        ],
+    }
+    return query, listing_sort(sort_field, id_field, descending=older)
+
+
+def listing_sort(sort_field: str, id_field: str, descending: bool) -> List[Tuple[str, int]]:
+    direction = DESCENDING if descending else ASCENDING
+    return [(sort_field, direction), (id_field, direction)]
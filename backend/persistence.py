@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """Bounded queue of pending writes flushed in batches by a background task.
+
+    ``flush`` receives a list of queued items and must persist all of them.
+    A failed batch is retried once before it is logged and dropped. ``close``
+    stops accepting new items and waits until everything queued is flushed.
+    """
+
+    def __init__(self, flush: Callable[[List], Awaitable[None]], maxsize: int = 1000, batch_size: int = 100):
+        self._flush = flush
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self._worker: Optional[asyncio.Task] = None
+        self._closing = False
+        self.flushed = 0
+        self.dropped = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    def submit(self, item) -> bool:
+        """Queue an item; returns False when the queue is full or closing"""
+        if self._closing or self._worker is None:
+            return False
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _write(self, batch: List):
+        for attempt in (1, 2):
+            try:
+                await self._flush(batch)
+                self.flushed += len(batch)
+                return
+            except Exception as e:
+                logger.error(f"Write-behind flush of {len(batch)} items failed (attempt {attempt}): {str(e)}")
+        self.dropped += len(batch)
+
+    async def close(self):
+        """Flush everything still queued, then stop the worker"""
+        self._closing = True
+        if self._worker is None:
+            return
+        await self._queue.join()
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "maxsize": self._queue.maxsize,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+        }
+
+
+class GroupCommitWriter:
+    """Coalesces concurrent writes into shared bulk flushes.
+
+    ``write`` returns once the item is persisted. While one flush runs, items
+    from other callers accumulate and go out together in the next one (up to
+    ``batch_size`` per flush), so N concurrent writers cost far fewer than N
+    round trips. A failed flush fails every write in it.
+    """
+
+    def __init__(self, flush: Callable[[List], Awaitable[None]], batch_size: int = 100):
+        self._flush = flush
+        self.batch_size = batch_size
+        self._pending: List = []
+        self._flusher: Optional[asyncio.Task] = None
+        self.flushes = 0
+
+    async def write(self, item):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+        # The flush runs in its own task so a cancelled writer cannot strand the others
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run())
+        await future
+
+    async def _run(self):
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            await self._write(batch)
+
+    async def _write(self, batch: List):
+        try:
+            await self._flush([item for item, _ in batch])
+            self.flushes += 1
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
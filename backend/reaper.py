@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from storage import ChatStorage
+
+logger = logging.getLogger(__name__)
+
+
+class SessionReaper:
+    """Background purge of soft-deleted sessions.
+
+    Every ``interval`` seconds the reaper picks up to ``sessions_per_run``
+    deleted sessions and removes their messages ``batch_size`` at a time,
+    sleeping ``batch_delay`` seconds between batches so a big session never
+    turns into one long, heavy delete. A session document is removed once
+    its messages are gone. With ``session_ttl`` set, sessions idle for longer
+    than that many seconds are marked deleted first, which expires them.
+    """
+
+    def __init__(
+        self,
+        storage: ChatStorage,
+        interval: float = 30.0,
+        batch_size: int = 500,
+        batch_delay: float = 0.1,
+        sessions_per_run: int = 100,
+        session_ttl: Optional[float] = None,
+    ):
+        self.storage = storage
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.sessions_per_run = sessions_per_run
+        self.session_ttl = session_ttl
+        self._worker: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.sessions_expired = 0
+        self.sessions_purged = 0
+        self.messages_purged = 0
+        self.errors = 0
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Session reaper run failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self):
+        """Expire idle sessions (when a TTL is set) and purge deleted ones"""
+        self.runs += 1
+        if self.session_ttl:
+            now = datetime.now(timezone.utc)
+            self.sessions_expired += await self.storage.expire_sessions(
+                now - timedelta(seconds=self.session_ttl), now
+            )
+        for session_id in await self.storage.deleted_sessions(self.sessions_per_run):
+            while True:
+                purged = await self.storage.purge_messages(session_id, self.batch_size)
+                self.messages_purged += purged
+                if purged < self.batch_size:
+                    break
+                await asyncio.sleep(self.batch_delay)
+            await self.storage.purge_session(session_id)
+            self.sessions_purged += 1
+
+    async def close(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "sessions_expired": self.sessions_expired,
+            "sessions_purged": self.sessions_purged,
+            "messages_purged": self.messages_purged,
+            "errors": self.errors,
+        }
@@ -0,0 +1,107 @@
+"""Optional cache of LLM responses for repeated prompts.
+
+Entries are keyed by a hash of everything that determines the model's
+answer: model, system message, assembled context and the user message. Two
+backends share the same interface: an in-process LRU (per worker) and a
+MongoDB collection whose TTL index expires old entries (shared by workers).
+"""
+
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pymongo import ASCENDING, IndexModel
+
+from cache import TTLCache
+
+
+def response_cache_key(model: str, system_message: str, context: str, message: str) -> str:
+    payload = json.dumps([model, system_message, context, message], separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Interface of the response cache backends"""
+
+    backend = "none"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[str]:
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, response: str):
+        pass
+
+    async def ensure_indexes(self):
+        pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class MemoryResponseCache(ResponseCache):
+    backend = "memory"
+
+    def __init__(self, maxsize: int, ttl: float):
+        super().__init__()
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, key: str) -> Optional[str]:
+        response = self._cache.get(key)
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    async def set(self, key: str, response: str):
+        self._cache.set(key, response)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "size": len(self._cache), "maxsize": self._cache.maxsize}
+
+
+class MongoResponseCache(ResponseCache):
+    backend = "mongo"
+
+    def __init__(self, collection, ttl: float):
+        super().__init__()
+        self.collection = collection
+        self.ttl = ttl
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes([
+            IndexModel([("key", ASCENDING)], name="key_unique", unique=True),
+            IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=int(self.ttl)),
+        ])
+
+    async def get(self, key: str) -> Optional[str]:
+        # The TTL monitor only runs about once a minute, so filter out stale entries too
+        fresh_after = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        doc = await self.collection.find_one(
+            {"key": key, "created_at": {"$gt": fresh_after}},
+            {"_id": 0, "response": 1}
+        )
+        if doc is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return doc['response']
+
+    async def set(self, key: str, response: str):
+        await self.collection.update_one(
+            {"key": key},
+            {"$set": {"response": response, "created_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
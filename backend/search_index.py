@@ -0,0 +1,93 @@
+"""Full-text search helpers shared by the storage backends.
+
+``InvertedIndex`` is the in-process index of the memory backend: postings
+map each term to the messages containing it, so saving or purging a message
+only touches its own terms and a query only reads the postings of its
+terms. Hits are ranked with BM25. MongoDB uses a text index and SQLite an
+FTS5 table instead; all three take the words produced by ``query_terms``.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, List
+
+WORD = re.compile(r"\w+")
+
+# Distinct words of a query that are searched; the rest are ignored
+MAX_QUERY_TERMS = 16
+
+
+def tokenize(text: str) -> List[str]:
+    return WORD.findall(text.lower())
+
+
+def query_terms(query: str) -> List[str]:
+    """The distinct words of a search query, in order"""
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+def snippet(text: str, terms: List[str], width: int = 160) -> str:
+    """About ``width`` characters of ``text`` around the first word starting with a query term"""
+    if len(text) <= width:
+        return text
+    match = re.search(r"\b(?:" + "|".join(map(re.escape, terms)) + ")", text, re.IGNORECASE) if terms else None
+    start = max(0, (match.start() if match else 0) - width // 4)
+    if start:
+        # Start on a word boundary
+        space = text.find(" ", start)
+        if 0 <= space < start + width // 4:
+            start = space + 1
+    end = min(len(text), start + width)
+    return ("…" if start else "") + text[start:end] + ("…" if end < len(text) else "")
+
+
+class InvertedIndex:
+    """Incremental BM25 index of documents keyed by id"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, doc_id: str, text: str):
+        words = tokenize(text)
+        for term, count in Counter(words).items():
+            self._postings.setdefault(term, {})[doc_id] = count
+        self._lengths[doc_id] = len(words)
+        self._total_length += len(words)
+
+    def remove(self, doc_id: str, text: str):
+        """Drop a document; ``text`` must be what it was added with"""
+        length = self._lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in set(tokenize(text)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def scores(self, terms: List[str]) -> Dict[str, float]:
+        """BM25 score of every document containing at least one of ``terms``"""
+        if not self._lengths:
+            return {}
+        total = len(self._lengths)
+        average_length = self._total_length / total or 1.0
+        scores: Dict[str, float] = {}
+        for term in dict.fromkeys(terms):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, count in postings.items():
+                norm = count + self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * count * (self.k1 + 1) / norm
+        return scores
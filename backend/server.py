@@ -1,23 +1,192 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, WebSocket
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import json
+import orjson
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
 import uuid
-from datetime import datetime, timezone
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from datetime import datetime, timedelta, timezone
+from cache import TTLCache
+from context_builder import ContextWindow, PromptStats, build_context
+from pagination import decode_cursor, decode_score_cursor, encode_cursor, encode_score_cursor
+from persistence import GroupCommitWriter, WriteBehindQueue
+from titles import DEFAULT_TITLE, TitleGenerator
+from reaper import SessionReaper
+from search_index import query_terms, snippet
+from llm_clients import EmergentLlmProvider, FakeLlmProvider, LlmProvider
+from response_cache import MemoryResponseCache, MongoResponseCache, ResponseCache, response_cache_key
+from turn_scheduler import MongoSessionLease, SessionTurnScheduler, TurnRejected
+from admission import AdmissionController, AdmissionRejected
+from chat_socket import OutboxOverflow, SocketHub, SocketOutbox
+from metrics import SIZE_BUCKETS, MetricsMiddleware, MetricsRegistry, timed_stage
+from storage import ChatStorage, MemoryChatStorage, MongoChatStorage, SqliteChatStorage
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Chat storage: "mongo" (default), "sqlite" (embedded, single node) or "memory"
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo').lower()
+if STORAGE_BACKEND == "memory":
+    storage: ChatStorage = MemoryChatStorage()
+elif STORAGE_BACKEND == "sqlite":
+    storage = SqliteChatStorage(os.environ.get('SQLITE_PATH', str(ROOT_DIR / 'chat.db')))
+else:
+    storage = MongoChatStorage(os.environ['MONGO_URL'], os.environ['DB_NAME'])
+
+def mongo_collection(name: str):
+    """Collection for the features that only exist on MongoDB"""
+    if not isinstance(storage, MongoChatStorage):
+        raise RuntimeError(f"{name} needs STORAGE_BACKEND=mongo")
+    return storage.db[name]
+
+# LLM configuration
+SYSTEM_MESSAGE = "You are a helpful AI assistant. Provide clear, concise, and friendly responses. Remember the conversation context and refer to previous messages when relevant."
+LLM_PROVIDER = "anthropic"
+LLM_MODEL = "claude-sonnet-4-5-20250929"
+
+# LLM backend: "emergent" (the real model) or "fake" (local stand-in with
+# simulated timing, for benchmarks and offline runs). Opened at startup.
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'emergent').lower()
+if LLM_BACKEND == "fake":
+    seed = os.environ.get('FAKE_LLM_SEED')
+    llm_provider: LlmProvider = FakeLlmProvider(
+        ttft_ms=float(os.environ.get('FAKE_LLM_TTFT_MS', '300')),
+        tokens_per_second=float(os.environ.get('FAKE_LLM_TOKENS_PER_SECOND', '50')),
+        reply_tokens=int(os.environ.get('FAKE_LLM_REPLY_TOKENS', '100')),
+        jitter=float(os.environ.get('FAKE_LLM_JITTER', '0.1')),
+        error_rate=float(os.environ.get('FAKE_LLM_ERROR_RATE', '0')),
+        streaming=os.environ.get('FAKE_LLM_STREAMING', 'true').lower() == 'true',
+        seed=int(seed) if seed else None,
+        prefill_ms_per_1k_tokens=float(os.environ.get('FAKE_LLM_PREFILL_MS_PER_1K_TOKENS', '0')),
+        prefix_cache_size=int(os.environ.get('FAKE_LLM_PREFIX_CACHE_SIZE', '10000'))
+    )
+else:
+    llm_provider = EmergentLlmProvider(
+        api_key=os.environ.get('EMERGENT_LLM_KEY'),
+        provider=LLM_PROVIDER,
+        model=LLM_MODEL,
+        system_message=SYSTEM_MESSAGE,
+        api_base=os.environ.get('LLM_API_BASE') or None,
+        timeout=float(os.environ.get('LLM_HTTP_TIMEOUT', '120'))
+    )
+
+# Context assembly: at most CHAT_CONTEXT_MESSAGES recent messages are sent
+# verbatim as role-tagged turns, the whole prompt is kept within
+# CONTEXT_TOKEN_BUDGET tokens, and older messages are folded into a
+# per-session summary of SUMMARY_TOKEN_BUDGET. Folding happens in steps (down
+# to half the window) so consecutive prompts share their prefix in between.
+CHAT_CONTEXT_MESSAGES = int(os.environ.get('CHAT_CONTEXT_MESSAGES', '10'))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', '4000'))
+SUMMARY_TOKEN_BUDGET = int(os.environ.get('SUMMARY_TOKEN_BUDGET', '500'))
+MESSAGE_TOKEN_LIMIT = int(os.environ.get('MESSAGE_TOKEN_LIMIT', '1000'))
+
+# Messages fetched per turn. At most the verbatim window is left unfolded and
+# a turn adds two messages, so reading two beyond it guarantees every message
+# is folded into the summary before it slides out of the fetched range.
+HISTORY_FETCH_LIMIT = CHAT_CONTEXT_MESSAGES + 2
+
+# Write-through cache of each session's context (recent messages and summary), keyed by session_id
+history_cache = TTLCache(
+    maxsize=int(os.environ.get('HISTORY_CACHE_SIZE', '1024')),
+    ttl=float(os.environ.get('HISTORY_CACHE_TTL', '900'))
+)
+
+# Turn persistence: "sync" writes before responding, "write_behind" responds
+# first and flushes turns from a bounded background queue. A full queue falls
+# back to a synchronous write.
+PERSIST_MODE = os.environ.get('PERSIST_MODE', 'sync').lower()
+PERSIST_QUEUE_SIZE = int(os.environ.get('PERSIST_QUEUE_SIZE', '1000'))
+PERSIST_BATCH_SIZE = int(os.environ.get('PERSIST_BATCH_SIZE', '100'))
+
+# Optional cache of LLM responses for repeated prompts: "off", "memory" or "mongo"
+RESPONSE_CACHE = os.environ.get('RESPONSE_CACHE', 'off').lower()
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '86400'))
+if RESPONSE_CACHE == "memory":
+    response_cache = MemoryResponseCache(
+        maxsize=int(os.environ.get('RESPONSE_CACHE_SIZE', '1024')),
+        ttl=RESPONSE_CACHE_TTL
+    )
+elif RESPONSE_CACHE == "mongo":
+    response_cache = MongoResponseCache(mongo_collection("llm_response_cache"), ttl=RESPONSE_CACHE_TTL)
+else:
+    response_cache = ResponseCache()
+
+# Session titles from the first exchange: "heuristic", "llm" (short model call)
+# or "off". Generated by a background worker from a bounded queue; a full
+# queue skips the title rather than delaying the turn.
+TITLE_MODE = os.environ.get('TITLE_MODE', 'heuristic').lower()
+TITLE_QUEUE_SIZE = int(os.environ.get('TITLE_QUEUE_SIZE', '1000'))
+TITLE_BATCH_SIZE = int(os.environ.get('TITLE_BATCH_SIZE', '20'))
+TITLE_MAX_CHARS = int(os.environ.get('TITLE_MAX_CHARS', '40'))
+
+# Deleted sessions are hidden at once and purged by a background reaper in
+# rate-limited batches. SESSION_TTL_DAYS > 0 also expires idle sessions.
+session_ttl_days = float(os.environ.get('SESSION_TTL_DAYS', '0'))
+session_reaper = SessionReaper(
+    storage,
+    interval=float(os.environ.get('REAPER_INTERVAL', '30')),
+    batch_size=int(os.environ.get('REAPER_BATCH_SIZE', '500')),
+    batch_delay=float(os.environ.get('REAPER_BATCH_DELAY', '0.1')),
+    sessions_per_run=int(os.environ.get('REAPER_SESSIONS_PER_RUN', '100')),
+    session_ttl=session_ttl_days * 86400 if session_ttl_days > 0 else None
+)
+
+# Concurrent turns for one session: "queue", "reject" (409) or "merge" duplicates.
+# TURN_LOCK_BACKEND=mongo adds a lease so turns are also serialized across workers.
+turn_scheduler = SessionTurnScheduler(
+    policy=os.environ.get('TURN_POLICY', 'queue').lower(),
+    lease=MongoSessionLease(
+        mongo_collection("chat_session_leases"),
+        ttl=float(os.environ.get('TURN_LEASE_TTL', '180'))
+    ) if os.environ.get('TURN_LOCK_BACKEND', 'local').lower() == "mongo" else None,
+    wait_timeout=float(os.environ.get('TURN_WAIT_TIMEOUT', '120'))
+)
+
+# With the cross-worker lease a session's turns can move between workers, so
+# a cached context is checked against the session's updated_at once the turn
+# holds the lease, and reloaded when another worker has answered since
+REVALIDATE_CONTEXT = turn_scheduler.lease is not None
+
+# Bounded concurrency and wait queue for upstream LLM calls
+llm_admission = AdmissionController(
+    max_concurrency=int(os.environ.get('LLM_MAX_CONCURRENCY', '32')),
+    max_queue=int(os.environ.get('LLM_MAX_QUEUE', '128')),
+    queue_timeout=float(os.environ.get('LLM_QUEUE_TIMEOUT', '30'))
+)
+
+# Prompt sizes and prefix reuse of the turns sent to the model
+prompt_stats = PromptStats()
+
+# Prometheus metrics, served at /metrics
+metrics = MetricsRegistry()
+stage_seconds = metrics.histogram(
+    "chat_stage_duration_seconds",
+    "Duration of each chat turn stage (history, queue, llm, persist)",
+    ("stage",)
+)
+prompt_chars = metrics.histogram(
+    "chat_prompt_chars", "Size of the prompt sent to the model in characters",
+    buckets=tuple(size * 4 for size in SIZE_BUCKETS)
+)
+prompt_tokens = metrics.histogram(
+    "chat_prompt_tokens", "Estimated size of the prompt sent to the model in tokens",
+    buckets=SIZE_BUCKETS
+)
+prompt_reuse = metrics.histogram(
+    "chat_prompt_reuse_ratio", "Share of the prompt repeated from the session's previous request",
+    buckets=(0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 1.0)
+)
+chat_errors = metrics.counter("chat_errors_total", "Failed chat turns by error type", ("type",))
+requests_in_flight = metrics.gauge("http_requests_in_flight", "HTTP requests currently being served")
+requests_in_flight.set(0)
+request_seconds = metrics.histogram("http_request_duration_seconds", "HTTP request duration", ("method",))
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -25,13 +194,18 @@ app = FastAPI()
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+def utc_now() -> datetime:
+    """Current UTC time truncated to the millisecond precision of BSON dates"""
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
 # Define Models
 class StatusCheck(BaseModel):
     model_config = ConfigDict(extra="ignore")
     
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     client_name: str
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    timestamp: datetime = Field(default_factory=utc_now)
 
 class StatusCheckCreate(BaseModel):
     client_name: str
@@ -43,25 +217,34 @@ class ChatMessage(BaseModel):
     session_id: str
     role: str  # 'user' or 'assistant'
     content: str
-    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    timestamp: datetime = Field(default_factory=utc_now)
 
 class ChatSession(BaseModel):
     model_config = ConfigDict(extra="ignore")
     
     session_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    title: str = "New Chat"
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    title: str = DEFAULT_TITLE
+    created_at: datetime = Field(default_factory=utc_now)
+    updated_at: datetime = Field(default_factory=utc_now)
 
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
+    use_cache: bool = True  # set to false to bypass the response cache
+
+class TurnUsage(BaseModel):
+    prompt_tokens: int  # estimated
+    reused_tokens: int  # estimated prompt tokens repeated from the session's previous request
+    input_tokens: Optional[int] = None  # as reported by the provider
+    cached_input_tokens: Optional[int] = None  # read from the provider's prompt cache
 
 class ChatResponse(BaseModel):
     session_id: str
     user_message: str
     assistant_message: str
     timestamp: datetime
+    cached: bool = False
+    usage: Optional[TurnUsage] = None  # None when answered from the response cache
 
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
@@ -73,24 +256,16 @@ async def create_status_check(input: StatusCheckCreate):
     status_dict = input.model_dump()
     status_obj = StatusCheck(**status_dict)
     
-    # Convert to dict and serialize datetime to ISO string for MongoDB
     doc = status_obj.model_dump()
-    doc['timestamp'] = doc['timestamp'].isoformat()
-    
-    _ = await db.status_checks.insert_one(doc)
+    await storage.add_status_check(doc)
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
 async def get_status_checks():
-    # Exclude MongoDB's _id field from the query results
-    status_checks = await db.status_checks.find({}, {"_id": 0}).to_list(1000)
+    status_checks = await storage.list_status_checks(1000)
     
-    # Convert ISO string timestamps back to datetime objects
-    for check in status_checks:
-        if isinstance(check['timestamp'], str):
-            check['timestamp'] = datetime.fromisoformat(check['timestamp'])
-    
-    return status_checks
+    # Documents already match the model; serialize them directly
+    return ORJSONResponse(status_checks)
 
 # Chat endpoints
 @api_router.post("/chat/sessions", response_model=ChatSession)
@@ -98,132 +273,1022 @@ async def create_chat_session():
     """Create a new chat session"""
     session = ChatSession()
     doc = session.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['updated_at'] = doc['updated_at'].isoformat()
-    
-    await db.chat_sessions.insert_one(doc)
+    await storage.create_session(doc)
+    history_cache.set(session.session_id, empty_session_context(session.updated_at))
     return session
 
-@api_router.get("/chat/sessions", response_model=List[ChatSession])
-async def get_chat_sessions():
-    """Get all chat sessions"""
-    sessions = await db.chat_sessions.find({}, {"_id": 0}).sort("updated_at", -1).to_list(1000)
+# Page size bounds for the listing endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+async def fetch_page(
+    list_page: Callable[..., Awaitable[List[dict]]],
+    sort_field: str,
+    id_field: str,
+    descending: bool,
+    limit: int,
+    before: Optional[str],
+    after: Optional[str],
+) -> ORJSONResponse:
+    """Fetch one keyset page, with ``X-Next-Cursor`` set when more items follow.
+    
+    ``list_page(limit, cursor, descending)`` is the storage listing call.
+    Without a cursor the listing starts at its natural beginning and the next
+    cursor continues in listing order. With ``before``/``after`` the page holds
+    the items just before/after the cursor and the next cursor keeps going
+    the same way; pages are always returned in listing order. Documents
+    already match the response models and are serialized without re-validation.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Pass either before or after, not both")
     
-    for session in sessions:
-        if isinstance(session['created_at'], str):
-            session['created_at'] = datetime.fromisoformat(session['created_at'])
-        if isinstance(session['updated_at'], str):
-            session['updated_at'] = datetime.fromisoformat(session['updated_at'])
+    cursor = before or after
+    if cursor:
+        older = bool(before)
+        try:
+            cursor = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        older = descending
+        cursor = None
     
-    return sessions
+    # Read one extra document to learn whether another page exists
+    docs = await list_page(limit + 1, cursor, older)
+    headers = {}
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last[sort_field], last[id_field])
+    if older != descending:
+        docs.reverse()
+    return ORJSONResponse(docs, headers=headers)
+
+@api_router.get("/chat/sessions", response_model=List[ChatSession])
+async def get_chat_sessions(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+):
+    """Get chat sessions, most recently updated first.
+    
+    Pass the ``X-Next-Cursor`` response header as ``before`` to get the next
+    (older) page, or a cursor as ``after`` to get sessions updated since.
+    """
+    return await fetch_page(
+        storage.list_sessions, "updated_at", "session_id",
+        descending=True, limit=limit, before=before, after=after
+    )
 
 @api_router.get("/chat/sessions/{session_id}/messages", response_model=List[ChatMessage])
-async def get_chat_messages(session_id: str):
-    """Get all messages for a session"""
-    messages = await db.chat_messages.find(
-        {"session_id": session_id},
-        {"_id": 0}
-    ).sort("timestamp", 1).to_list(1000)
+async def get_chat_messages(
+    session_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+):
+    """Get messages for a session, oldest first.
+    
+    Pass the ``X-Next-Cursor`` response header as ``after`` to get the next
+    (newer) page, or a cursor as ``before`` to page back towards the start.
+    """
+    await require_session(session_id)
+    return await fetch_page(
+        lambda *args: storage.list_messages(session_id, *args), "timestamp", "id",
+        descending=False, limit=limit, before=before, after=after
+    )
+
+class SearchHit(BaseModel):
+    session_id: str
+    title: str
+    message_id: str
+    role: str
+    timestamp: datetime
+    score: float
+    snippet: str
+
+# Page size bounds and snippet length of message search
+DEFAULT_SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+SEARCH_SNIPPET_CHARS = int(os.environ.get('SEARCH_SNIPPET_CHARS', '160'))
+
+@api_router.get("/chat/search", response_model=List[SearchHit])
+async def search_chat_messages(
+    q: str = Query(..., min_length=1, max_length=1000),
+    limit: int = Query(DEFAULT_SEARCH_PAGE_SIZE, ge=1, le=MAX_SEARCH_PAGE_SIZE),
+    after: Optional[str] = None,
+):
+    """Search the messages of all sessions for any word of ``q``, best match first.
     
-    for msg in messages:
-        if isinstance(msg['timestamp'], str):
-            msg['timestamp'] = datetime.fromisoformat(msg['timestamp'])
+    Pass the ``X-Next-Cursor`` response header as ``after`` to get the next page.
+    """
+    terms = query_terms(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="Search query has no words")
+    cursor = None
+    if after:
+        try:
+            cursor = decode_score_cursor(after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
-    return messages
+    # Read one extra hit to learn whether another page exists
+    docs = await storage.search_messages(terms, limit + 1, cursor)
+    headers = {}
+    if len(docs) > limit:
+        docs = docs[:limit]
+        headers["X-Next-Cursor"] = encode_score_cursor(docs[-1]['score'], docs[-1]['id'])
+    hits = [
+        {
+            "session_id": doc['session_id'],
+            "title": doc['title'],
+            "message_id": doc['id'],
+            "role": doc['role'],
+            "timestamp": doc['timestamp'],
+            "score": doc['score'],
+            "snippet": snippet(doc['content'], terms, SEARCH_SNIPPET_CHARS),
+        }
+        for doc in docs
+    ]
+    return ORJSONResponse(hits, headers=headers)
+
+async def require_session(session_id: str):
+    """Fail with 404 unless the session exists and has not been deleted.
+
+    A cached context proves the session is live: deleting a session evicts it.
+    Deletes on other workers do not, so with the cross-worker lease the
+    session is always read.
+    """
+    if not REVALIDATE_CONTEXT and history_cache.peek(session_id) is not None:
+        return
+    session = await storage.get_session(session_id)
+    if session is None or 'deleted_at' in session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+async def get_or_create_session(session_id: Optional[str]) -> str:
+    """Return the given (live) session id, creating a new session when none is given"""
+    if session_id:
+        await require_session(session_id)
+        return session_id
+    
+    session = ChatSession()
+    session_doc = session.model_dump()
+    await storage.create_session(session_doc)
+    history_cache.set(session.session_id, empty_session_context(session.updated_at))
+    return session.session_id
+
+def parse_timestamp(value):
+    """Accept legacy ISO-string timestamps written before dates were stored natively"""
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+def empty_session_context(updated_at: Optional[datetime] = None) -> dict:
+    return {"messages": [], "summary": "", "summary_until": None, "updated_at": updated_at}
+
+async def revalidate_context(session_id: str, cached: dict) -> Optional[dict]:
+    """The cached context, or None when another worker has answered the session since.
+    
+    Raises 404 when the session was deleted elsewhere. A context ahead of
+    storage (turns still queued for write-behind) stays valid.
+    """
+    session_doc = await storage.get_session(session_id)
+    if session_doc is None or 'deleted_at' in session_doc:
+        history_cache.pop(session_id)
+        raise HTTPException(status_code=404, detail="Session not found")
+    stored = parse_timestamp(session_doc.get('updated_at'))
+    if cached.get('updated_at') is None or (stored is not None and stored > cached['updated_at']):
+        history_cache.pop(session_id)
+        return None
+    return cached
+
+async def load_session_context(session_id: str) -> dict:
+    """Load the session's recent messages (chronological) and rolling summary"""
+    cached = history_cache.get(session_id)
+    if cached is not None and REVALIDATE_CONTEXT:
+        cached = await revalidate_context(session_id, cached)
+    if cached is not None:
+        return {**cached, "messages": list(cached['messages'])}
+    
+    history_messages, session_doc = await asyncio.gather(
+        storage.recent_messages(session_id, HISTORY_FETCH_LIMIT),
+        storage.get_session(session_id)
+    )
+    for msg in history_messages:
+        msg['timestamp'] = parse_timestamp(msg['timestamp'])
+    session_doc = session_doc or {}
+    
+    context = {
+        "messages": history_messages,
+        "summary": session_doc.get('summary', ""),
+        "summary_until": parse_timestamp(session_doc.get('summary_until')),
+        "updated_at": parse_timestamp(session_doc.get('updated_at')),
+    }
+    # A cached context vouches for the session being live
+    if session_doc and 'deleted_at' not in session_doc:
+        history_cache.set(session_id, context)
+    return {**context, "messages": list(history_messages)}
+
+def apply_turn(context: dict, docs: List[dict], window: Optional[ContextWindow] = None) -> dict:
+    """Return the session context with a saved turn (and its folded summary) applied"""
+    messages = context['messages'] + [
+        {"role": doc['role'], "content": doc['content'], "timestamp": doc['timestamp']}
+        for doc in docs
+    ]
+    context = {**context, "messages": messages[-HISTORY_FETCH_LIMIT:]}
+    if docs:
+        # save_chat_turn sets the session's updated_at to the reply's timestamp
+        context['updated_at'] = docs[-1]['timestamp']
+    if window is not None and window.summary_changed:
+        context['summary'] = window.summary
+        context['summary_until'] = window.summary_until
+    if window is not None and window.sent:
+        # What the next prompt is compared with to measure prefix reuse
+        context['fingerprint'] = window.fingerprint
+    return context
+
+def remember_turn(session_id: str, docs: List[dict], window: Optional[ContextWindow] = None):
+    """Write freshly saved messages (and summary) through to the cached session context.
+    
+    Sessions that are not cached are left alone; their next read goes to storage.
+    """
+    cached = history_cache.peek(session_id)
+    if cached is None:
+        return
+    history_cache.set(session_id, apply_turn(cached, docs, window))
+
+def context_window(context: dict, message: str) -> ContextWindow:
+    """Fit the session context and the new message into the token-budgeted prompt"""
+    window = build_context(
+        context['messages'],
+        message,
+        summary=context['summary'],
+        summary_until=context['summary_until'],
+        max_messages=CHAT_CONTEXT_MESSAGES,
+        token_budget=CONTEXT_TOKEN_BUDGET,
+        summary_budget=SUMMARY_TOKEN_BUDGET,
+        message_token_limit=MESSAGE_TOKEN_LIMIT,
+        previous_fingerprint=context.get('fingerprint'),
+    )
+    prompt_chars.observe(len(window.prompt))
+    prompt_tokens.observe(window.prompt_tokens)
+    return window
+
+def record_prompt(window: ContextWindow, usage: dict) -> TurnUsage:
+    """Count a prompt the model answered and report its token usage"""
+    prompt_stats.record(window, usage)
+    prompt_reuse.observe(window.reused_tokens / window.prompt_tokens)
+    return TurnUsage(
+        prompt_tokens=window.prompt_tokens,
+        reused_tokens=window.reused_tokens,
+        input_tokens=usage.get('input_tokens'),
+        cached_input_tokens=usage.get('cached_input_tokens'),
+    )
+
+async def build_prompt(session_id: str, message: str) -> ContextWindow:
+    """Build the token-budgeted LLM prompt from the session context and the new message"""
+    with timed_stage(stage_seconds, "history"):
+        context = await load_session_context(session_id)
+    return context_window(context, message)
+
+def check_llm_provider():
+    """Fail the request up front when the LLM provider is not configured"""
+    try:
+        llm_provider.check()
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+write_behind_queue = WriteBehindQueue(storage.save_turns, maxsize=PERSIST_QUEUE_SIZE, batch_size=PERSIST_BATCH_SIZE)
+
+title_generator = TitleGenerator(TITLE_MODE, llm_provider, max_chars=TITLE_MAX_CHARS)
+
+async def write_titles(jobs: List[dict]):
+    """Title a batch of new sessions; sessions already renamed are left alone"""
+    titles = await title_generator.titles(jobs)
+    await storage.set_session_titles(titles, DEFAULT_TITLE)
+
+# Failed batches are retried once, like write-behind turns
+title_queue = WriteBehindQueue(write_titles, maxsize=TITLE_QUEUE_SIZE, batch_size=TITLE_BATCH_SIZE)
+
+async def save_chat_turn(
+    session_id: str,
+    user_text: str,
+    assistant_text: str,
+    window: Optional[ContextWindow] = None,
+    writer: Optional[GroupCommitWriter] = None,
+) -> List[dict]:
+    """Persist a user/assistant exchange, bump the session timestamp and store a folded summary.
+    
+    With a ``writer`` the turn is written as part of its next group commit.
+    Returns the two message documents.
+    """
+    user_message = ChatMessage(
+        session_id=session_id,
+        role="user",
+        content=user_text
+    )
+    user_doc = user_message.model_dump()
+    
+    assistant_message = ChatMessage(
+        session_id=session_id,
+        role="assistant",
+        content=assistant_text
+    )
+    assistant_doc = assistant_message.model_dump()
+    # Keep the reply strictly after the question at millisecond precision
+    if assistant_doc['timestamp'] <= user_doc['timestamp']:
+        assistant_doc['timestamp'] = user_doc['timestamp'] + timedelta(milliseconds=1)
+    
+    # Update session timestamp and summary
+    session_update = {"updated_at": assistant_doc['timestamp']}
+    if window is not None and window.summary_changed:
+        session_update['summary'] = window.summary
+        session_update['summary_until'] = window.summary_until
+    
+    turn = {"session_id": session_id, "messages": [user_doc, assistant_doc], "session_update": session_update}
+    if PERSIST_MODE == "write_behind" and write_behind_queue.submit(turn):
+        # A queued turn goes into the cache at once so the next turn sees it
+        remember_turn(session_id, turn['messages'], window)
+    else:
+        try:
+            if writer is not None:
+                await writer.write(turn)
+            else:
+                await storage.save_turns([turn])
+        except Exception:
+            # The cached context must not keep a turn that was never saved
+            history_cache.pop(session_id)
+            raise
+        remember_turn(session_id, turn['messages'], window)
+    
+    if window is not None and window.first_turn and TITLE_MODE != "off":
+        # Never blocks: without a free queue slot the session keeps its default title
+        title_queue.submit({"session_id": session_id, "user_text": user_text, "assistant_text": assistant_text})
+    return turn['messages']
+
+async def lookup_cached_response(request: ChatRequest, window: ContextWindow) -> tuple:
+    """Return ``(cache_key, cached_response)``; the key is None when the cache is bypassed"""
+    if not request.use_cache or response_cache.backend == "none":
+        return None, None
+    key = response_cache_key(llm_provider.model, SYSTEM_MESSAGE, window.prompt, request.message)
+    return key, await response_cache.get(key)
+
+def sse_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def run_chat_turn(session_id: str, request: ChatRequest, writer: Optional[GroupCommitWriter] = None) -> ChatResponse:
+    """Answer one message of a session; callers hold the session's turn"""
+    check_llm_provider()
+    window = await build_prompt(session_id, request.message)
+    
+    cache_key, assistant_response = await lookup_cached_response(request, window)
+    cached = assistant_response is not None
+    turn_usage = None
+    if not cached:
+        # Send message to the model
+        with timed_stage(stage_seconds, "queue"):
+            llm_slot = await llm_admission.acquire()
+        usage = {}
+        try:
+            with timed_stage(stage_seconds, "llm"):
+                assistant_response = await llm_provider.complete(session_id, window.messages, usage)
+        finally:
+            llm_admission.release(llm_slot)
+        turn_usage = record_prompt(window, usage)
+        if cache_key is not None:
+            await response_cache.set(cache_key, assistant_response)
+    
+    with timed_stage(stage_seconds, "persist"):
+        await save_chat_turn(session_id, request.message, assistant_response, window, writer)
+    
+    return ChatResponse(
+        session_id=session_id,
+        user_message=request.message,
+        assistant_message=assistant_response,
+        timestamp=utc_now(),
+        cached=cached,
+        usage=turn_usage
+    )
+
+def admission_error(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=e.status_code,
+        detail=e.detail,
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def chat_error(e: Exception) -> HTTPException:
+    """Count a failed chat turn and map it to the HTTP error reported for it"""
+    chat_errors.inc(type(e).__name__)
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, TurnRejected):
+        return HTTPException(status_code=409, detail=str(e))
+    if isinstance(e, AdmissionRejected):
+        return admission_error(e)
+    logger.error(f"Error in chat endpoint: {str(e)}")
+    return HTTPException(status_code=500, detail=str(e))
+
+async def answer_chat_request(request: ChatRequest, writer: Optional[GroupCommitWriter] = None) -> ChatResponse:
+    session_id = await get_or_create_session(request.session_id)
+    return await turn_scheduler.run(
+        session_id,
+        request.message,
+        lambda: run_chat_turn(session_id, request, writer)
+    )
 
 @api_router.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """Send a message and get AI response"""
     try:
-        # Get or create session
-        session_id = request.session_id
-        if not session_id:
-            session = ChatSession()
-            session_doc = session.model_dump()
-            session_doc['created_at'] = session_doc['created_at'].isoformat()
-            session_doc['updated_at'] = session_doc['updated_at'].isoformat()
-            await db.chat_sessions.insert_one(session_doc)
-            session_id = session.session_id
-        
-        # Get API key from environment
-        api_key = os.environ.get('EMERGENT_LLM_KEY')
-        if not api_key:
-            raise HTTPException(status_code=500, detail="API key not configured")
-        
-        # Get chat history to build context
-        history_messages = await db.chat_messages.find(
-            {"session_id": session_id},
-            {"_id": 0}
-        ).sort("timestamp", 1).to_list(1000)
-        
-        # Build context from history
-        context_messages = []
-        for msg in history_messages:
-            role = "User" if msg['role'] == "user" else "Assistant"
-            context_messages.append(f"{role}: {msg['content']}")
-        
-        # Create full prompt with context
-        if context_messages:
-            context_text = "\n".join(context_messages[-10:])  # Last 10 messages for context
-            full_prompt = f"Previous conversation:\n{context_text}\n\nUser: {request.message}"
-        else:
-            full_prompt = request.message
-        
-        # Create LLM chat instance
-        chat_instance = LlmChat(
-            api_key=api_key,
-            session_id=session_id,
-            system_message="You are a helpful AI assistant. Provide clear, concise, and friendly responses. Remember the conversation context and refer to previous messages when relevant."
-        ).with_model("anthropic", "claude-sonnet-4-5-20250929")
+        return await answer_chat_request(request)
+    except Exception as e:
+        raise chat_error(e)
+
+# Items in one batch request, and how many of them are answered at once
+CHAT_BATCH_MAX_ITEMS = int(os.environ.get('CHAT_BATCH_MAX_ITEMS', '1000'))
+CHAT_BATCH_CONCURRENCY = int(os.environ.get('CHAT_BATCH_CONCURRENCY', '8'))
+
+class ChatBatchRequest(BaseModel):
+    items: List[ChatRequest] = Field(min_length=1, max_length=CHAT_BATCH_MAX_ITEMS)
+
+def batch_result(index: int, response: Optional[ChatResponse] = None, error: Optional[HTTPException] = None) -> str:
+    """One NDJSON line of a batch response"""
+    if error is not None:
+        line = {"index": index, "status": error.status_code, "detail": error.detail}
+    else:
+        line = {"index": index, "status": 200, "response": response.model_dump(mode="json")}
+    return json.dumps(line) + "\n"
+
+@api_router.post("/chat/batch")
+async def chat_batch(batch: ChatBatchRequest):
+    """Answer many messages concurrently, streaming one NDJSON line per item as it completes.
+    
+    Each line carries the item's ``index`` and ``status`` plus either the
+    ``response`` (as returned by ``POST /api/chat``) or an error ``detail``.
+    Items of the same session run one after another in request order; items
+    without a session each get a new one. At most CHAT_BATCH_CONCURRENCY
+    items run at once and finished turns are saved in shared bulk writes.
+    """
+    groups = {}
+    for index, item in enumerate(batch.items):
+        groups.setdefault(item.session_id or (None, index), []).append(index)
+    
+    writer = GroupCommitWriter(storage.save_turns, batch_size=PERSIST_BATCH_SIZE)
+    parallelism = asyncio.Semaphore(CHAT_BATCH_CONCURRENCY)
+    results: asyncio.Queue = asyncio.Queue()
+    
+    async def run_group(indexes: List[int]):
+        for index in indexes:
+            async with parallelism:
+                try:
+                    response = await answer_chat_request(batch.items[index], writer)
+                except Exception as e:
+                    results.put_nowait(batch_result(index, error=chat_error(e)))
+                else:
+                    results.put_nowait(batch_result(index, response))
+    
+    async def result_lines():
+        tasks = [asyncio.create_task(run_group(indexes)) for indexes in groups.values()]
+        try:
+            for _ in batch.items:
+                yield await results.get()
+        finally:
+            # The client went away: stop answering the remaining items
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    return StreamingResponse(result_lines(), media_type="application/x-ndjson")
+
+@api_router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Send a message and stream the AI response as Server-Sent Events.
+    
+    Emits a ``session`` event first, then one ``token`` event per chunk and a
+    final ``done`` event carrying the same payload as ``POST /api/chat``. The
+    turn is only persisted once the stream completes; if the client goes away
+    mid-stream the generation is abandoned and nothing is saved. The session's
+    turn is held until the stream ends (the merge policy queues here).
+    """
+    try:
+        session_id = await get_or_create_session(request.session_id)
+        await turn_scheduler.acquire(session_id)
+    except TurnRejected as e:
+        chat_errors.inc(type(e).__name__)
+        raise HTTPException(status_code=409, detail=str(e))
+    except HTTPException as e:
+        chat_errors.inc(type(e).__name__)
+        raise
+    except Exception as e:
+        chat_errors.inc(type(e).__name__)
+        logger.error(f"Error in chat stream endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    released = False
+    llm_slot = None
+    
+    async def release_turn():
+        nonlocal released
+        if not released:
+            released = True
+            if llm_slot is not None:
+                llm_admission.release(llm_slot)
+            # Shielded so a disconnect cannot cancel the release half way
+            await asyncio.shield(turn_scheduler.release(session_id))
+    
+    try:
+        check_llm_provider()
+        window = await build_prompt(session_id, request.message)
+        cache_key, cached_response = await lookup_cached_response(request, window)
+        if cached_response is None:
+            # The model slot is held for the whole stream
+            with timed_stage(stage_seconds, "queue"):
+                llm_slot = await llm_admission.acquire()
+    except AdmissionRejected as e:
+        chat_errors.inc(type(e).__name__)
+        await release_turn()
+        raise admission_error(e)
+    except Exception as e:
+        chat_errors.inc(type(e).__name__)
+        await release_turn()
+        logger.error(f"Error in chat stream endpoint: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail=str(e))
+    except BaseException:
+        # Cancelled while building the prompt or queued for the model
+        await release_turn()
+        raise
+    
+    async def event_stream():
+        try:
+            yield sse_event("session", {"session_id": session_id})
         
-        # Send message to Claude
-        user_msg = UserMessage(text=full_prompt)
-        assistant_response = await chat_instance.send_message(user_msg)
+            chunks = []
+            turn_usage = None
+            try:
+                if cached_response is not None:
+                    chunks.append(cached_response)
+                    yield sse_event("token", {"text": cached_response})
+                else:
+                    usage = {}
+                    with timed_stage(stage_seconds, "llm"):
+                        async for chunk in llm_provider.stream(session_id, window.messages, usage):
+                            chunks.append(chunk)
+                            yield sse_event("token", {"text": chunk})
+                    turn_usage = record_prompt(window, usage)
+            except asyncio.CancelledError:
+                # Starlette cancels the response task when the client disconnects
+                logger.info(f"Client disconnected from chat stream for session {session_id}")
+                raise
+            except Exception as e:
+                chat_errors.inc(type(e).__name__)
+                logger.error(f"Error in chat stream endpoint: {str(e)}")
+                yield sse_event("error", {"detail": str(e)})
+                return
         
-        # Save user message
-        user_message = ChatMessage(
-            session_id=session_id,
-            role="user",
-            content=request.message
-        )
-        user_doc = user_message.model_dump()
-        user_doc['timestamp'] = user_doc['timestamp'].isoformat()
-        await db.chat_messages.insert_one(user_doc)
+            assistant_response = "".join(chunks)
+            if cached_response is None and cache_key is not None:
+                await response_cache.set(cache_key, assistant_response)
+            # Shield the writes so a disconnect right at the end cannot leave half a turn behind
+            with timed_stage(stage_seconds, "persist"):
+                await asyncio.shield(save_chat_turn(session_id, request.message, assistant_response, window))
         
-        # Save assistant message
-        assistant_message = ChatMessage(
-            session_id=session_id,
-            role="assistant",
-            content=assistant_response
-        )
-        assistant_doc = assistant_message.model_dump()
-        assistant_doc['timestamp'] = assistant_doc['timestamp'].isoformat()
-        await db.chat_messages.insert_one(assistant_doc)
+            response = ChatResponse(
+                session_id=session_id,
+                user_message=request.message,
+                assistant_message=assistant_response,
+                timestamp=utc_now(),
+                cached=cached_response is not None,
+                usage=turn_usage
+            )
+            yield sse_event("done", response.model_dump(mode="json"))
+        finally:
+            await release_turn()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also releases the turn when the stream is never started
+        background=BackgroundTask(release_turn)
+    )
+
+# WebSocket chat channel. Idle connections get a ping frame every
+# WS_HEARTBEAT_INTERVAL seconds and are closed after WS_IDLE_TIMEOUT seconds
+# without any frame from the client. Each connection buffers at most
+# WS_SEND_QUEUE_SIZE outgoing frames and WS_SEND_BUFFER_CHARS characters of
+# reply before a slow client is dropped.
+WS_MAX_CONNECTIONS = int(os.environ.get('WS_MAX_CONNECTIONS', '10000'))
+WS_HEARTBEAT_INTERVAL = float(os.environ.get('WS_HEARTBEAT_INTERVAL', '20'))
+WS_IDLE_TIMEOUT = float(os.environ.get('WS_IDLE_TIMEOUT', '60'))
+WS_SEND_QUEUE_SIZE = int(os.environ.get('WS_SEND_QUEUE_SIZE', '64'))
+WS_SEND_BUFFER_CHARS = int(os.environ.get('WS_SEND_BUFFER_CHARS', '1000000'))
+WS_MAX_MESSAGE_CHARS = int(os.environ.get('WS_MAX_MESSAGE_CHARS', '100000'))
+
+socket_hub = SocketHub(max_connections=WS_MAX_CONNECTIONS)
+
+def socket_error(e: HTTPException) -> dict:
+    """Error frame for a failed request on the WebSocket channel"""
+    frame = {"type": "error", "status": e.status_code, "detail": e.detail}
+    retry_after = (e.headers or {}).get("Retry-After")
+    if retry_after:
+        frame['retry_after'] = int(retry_after)
+    return frame
+
+@api_router.websocket("/chat/ws")
+async def chat_socket(websocket: WebSocket, session_id: Optional[str] = None):
+    """Chat with one session over a long-lived WebSocket connection.
+    
+    The server first sends ``{"type": "session", "session_id": ...}``; a new
+    session is created when no ``session_id`` is given. The client sends
+    ``{"type": "message", "message": ..., "use_cache": true}`` to start a turn,
+    optionally preceded by ``{"type": "token", "text": ...}`` frames that are
+    prepended to the message, and ``{"type": "cancel"}`` to abandon the
+    running generation. The server answers with ``token`` frames, then
+    ``done`` (the ``POST /api/chat`` payload), ``cancelled`` or ``error``
+    (``status`` and ``detail``). One turn runs at a time per connection.
+    
+    The session context is loaded once and kept for the life of the
+    connection, so turns skip the history read. Idle connections exchange
+    ``ping``/``pong`` frames and cost two parked tasks and one context.
+    """
+    await websocket.accept()
+    if not socket_hub.admit():
+        await websocket.close(code=1013, reason="Too many connections")
+        return
+    try:
+        await serve_chat_socket(websocket, session_id)
+    finally:
+        socket_hub.leave()
+
+async def serve_chat_socket(websocket: WebSocket, session_id: Optional[str]):
+    try:
+        session_id = await get_or_create_session(session_id)
+        context = await load_session_context(session_id)
+    except HTTPException as e:
+        await websocket.send_json(socket_error(e))
+        await websocket.close(code=4000 + e.status_code, reason=e.detail)
+        return
+    
+    outbox = SocketOutbox(maxsize=WS_SEND_QUEUE_SIZE, max_chars=WS_SEND_BUFFER_CHARS)
+    outbox.put({"type": "session", "session_id": session_id})
+    turn: Optional[asyncio.Task] = None
+    cancellable = False
+    
+    async def answer(request: ChatRequest):
+        nonlocal context, cancellable
+        try:
+            await require_session(session_id)
+            await turn_scheduler.acquire(session_id)
+        except Exception as e:
+            outbox.put(socket_error(chat_error(e)))
+            return
         
-        # Update session timestamp
-        await db.chat_sessions.update_one(
-            {"session_id": session_id},
-            {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
-        )
+        llm_slot = None
+        cancellable = True
+        try:
+            check_llm_provider()
+            # The shared cache also sees turns sent over HTTP to this worker
+            base = None if REVALIDATE_CONTEXT else history_cache.peek(session_id) or context
+            if base is None:
+                with timed_stage(stage_seconds, "history"):
+                    base = await load_session_context(session_id)
+            window = context_window(base, request.message)
+            cache_key, assistant_response = await lookup_cached_response(request, window)
+            cached = assistant_response is not None
+            turn_usage = None
+            if cached:
+                outbox.put({"type": "token", "text": assistant_response})
+            else:
+                with timed_stage(stage_seconds, "queue"):
+                    llm_slot = await llm_admission.acquire()
+                chunks = []
+                usage = {}
+                with timed_stage(stage_seconds, "llm"):
+                    async for chunk in llm_provider.stream(session_id, window.messages, usage):
+                        chunks.append(chunk)
+                        outbox.put({"type": "token", "text": chunk})
+                llm_admission.release(llm_slot)
+                llm_slot = None
+                turn_usage = record_prompt(window, usage)
+                assistant_response = "".join(chunks)
+                if cache_key is not None:
+                    await response_cache.set(cache_key, assistant_response)
+            # A finished reply is always saved; cancel only stops the generation
+            cancellable = False
+            with timed_stage(stage_seconds, "persist"):
+                docs = await asyncio.shield(save_chat_turn(session_id, request.message, assistant_response, window))
+        except asyncio.CancelledError:
+            # Also raised when the connection closes; the outbox is closed by then
+            socket_hub.cancelled += 1
+            context = None
+            outbox.put({"type": "cancelled"})
+            return
+        except OutboxOverflow:
+            return
+        except Exception as e:
+            outbox.put(socket_error(chat_error(e)))
+            return
+        finally:
+            cancellable = False
+            if llm_slot is not None:
+                llm_admission.release(llm_slot)
+            await asyncio.shield(turn_scheduler.release(session_id))
         
-        return ChatResponse(
+        context = apply_turn(base, docs, window)
+        socket_hub.turns += 1
+        response = ChatResponse(
             session_id=session_id,
             user_message=request.message,
             assistant_message=assistant_response,
-            timestamp=datetime.now(timezone.utc)
+            timestamp=utc_now(),
+            cached=cached,
+            usage=turn_usage
         )
+        outbox.put({"type": "done", **response.model_dump(mode="json")})
     
-    except Exception as e:
-        logger.error(f"Error in chat endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    async def send_frames():
+        async for frame in outbox.frames(WS_HEARTBEAT_INTERVAL):
+            await websocket.send_json(frame)
+    
+    async def receive_frames():
+        nonlocal turn
+        draft: List[str] = []
+        draft_chars = 0
+        while True:
+            try:
+                text = await asyncio.wait_for(websocket.receive_text(), WS_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                socket_hub.dropped_idle += 1
+                return 4408, "Idle timeout"
+            try:
+                frame = json.loads(text)
+                kind = frame.get('type')
+            except (ValueError, AttributeError):
+                outbox.put({"type": "error", "status": 400, "detail": "Frames must be JSON objects"})
+                continue
+            
+            if kind == "pong":
+                continue
+            if kind == "ping":
+                outbox.put({"type": "pong"})
+            elif kind == "cancel":
+                if turn is not None and cancellable:
+                    turn.cancel()
+            elif kind in ("token", "message"):
+                part = frame.get('text' if kind == "token" else 'message', "")
+                if not isinstance(part, str):
+                    outbox.put({"type": "error", "status": 422, "detail": f"{kind} text must be a string"})
+                    continue
+                draft.append(part)
+                draft_chars += len(part)
+                if draft_chars > WS_MAX_MESSAGE_CHARS:
+                    draft, draft_chars = [], 0
+                    outbox.put({"type": "error", "status": 413, "detail": "Message too long"})
+                    continue
+                if kind == "token":
+                    continue
+                message = "".join(draft)
+                draft, draft_chars = [], 0
+                if turn is not None and not turn.done():
+                    outbox.put({"type": "error", "status": 409, "detail": "A turn is already running on this connection"})
+                    continue
+                request = ChatRequest(message=message, session_id=session_id, use_cache=frame.get('use_cache') is not False)
+                turn = asyncio.create_task(answer(request))
+            else:
+                outbox.put({"type": "error", "status": 400, "detail": f"Unknown frame type: {kind}"})
+    
+    sender = asyncio.create_task(send_frames())
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # Stop the generation first: nothing of an unfinished turn is saved
+        outbox.close()
+        tasks = [task for task in (turn, receiver, sender) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    if outbox.overflowed:
+        socket_hub.dropped_slow += 1
+        close = (1008, "Client is not reading fast enough")
+    elif receiver in done and not receiver.cancelled() and receiver.exception() is None:
+        close = receiver.result()
+    else:
+        # The client went away (or sending failed); there is nobody to close with
+        return
+    try:
+        await websocket.close(code=close[0], reason=close[1])
+    except Exception:
+        pass
 
 @api_router.delete("/chat/sessions/{session_id}")
 async def delete_chat_session(session_id: str):
-    """Delete a chat session and its messages"""
-    await db.chat_messages.delete_many({"session_id": session_id})
-    await db.chat_sessions.delete_one({"session_id": session_id})
+    """Delete a chat session; its messages are purged in the background"""
+    await storage.soft_delete_sessions([session_id], utc_now())
+    # After the delete, so a turn running meanwhile cannot cache the session again
+    history_cache.pop(session_id)
     return {"message": "Session deleted successfully"}
 
+# Sessions accepted by one bulk delete
+BULK_DELETE_MAX_SESSIONS = 1000
+
+class BulkDeleteRequest(BaseModel):
+    session_ids: List[str] = Field(min_length=1, max_length=BULK_DELETE_MAX_SESSIONS)
+
+@api_router.post("/chat/sessions/bulk-delete")
+async def bulk_delete_chat_sessions(request: BulkDeleteRequest):
+    """Delete many chat sessions at once; their messages are purged in the background"""
+    deleted = await storage.soft_delete_sessions(request.session_ids, utc_now())
+    for session_id in request.session_ids:
+        history_cache.pop(session_id)
+    return {"deleted": deleted}
+
+# Export and import read and insert EXPORT_BATCH_SIZE / IMPORT_BATCH_SIZE
+# documents at a time; the export is sent in chunks of about 64KB
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))
+EXPORT_CHUNK_BYTES = 64 * 1024
+IMPORT_MAX_LINE_BYTES = 16 * 1024 * 1024
+
+class ExportedSession(ChatSession):
+    session_id: str
+    created_at: datetime
+    updated_at: datetime
+    summary: Optional[str] = None
+    summary_until: Optional[datetime] = None
+
+class ExportedMessage(ChatMessage):
+    id: str
+    timestamp: datetime
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Read naive query datetimes as UTC"""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+@api_router.get("/chat/export")
+async def export_chats(
+    session_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """Stream sessions and their messages as NDJSON.
+    
+    Each session is a ``{"type": "session", ...}`` line (including its
+    summary) followed by one ``{"type": "message", ...}`` line per message,
+    oldest first. ``since``/``until`` keep the sessions active in that range
+    and the messages sent in it. Storage is read in batches, so memory use
+    does not grow with the size of the export.
+    """
+    if session_id is not None:
+        await require_session(session_id)
+    since, until = as_utc(since), as_utc(until)
+    
+    async def lines():
+        chunk = bytearray()
+        async for kind, doc in storage.export(session_id, since, until, EXPORT_BATCH_SIZE):
+            chunk += orjson.dumps({"type": kind, **doc})
+            chunk += b"\n"
+            if len(chunk) >= EXPORT_CHUNK_BYTES:
+                yield bytes(chunk)
+                chunk.clear()
+        if chunk:
+            yield bytes(chunk)
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+async def body_lines(request: Request) -> AsyncIterator[bytes]:
+    """Split a streamed request body into lines without reading it whole"""
+    pending = b""
+    async for chunk in request.stream():
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            yield line
+        if len(pending) > IMPORT_MAX_LINE_BYTES:
+            raise HTTPException(status_code=413, detail="Import line too long")
+    if pending:
+        yield pending
+
+@api_router.post("/chat/import")
+async def import_chats(request: Request):
+    """Bulk-import an NDJSON body in the format of ``GET /api/chat/export``.
+    
+    Lines are validated and inserted in batches of IMPORT_BATCH_SIZE.
+    Sessions and messages that already exist are skipped, as are messages
+    whose session is missing or deleted, so an interrupted import can simply
+    be sent again. A malformed line fails the request with 400 after the
+    lines before it are imported.
+    """
+    sessions: List[dict] = []
+    messages: List[dict] = []
+    counts = {"sessions": 0, "messages": 0, "skipped": 0}
+    
+    async def flush():
+        # Sessions first, so the messages of the same batch find them
+        if sessions:
+            inserted = await storage.import_sessions(sessions)
+            counts['sessions'] += inserted
+            counts['skipped'] += len(sessions) - inserted
+            sessions.clear()
+        if messages:
+            inserted = await storage.import_messages(messages)
+            counts['messages'] += inserted
+            counts['skipped'] += len(messages) - inserted
+            for session_id in {doc['session_id'] for doc in messages}:
+                history_cache.pop(session_id)
+            messages.clear()
+    
+    line_number = 0
+    async for line in body_lines(request):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            record = orjson.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+            kind = record.pop('type', None)
+            if kind == "session":
+                sessions.append(ExportedSession(**record).model_dump(exclude_none=True))
+            elif kind == "message":
+                messages.append(ExportedMessage(**record).model_dump())
+            else:
+                raise ValueError(f"unknown record type {kind!r}")
+        except (ValueError, TypeError) as e:
+            await flush()
+            raise HTTPException(status_code=400, detail=f"Line {line_number}: {str(e)}")
+        if len(sessions) + len(messages) >= IMPORT_BATCH_SIZE:
+            await flush()
+    await flush()
+    return counts
+
+@api_router.get("/chat/cache/stats")
+async def get_cache_stats():
+    """Counters of the in-process caches, queues and limiters"""
+    return {
+        "history": history_cache.stats(),
+        "responses": response_cache.stats(),
+        "turns": turn_scheduler.stats(),
+        "admission": llm_admission.stats(),
+        "write_behind": write_behind_queue.stats(),
+        "titles": {**title_queue.stats(), "llm_failures": title_generator.llm_failures},
+        "reaper": session_reaper.stats(),
+        "sockets": socket_hub.stats(),
+        "prompts": prompt_stats.stats(),
+    }
+
+def collect_component_stats():
+    """Expose the counters the in-process components already keep"""
+    history = history_cache.stats()
+    responses = response_cache.stats()
+    admission = llm_admission.stats()
+    turns = turn_scheduler.stats()
+    write_behind = write_behind_queue.stats()
+    titles = title_queue.stats()
+    reaper = session_reaper.stats()
+    sockets = socket_hub.stats()
+    prompts = prompt_stats.stats()
+    return [
+        ("chat_cache_hits_total", "counter", "Cache hits by cache",
+         [({"cache": "history"}, history['hits']), ({"cache": "responses"}, responses['hits'])]),
+        ("chat_cache_misses_total", "counter", "Cache misses by cache",
+         [({"cache": "history"}, history['misses']), ({"cache": "responses"}, responses['misses'])]),
+        ("llm_calls_in_flight", "gauge", "LLM calls currently running", [({}, admission['in_flight'])]),
+        ("llm_queue_depth", "gauge", "LLM calls waiting for a slot", [({}, admission['queue_depth'])]),
+        ("llm_admission_rejected_total", "counter", "LLM calls rejected by admission control",
+         [({"reason": "queue_full"}, admission['rejected_queue_full']), ({"reason": "timeout"}, admission['rejected_timeout'])]),
+        ("chat_turns_waited_total", "counter", "Chat turns that waited for another turn of their session", [({}, turns['queued'])]),
+        ("chat_turns_merged_total", "counter", "Duplicate chat turns answered by a running turn", [({}, turns['merged'])]),
+        ("write_behind_queue_depth", "gauge", "Chat turns waiting to be persisted", [({}, write_behind['depth'])]),
+        ("write_behind_dropped_total", "counter", "Chat turns dropped after failed flushes", [({}, write_behind['dropped'])]),
+        ("title_queue_depth", "gauge", "Sessions waiting for a generated title", [({}, titles['depth'])]),
+        ("title_jobs_dropped_total", "counter", "Title jobs dropped after failed batches", [({}, titles['dropped'])]),
+        ("reaper_sessions_purged_total", "counter", "Deleted sessions purged by the reaper", [({}, reaper['sessions_purged'])]),
+        ("reaper_messages_purged_total", "counter", "Messages of deleted sessions purged by the reaper", [({}, reaper['messages_purged'])]),
+        ("reaper_sessions_expired_total", "counter", "Idle sessions expired by the session TTL", [({}, reaper['sessions_expired'])]),
+        ("chat_socket_connections", "gauge", "Open WebSocket chat connections", [({}, sockets['open'])]),
+        ("chat_socket_closed_total", "counter", "WebSocket chat connections refused or dropped by the server",
+         [({"reason": "full"}, sockets['rejected']), ({"reason": "slow"}, sockets['dropped_slow']), ({"reason": "idle"}, sockets['dropped_idle'])]),
+        ("chat_socket_turns_cancelled_total", "counter", "WebSocket chat turns cancelled before their reply was saved", [({}, sockets['cancelled'])]),
+        ("chat_prompt_tokens_total", "counter", "Estimated prompt tokens sent to the model, by whether they repeat the session's previous request",
+         [({"part": "reused"}, prompts['reused_tokens']), ({"part": "new"}, prompts['prompt_tokens'] - prompts['reused_tokens'])]),
+        ("llm_input_tokens_total", "counter", "Input tokens reported by the model provider, by prompt cache outcome",
+         [({"cache": "hit"}, prompts['cached_input_tokens']), ({"cache": "miss"}, prompts['input_tokens'] - prompts['cached_input_tokens'])]),
+    ]
+
+metrics.register_collector(collect_component_stats)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -233,8 +1298,11 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
 
+app.add_middleware(MetricsMiddleware, in_flight=requests_in_flight, duration=request_seconds)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -242,6 +1310,44 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def startup_db_indexes():
+    await storage.setup()
+    try:
+        await response_cache.ensure_indexes()
+    except Exception as e:
+        logger.error(f"Error creating response cache indexes: {str(e)}")
+    if turn_scheduler.lease is not None:
+        try:
+            await turn_scheduler.lease.ensure_indexes()
+        except Exception as e:
+            logger.error(f"Error creating session lease indexes: {str(e)}")
+    if os.environ.get('CHECK_QUERY_PLANS', 'true').lower() == 'true':
+        await storage.check_query_plans(HISTORY_FETCH_LIMIT)
+
+@app.on_event("startup")
+async def startup_write_behind():
+    if PERSIST_MODE == "write_behind":
+        write_behind_queue.start()
+
+@app.on_event("startup")
+async def startup_title_worker():
+    if TITLE_MODE != "off":
+        title_queue.start()
+
+@app.on_event("startup")
+async def startup_session_reaper():
+    session_reaper.start()
+
+@app.on_event("startup")
+async def startup_llm_provider():
+    await llm_provider.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    # Flush queued turns before the connection goes away
+    await write_behind_queue.close()
+    await title_queue.close()
+    await session_reaper.close()
+    await llm_provider.close()
+    await storage.close()
\ No newline at end of file
@@ -0,0 +1,985 @@
+"""Storage backends for chat sessions, messages and status checks.
+
+Every backend implements the ChatStorage interface and returns plain dicts
+with UTC-aware datetimes, so the API layer does not care where the data
+lives:
+
+- ``MongoChatStorage``: MongoDB through Motor (the default, shared by workers)
+- ``SqliteChatStorage``: an embedded SQLite file in WAL mode, for low-latency
+  single-node deployments
+- ``MemoryChatStorage``: process memory, for tests, benchmarks and demos
+
+Listings use keyset pagination: a cursor is the ``(sort value, id)`` pair of
+the last item seen and only items strictly beyond it are returned, in scan
+order (descending when ``descending`` is true).
+
+Deleting a session only marks it (``deleted_at``) and hides it from the
+session listing; its messages are purged later in small batches.
+
+Exports read sessions ordered by ``session_id`` and messages ordered by
+``(session_id, timestamp, id)`` in batches and merge the two streams, so an
+export of any size holds one batch of each in memory. Imports insert
+batches and skip documents that already exist, so they can be re-run.
+
+Message search is backed by a text index on MongoDB, an FTS5 table on
+SQLite and an in-process ``InvertedIndex`` in memory; each is kept current
+as turns are saved and purged.
+"""
+
+import asyncio
+import bisect
+import heapq
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from pagination import keyset_query, listing_sort
+from search_index import InvertedIndex
+
+logger = logging.getLogger(__name__)
+
+Cursor = Optional[Tuple[Any, str]]
+ScoreCursor = Optional[Tuple[float, str]]
+
+# Fields returned by the listing endpoints, matching the response models
+SESSION_FIELDS = ("session_id", "title", "created_at", "updated_at")
+MESSAGE_FIELDS = ("id", "session_id", "role", "content", "timestamp")
+HISTORY_FIELDS = ("role", "content", "timestamp")
+STATUS_FIELDS = ("id", "client_name", "timestamp")
+
+
+class ChatStorage:
+    """Interface of the storage backends"""
+
+    backend = "none"
+
+    async def setup(self):
+        """Create indexes or schema; a no-op when they already exist"""
+
+    async def check_query_plans(self, history_limit: int):
+        """Log how the backend serves each chat query, where it can tell"""
+
+    async def close(self):
+        pass
+
+    async def add_status_check(self, doc: dict):
+        raise NotImplementedError
+
+    async def list_status_checks(self, limit: int) -> List[dict]:
+        raise NotImplementedError
+
+    async def create_session(self, doc: dict):
+        raise NotImplementedError
+
+    async def get_session(self, session_id: str) -> Optional[dict]:
+        """The full session document (including its summary), or None"""
+        raise NotImplementedError
+
+    async def list_sessions(self, limit: int, cursor: Cursor = None, descending: bool = True) -> List[dict]:
+        """Sessions ordered by ``(updated_at, session_id)``"""
+        raise NotImplementedError
+
+    async def list_messages(self, session_id: str, limit: int, cursor: Cursor = None, descending: bool = False) -> List[dict]:
+        """Messages of a session ordered by ``(timestamp, id)``"""
+        raise NotImplementedError
+
+    async def recent_messages(self, session_id: str, limit: int) -> List[dict]:
+        """The last ``limit`` messages of a session (role, content, timestamp), oldest first"""
+        raise NotImplementedError
+
+    async def search_messages(self, terms: List[str], limit: int, cursor: ScoreCursor = None) -> List[dict]:
+        """Messages of live sessions containing any of ``terms``, best match first.
+
+        Hits carry the message fields, the session ``title`` and a relevance
+        ``score`` (higher is better; the scale differs per backend). Equal
+        scores are ordered by message id, and ``cursor`` is the ``(score, id)``
+        of the last hit already seen.
+        """
+        raise NotImplementedError
+
+    async def save_turns(self, turns: List[dict]):
+        """Insert each turn's ``messages`` and apply its ``session_update`` to the session.
+
+        Turns of sessions that are missing or marked deleted are dropped, so a
+        turn that finishes after its session was deleted cannot leave messages
+        behind that the reaper would never find.
+        """
+        raise NotImplementedError
+
+    async def set_session_titles(self, titles: Dict[str, str], placeholder: str):
+        """Set session titles, skipping sessions whose title is no longer ``placeholder``"""
+        raise NotImplementedError
+
+    async def soft_delete_sessions(self, session_ids: List[str], deleted_at: datetime) -> int:
+        """Mark sessions deleted so listings hide them; returns how many were newly marked"""
+        raise NotImplementedError
+
+    async def expire_sessions(self, idle_before: datetime, deleted_at: datetime) -> int:
+        """Mark sessions last updated before ``idle_before`` deleted; returns how many"""
+        raise NotImplementedError
+
+    async def deleted_sessions(self, limit: int) -> List[str]:
+        """Ids of sessions marked deleted, waiting to be purged"""
+        raise NotImplementedError
+
+    async def purge_messages(self, session_id: str, limit: int) -> int:
+        """Delete up to ``limit`` messages of a session; returns how many were deleted"""
+        raise NotImplementedError
+
+    async def purge_session(self, session_id: str):
+        """Remove a session marked deleted, once its messages are purged"""
+        raise NotImplementedError
+
+    def export_sessions(self, session_id: Optional[str] = None, since: Optional[datetime] = None,
+                        until: Optional[datetime] = None, batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Full documents of live sessions ordered by ``session_id``.
+
+        With ``since``/``until`` only sessions active in that range are read:
+        updated at or after ``since`` and created before ``until``.
+        """
+        raise NotImplementedError
+
+    def export_messages(self, session_id: Optional[str] = None, since: Optional[datetime] = None,
+                        until: Optional[datetime] = None, batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Messages with ``since <= timestamp < until`` ordered by ``(session_id, timestamp, id)``"""
+        raise NotImplementedError
+
+    async def export(self, session_id: Optional[str] = None, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None, batch_size: int = 1000) -> AsyncIterator[Tuple[str, dict]]:
+        """Yield ``("session", doc)`` for each live session followed by a ``("message", doc)`` per message"""
+        messages = self.export_messages(session_id, since, until, batch_size)
+        message = await anext(messages, None)
+        async for session in self.export_sessions(session_id, since, until, batch_size):
+            # Messages of deleted sessions sort between the live ones and are skipped
+            while message is not None and message['session_id'] < session['session_id']:
+                message = await anext(messages, None)
+            yield "session", session
+            while message is not None and message['session_id'] == session['session_id']:
+                yield "message", message
+                message = await anext(messages, None)
+
+    async def import_sessions(self, docs: List[dict]) -> int:
+        """Insert sessions, skipping ids that already exist; returns how many were inserted"""
+        raise NotImplementedError
+
+    async def import_messages(self, docs: List[dict]) -> int:
+        """Insert messages, skipping existing ids and messages of missing or deleted sessions.
+
+        Returns how many were inserted.
+        """
+        raise NotImplementedError
+
+
+def _project(doc: dict, fields: Tuple[str, ...]) -> dict:
+    return {field: doc[field] for field in fields if field in doc}
+
+
+# --- MongoDB ----------------------------------------------------------------
+
+# Indexes backing every chat query pattern, keyed by collection
+CHAT_INDEXES = {
+    "chat_messages": [
+        # History reads and message listing: find by session_id, sort by timestamp (id breaks ties for cursors)
+        IndexModel([("session_id", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)], name="session_id_timestamp_id"),
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Message search
+        IndexModel([("content", TEXT)], name="content_text"),
+    ],
+    "chat_sessions": [
+        IndexModel([("session_id", ASCENDING)], name="session_id_unique", unique=True),
+        IndexModel([("updated_at", DESCENDING), ("session_id", DESCENDING)], name="updated_at_session_id_desc"),
+        # Only soft-deleted sessions are indexed, so the reaper finds them without a scan
+        IndexModel([("deleted_at", ASCENDING)], name="deleted_at_partial",
+                   partialFilterExpression={"deleted_at": {"$exists": True}}),
+    ],
+}
+
+
+def _projection(fields: Tuple[str, ...]) -> dict:
+    return {"_id": 0, **{field: 1 for field in fields}}
+
+
+def _plan_stages(plan: dict) -> List[str]:
+    """Flatten the stage names of an explain() winning plan"""
+    stages = [plan.get("stage", "")]
+    if "inputStage" in plan:
+        stages.extend(_plan_stages(plan["inputStage"]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+class MongoChatStorage(ChatStorage):
+    """MongoDB storage; ``db`` is also used by the Mongo-only features"""
+
+    backend = "mongo"
+
+    def __init__(self, mongo_url: str, db_name: str):
+        # Timestamps are stored as native BSON dates and read back as UTC-aware datetimes
+        self.client = AsyncIOMotorClient(mongo_url, tz_aware=True)
+        self.db = self.client[db_name]
+
+    async def setup(self):
+        for collection_name, indexes in CHAT_INDEXES.items():
+            start = time.perf_counter()
+            try:
+                names = await self.db[collection_name].create_indexes(indexes)
+            except Exception as e:
+                logger.error(f"Error creating indexes on {collection_name}: {str(e)}")
+                continue
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            logger.info(f"Ensured indexes {names} on {collection_name} in {elapsed_ms:.1f}ms")
+
+    async def check_query_plans(self, history_limit: int):
+        """Log the winning plan of each chat query and warn on scans or in-memory sorts"""
+        queries = {
+            "chat history": self.db.chat_messages.find({"session_id": ""}).sort("timestamp", -1).limit(history_limit),
+            "message list": self.db.chat_messages.find({"session_id": ""}).sort([("timestamp", 1), ("id", 1)]),
+            "session list": self.db.chat_sessions.find({"deleted_at": {"$exists": False}}).sort([("updated_at", -1), ("session_id", -1)]),
+            "session lookup": self.db.chat_sessions.find({"session_id": ""}),
+            "session messages purge": self.db.chat_messages.find({"session_id": ""}, {"id": 1}),
+            "deleted sessions": self.db.chat_sessions.find({"deleted_at": {"$exists": True}}),
+            "message search": self.db.chat_messages.find({"$text": {"$search": "search"}}),
+        }
+        for name, cursor in queries.items():
+            try:
+                explanation = await cursor.explain()
+            except Exception as e:
+                logger.error(f"Error explaining {name} query: {str(e)}")
+                continue
+            winning_plan = explanation["queryPlanner"]["winningPlan"]
+            # Slot-based engine plans nest the classic plan under queryPlan
+            stages = _plan_stages(winning_plan.get("queryPlan", winning_plan))
+            if "COLLSCAN" in stages or "SORT" in stages:
+                logger.warning(f"Query plan for {name} is not index-backed: {' <- '.join(stages)}")
+            else:
+                logger.info(f"Query plan for {name}: {' <- '.join(stages)}")
+
+    async def close(self):
+        self.client.close()
+
+    async def add_status_check(self, doc: dict):
+        await self.db.status_checks.insert_one(dict(doc))
+
+    async def list_status_checks(self, limit: int) -> List[dict]:
+        return await self.db.status_checks.find({}, {"_id": 0}).to_list(limit)
+
+    async def create_session(self, doc: dict):
+        await self.db.chat_sessions.insert_one(dict(doc))
+
+    async def get_session(self, session_id: str) -> Optional[dict]:
+        return await self.db.chat_sessions.find_one({"session_id": session_id}, {"_id": 0})
+
+    async def _page(self, collection, base_filter: dict, fields, sort_field: str, id_field: str,
+                    limit: int, cursor: Cursor, descending: bool) -> List[dict]:
+        if cursor is not None:
+            query, sort = keyset_query(base_filter, sort_field, id_field, cursor, older=descending)
+        else:
+            query, sort = base_filter, listing_sort(sort_field, id_field, descending)
+        return await collection.find(query, _projection(fields)).sort(sort).limit(limit).to_list(limit)
+
+    async def list_sessions(self, limit: int, cursor: Cursor = None, descending: bool = True) -> List[dict]:
+        return await self._page(
+            self.db.chat_sessions, {"deleted_at": {"$exists": False}}, SESSION_FIELDS, "updated_at", "session_id",
+            limit, cursor, descending
+        )
+
+    async def list_messages(self, session_id: str, limit: int, cursor: Cursor = None, descending: bool = False) -> List[dict]:
+        return await self._page(
+            self.db.chat_messages, {"session_id": session_id}, MESSAGE_FIELDS, "timestamp", "id",
+            limit, cursor, descending
+        )
+
+    async def recent_messages(self, session_id: str, limit: int) -> List[dict]:
+        # Walk the (session_id, timestamp) index backwards so only the window is read
+        messages = await self.db.chat_messages.find(
+            {"session_id": session_id}, _projection(HISTORY_FIELDS)
+        ).sort("timestamp", -1).limit(limit).to_list(limit)
+        messages.reverse()
+        return messages
+
+    async def search_messages(self, terms: List[str], limit: int, cursor: ScoreCursor = None) -> List[dict]:
+        pipeline: List[dict] = [
+            {"$match": {"$text": {"$search": " ".join(terms)}}},
+            {"$project": {**_projection(MESSAGE_FIELDS), "score": {"$meta": "textScore"}}},
+        ]
+        if cursor is not None:
+            score, message_id = cursor
+            pipeline.append({"$match": {"$or": [
+                {"score": {"$lt": score}},
+                {"score": score, "id": {"$gt": message_id}},
+            ]}})
+        # Hits of deleted sessions are dropped before the limit so a page is only short at the end.
+        # The lookups run in score order and stop once the page is full
+        pipeline += [
+            {"$sort": {"score": -1, "id": 1}},
+            {"$lookup": {"from": "chat_sessions", "localField": "session_id",
+                         "foreignField": "session_id", "as": "session"}},
+            {"$unwind": "$session"},
+            {"$match": {"session.deleted_at": {"$exists": False}}},
+            {"$limit": limit},
+            {"$project": {**_projection(MESSAGE_FIELDS), "score": 1, "title": "$session.title"}},
+        ]
+        return await self.db.chat_messages.aggregate(pipeline).to_list(limit)
+
+    async def save_turns(self, turns: List[dict]):
+        """One bulk message insert alongside one bulk update of the live sessions.
+
+        The session updates only match live sessions. When fewer match than
+        were sent, the messages just inserted for missing or deleted sessions
+        are removed again, so the hot path costs a single round trip.
+        """
+        if not turns:
+            return
+        message_docs = [dict(doc) for turn in turns for doc in turn['messages']]
+        session_updates = [
+            UpdateOne({"session_id": turn['session_id'], "deleted_at": {"$exists": False}}, {"$set": turn['session_update']})
+            for turn in turns
+        ]
+        _, updated = await asyncio.gather(
+            self.db.chat_messages.insert_many(message_docs, ordered=True),
+            self.db.chat_sessions.bulk_write(session_updates, ordered=False)
+        )
+        if updated.matched_count == len(session_updates):
+            return
+        session_ids = list({turn['session_id'] for turn in turns})
+        live = {
+            doc['session_id'] for doc in await self.db.chat_sessions.find(
+                {"session_id": {"$in": session_ids}, "deleted_at": {"$exists": False}},
+                {"_id": 0, "session_id": 1}
+            ).to_list(len(session_ids))
+        }
+        orphans = [doc['id'] for doc in message_docs if doc['session_id'] not in live]
+        if orphans:
+            await self.db.chat_messages.delete_many({"id": {"$in": orphans}})
+
+    async def set_session_titles(self, titles: Dict[str, str], placeholder: str):
+        if titles:
+            await self.db.chat_sessions.bulk_write([
+                UpdateOne({"session_id": session_id, "title": placeholder}, {"$set": {"title": title}})
+                for session_id, title in titles.items()
+            ], ordered=False)
+
+    async def soft_delete_sessions(self, session_ids: List[str], deleted_at: datetime) -> int:
+        result = await self.db.chat_sessions.update_many(
+            {"session_id": {"$in": session_ids}, "deleted_at": {"$exists": False}},
+            {"$set": {"deleted_at": deleted_at}}
+        )
+        return result.modified_count
+
+    async def expire_sessions(self, idle_before: datetime, deleted_at: datetime) -> int:
+        result = await self.db.chat_sessions.update_many(
+            {"updated_at": {"$lt": idle_before}, "deleted_at": {"$exists": False}},
+            {"$set": {"deleted_at": deleted_at}}
+        )
+        return result.modified_count
+
+    async def deleted_sessions(self, limit: int) -> List[str]:
+        docs = await self.db.chat_sessions.find(
+            {"deleted_at": {"$exists": True}}, {"_id": 0, "session_id": 1}
+        ).limit(limit).to_list(limit)
+        return [doc['session_id'] for doc in docs]
+
+    async def purge_messages(self, session_id: str, limit: int) -> int:
+        docs = await self.db.chat_messages.find(
+            {"session_id": session_id}, {"_id": 1}
+        ).limit(limit).to_list(limit)
+        if not docs:
+            return 0
+        result = await self.db.chat_messages.delete_many({"_id": {"$in": [doc['_id'] for doc in docs]}})
+        return result.deleted_count
+
+    async def purge_session(self, session_id: str):
+        await self.db.chat_sessions.delete_one({"session_id": session_id, "deleted_at": {"$exists": True}})
+
+    async def export_sessions(self, session_id: Optional[str] = None, since: Optional[datetime] = None,
+                              until: Optional[datetime] = None, batch_size: int = 1000) -> AsyncIterator[dict]:
+        query: Dict[str, Any] = {"deleted_at": {"$exists": False}}
+        if session_id is not None:
+            query['session_id'] = session_id
+        if since is not None:
+            query['updated_at'] = {"$gte": since}
+        if until is not None:
+            query['created_at'] = {"$lt": until}
+        cursor = self.db.chat_sessions.find(query, {"_id": 0}).sort("session_id", ASCENDING).batch_size(batch_size)
+        async for doc in cursor:
+            yield doc
+
+    async def export_messages(self, session_id: Optional[str] = None, since: Optional[datetime] = None,
+                              until: Optional[datetime] = None, batch_size: int = 1000) -> AsyncIterator[dict]:
+        query: Dict[str, Any] = {}
+        if session_id is not None:
+            query['session_id'] = session_id
+        if since is not None or until is not None:
+            query['timestamp'] = {
+                **({"$gte": since} if since is not None else {}),
+                **({"$lt": until} if until is not None else {}),
+            }
+        # Walks the (session_id, timestamp, id) index, so the sort needs no memory
+        cursor = self.db.chat_messages.find(query, _projection(MESSAGE_FIELDS)).sort(
+            [("session_id", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)]
+        ).batch_size(batch_size)
+        async for doc in cursor:
+            yield doc
+
+    async def _insert_new(self, collection, docs: List[dict]) -> int:
+        """insert_many that skips duplicate keys; returns how many were inserted"""
+        if not docs:
+            return 0
+        try:
+            result = await collection.insert_many([dict(doc) for doc in docs], ordered=False)
+        except BulkWriteError as e:
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            return e.details.get("nInserted", 0)
+        return len(result.inserted_ids)
+
+    async def import_sessions(self, docs: List[dict]) -> int:
+        return await self._insert_new(self.db.chat_sessions, docs)
+
+    async def import_messages(self, docs: List[dict]) -> int:
+        session_ids = list({doc['session_id'] for doc in docs})
+        live = {
+            doc['session_id'] for doc in await self.db.chat_sessions.find(
+                {"session_id": {"$in": session_ids}, "deleted_at": {"$exists": False}},
+                {"_id": 0, "session_id": 1}
+            ).to_list(len(session_ids))
+        }
+        return await self._insert_new(self.db.chat_messages, [doc for doc in docs if doc['session_id'] in live])
+
+
+# --- SQLite -----------------------------------------------------------------
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS status_checks (
+    id TEXT PRIMARY KEY,
+    client_name TEXT NOT NULL,
+    timestamp INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    session_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL,
+    summary TEXT,
+    summary_until INTEGER,
+    deleted_at INTEGER
+);
+CREATE INDEX IF NOT EXISTS chat_sessions_updated_at_session_id ON chat_sessions (updated_at, session_id);
+CREATE INDEX IF NOT EXISTS chat_sessions_deleted_at ON chat_sessions (deleted_at) WHERE deleted_at IS NOT NULL;
+CREATE TABLE IF NOT EXISTS chat_messages (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chat_messages_session_id_timestamp_id ON chat_messages (session_id, timestamp, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5(
+    content, content='chat_messages', content_rowid='rowid', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS chat_messages_fts_insert AFTER INSERT ON chat_messages BEGIN
+    INSERT INTO chat_messages_fts (rowid, content) VALUES (new.rowid, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS chat_messages_fts_delete AFTER DELETE ON chat_messages BEGIN
+    INSERT INTO chat_messages_fts (chat_messages_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+END;
+"""
+
+# Datetime columns are stored as integer milliseconds since the epoch, which
+# sort correctly and round-trip the millisecond precision the API uses
+DATETIME_COLUMNS = {"timestamp", "created_at", "updated_at", "summary_until", "deleted_at"}
+SESSION_COLUMNS = ("session_id", "title", "created_at", "updated_at", "summary", "summary_until")
+
+
+def _to_millis(value: Optional[datetime]) -> Optional[int]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+
+def _from_millis(value: Optional[int]) -> Optional[datetime]:
+    if value is None:
+        return None
+    return EPOCH + timedelta(milliseconds=value)
+
+
+def _from_row(row: sqlite3.Row) -> dict:
+    return {
+        key: _from_millis(row[key]) if key in DATETIME_COLUMNS else row[key]
+        for key in row.keys()
+    }
+
+
+class SqliteChatStorage(ChatStorage):
+    """Embedded SQLite storage in WAL mode.
+
+    The connection lives on a single worker thread, so statements run one at
+    a time off the event loop; with WAL and ``synchronous=NORMAL`` a commit
+    does not wait for fsync, which keeps writes in the tens of microseconds.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-storage")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._conn = conn
+        return self._conn
+
+    def _query(self, sql: str, params=()) -> List[dict]:
+        return [_from_row(row) for row in self._connection().execute(sql, params).fetchall()]
+
+    def _write(self, statements: List[Tuple[str, list]]) -> int:
+        """Run ``(sql, rows)`` pairs in one transaction; returns the rows changed"""
+        conn = self._connection()
+        changed = 0
+        with conn:
+            for sql, rows in statements:
+                changed += max(0, conn.executemany(sql, rows).rowcount)
+        return changed
+
+    def _create_schema(self):
+        conn = self._connection()
+        # Files created before soft deletion lack the column the indexes need
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if "chat_sessions" in tables:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(chat_sessions)")}
+            if "deleted_at" not in columns:
+                conn.execute("ALTER TABLE chat_sessions ADD COLUMN deleted_at INTEGER")
+        conn.executescript(SQLITE_SCHEMA)
+        if "chat_messages_fts" not in tables and "chat_messages" in tables:
+            # Index the messages written before search existed. The index follows
+            # message rowids, so also rebuild it after a VACUUM.
+            with conn:
+                conn.execute("INSERT INTO chat_messages_fts (chat_messages_fts) VALUES ('rebuild')")
+
+    async def setup(self):
+        await self._run(self._create_schema)
+
+    async def close(self):
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await self._run(_close)
+        self._executor.shutdown(wait=True)
+
+    async def add_status_check(self, doc: dict):
+        await self._run(self._write, [(
+            "INSERT INTO status_checks (id, client_name, timestamp) VALUES (?, ?, ?)",
+            [(doc['id'], doc['client_name'], _to_millis(doc['timestamp']))],
+        )])
+
+    async def list_status_checks(self, limit: int) -> List[dict]:
+        return await self._run(self._query, "SELECT id, client_name, timestamp FROM status_checks LIMIT ?", (limit,))
+
+    async def create_session(self, doc: dict):
+        await self._run(self._write, [(
+            "INSERT INTO chat_sessions (session_id, title, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            [(doc['session_id'], doc['title'], _to_millis(doc['created_at']), _to_millis(doc['updated_at']))],
+        )])
+
+    async def get_session(self, session_id: str) -> Optional[dict]:
+        rows = await self._run(self._query, "SELECT * FROM chat_sessions WHERE session_id = ?", (session_id,))
+        if not rows:
+            return None
+        return {key: value for key, value in rows[0].items() if value is not None}
+
+    def _page_sql(self, columns: Tuple[str, ...], table: str, where: List[str], params: list,
+                  sort_field: str, id_field: str, limit: int, cursor: Cursor, descending: bool):
+        if cursor is not None:
+            sort_value, tie_breaker = cursor
+            # Row values compare lexicographically, which matches the keyset order
+            where = where + [f"({sort_field}, {id_field}) {'<' if descending else '>'} (?, ?)"]
+            params = params + [_to_millis(sort_value) if isinstance(sort_value, datetime) else sort_value, tie_breaker]
+        direction = "DESC" if descending else "ASC"
+        sql = f"SELECT {', '.join(columns)} FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {sort_field} {direction}, {id_field} {direction} LIMIT ?"
+        return sql, params + [limit]
+
+    async def list_sessions(self, limit: int, cursor: Cursor = None, descending: bool = True) -> List[dict]:
+        sql, params = self._page_sql(
+            SESSION_FIELDS, "chat_sessions", ["deleted_at IS NULL"], [], "updated_at", "session_id",
+            limit, cursor, descending
+        )
+        return await self._run(self._query, sql, params)
+
+    async def list_messages(self, session_id: str, limit: int, cursor: Cursor = None, descending: bool = False) -> List[dict]:
+        sql, params = self._page_sql(
+            MESSAGE_FIELDS, "chat_messages", ["session_id = ?"], [session_id], "timestamp", "id",
+            limit, cursor, descending
+        )
+        return await self._run(self._query, sql, params)
+
+    async def recent_messages(self, session_id: str, limit: int) -> List[dict]:
+        messages = await self._run(
+            self._query,
+            "SELECT role, content, timestamp FROM chat_messages WHERE session_id = ? "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (session_id, limit)
+        )
+        messages.reverse()
+        return messages
+
+    async def search_messages(self, terms: List[str], limit: int, cursor: ScoreCursor = None) -> List[dict]:
+        # bm25() is lower for better matches; it is negated so scores grow with relevance
+        sql = (
+            "SELECT * FROM ("
+            "SELECT m.id, m.session_id, m.role, m.content, m.timestamp, s.title, -bm25(chat_messages_fts) AS score "
+            "FROM chat_messages_fts JOIN chat_messages m ON m.rowid = chat_messages_fts.rowid "
+            "JOIN chat_sessions s ON s.session_id = m.session_id "
+            "WHERE chat_messages_fts MATCH ? AND s.deleted_at IS NULL)"
+        )
+        params: list = [" OR ".join(f'"{term}"' for term in terms)]
+        if cursor is not None:
+            sql += " WHERE score < ? OR (score = ? AND id > ?)"
+            params += [cursor[0], cursor[0], cursor[1]]
+        sql += " ORDER BY score DESC, id ASC LIMIT ?"
+        return await self._run(self._query, sql, params + [limit])
+
+    async def save_turns(self, turns: List[dict]):
+        # Checked inside the write transaction, so a concurrent delete is either before or after it
+        statements = [(
+            "INSERT INTO chat_messages (id, session_id, role, content, timestamp) SELECT ?, ?, ?, ?, ? "
+            "WHERE EXISTS (SELECT 1 FROM chat_sessions WHERE session_id = ? AND deleted_at IS NULL)",
+            [
+                (doc['id'], doc['session_id'], doc['role'], doc['content'], _to_millis(doc['timestamp']), doc['session_id'])
+                for turn in turns for doc in turn['messages']
+            ],
+        )]
+        for turn in turns:
+            update = turn['session_update']
+            unknown = set(update) - set(SESSION_COLUMNS)
+            if unknown:
+                raise ValueError(f"Unknown session fields: {sorted(unknown)}")
+            columns = sorted(update)
+            statements.append((
+                f"UPDATE chat_sessions SET {', '.join(f'{column} = ?' for column in columns)} "
+                "WHERE session_id = ? AND deleted_at IS NULL",
+                [[
+                    _to_millis(update[column]) if column in DATETIME_COLUMNS else update[column]
+                    for column in columns
+                ] + [turn['session_id']]],
+            ))
+        await self._run(self._write, statements)
+
+    async def set_session_titles(self, titles: Dict[str, str], placeholder: str):
+        await self._run(self._write, [(
+            "UPDATE chat_sessions SET title = ? WHERE session_id = ? AND title = ?",
+            [(title, session_id, placeholder) for session_id, title in titles.items()],
+        )])
+
+    async def soft_delete_sessions(self, session_ids: List[str], deleted_at: datetime) -> int:
+        return await self._run(self._write, [(
+            "UPDATE chat_sessions SET deleted_at = ? WHERE session_id = ? AND deleted_at IS NULL",
+            [(_to_millis(deleted_at), session_id) for session_id in session_ids],
+        )])
+
+    async def expire_sessions(self, idle_before: datetime, deleted_at: datetime) -> int:
+        return await self._run(self._write, [(
+            "UPDATE chat_sessions SET deleted_at = ? WHERE updated_at < ? AND deleted_at IS NULL",
+            [(_to_millis(deleted_at), _to_millis(idle_before))],
+        )])
+
+    async def deleted_sessions(self, limit: int) -> List[str]:
+        rows = await self._run(
+            self._query, "SELECT session_id FROM chat_sessions WHERE deleted_at IS NOT NULL LIMIT ?", (limit,)
+        )
+        return [row['session_id'] for row in rows]
+
+    async def purge_messages(self, session_id: str, limit: int) -> int:
+        return await self._run(self._write, [(
+            "DELETE FROM chat_messages WHERE rowid IN "
+            "(SELECT rowid FROM chat_messages WHERE session_id = ? LIMIT ?)",
+            [(session_id, limit)],
+        )])
+
+    async def purge_session(self, session_id: str):
+        await self._run(self._write, [(
+            "DELETE FROM chat_sessions WHERE session_id = ? AND deleted_at IS NOT NULL",
+            [(session_id,)],
+        )])
+
+    async def export_sessions(self, session_id: Optional[str] = None, since: Optional[datetime] = None,
+                              until: Optional[datetime] = None, batch_size: int = 1000) -> AsyncIterator[dict]:
+        where, params = ["deleted_at IS NULL"], []
+        if session_id is not None:
+            where.append("session_id = ?")
+            params.append(session_id)
+        if since is not None:
+            where.append("updated_at >= ?")
+            params.append(_to_millis(since))
+        if until is not None:
+            where.append("created_at < ?")
+            params.append(_to_millis(until))
+        # Keyset batches rather than one open statement, so writes interleave with the export
+        last = ""
+        while True:
+            rows = await self._run(
+                self._query,
+                f"SELECT {', '.join(SESSION_COLUMNS)} FROM chat_sessions WHERE {' AND '.join(where)} AND session_id > ? "
+                "ORDER BY session_id LIMIT ?",
+                params + [last, batch_size]
+            )
+            for row in rows:
+                yield {key: value for key, value in row.items() if value is not None}
+            if len(rows) < batch_size:
+                return
+            last = rows[-1]['session_id']
+
+    async def export_messages(self, session_id: Optional[str] = None, since: Optional[datetime] = None,
+                              until: Optional[datetime] = None, batch_size: int = 1000) -> AsyncIterator[dict]:
+        where, params = [], []
+        if session_id is not None:
+            where.append("session_id = ?")
+            params.append(session_id)
+        if since is not None:
+            where.append("timestamp >= ?")
+            params.append(_to_millis(since))
+        if until is not None:
+            where.append("timestamp < ?")
+            params.append(_to_millis(until))
+        last: Optional[list] = None
+        while True:
+            conditions = where + (["(session_id, timestamp, id) > (?, ?, ?)"] if last else [])
+            sql = f"SELECT {', '.join(MESSAGE_FIELDS)} FROM chat_messages"
+            if conditions:
+                sql += " WHERE " + " AND ".join(conditions)
+            sql += " ORDER BY session_id, timestamp, id LIMIT ?"
+            rows = await self._run(self._query, sql, params + (last or []) + [batch_size])
+            for row in rows:
+                yield row
+            if len(rows) < batch_size:
+                return
+            last = [rows[-1]['session_id'], _to_millis(rows[-1]['timestamp']), rows[-1]['id']]
+
+    async def import_sessions(self, docs: List[dict]) -> int:
+        return await self._run(self._write, [(
+            f"INSERT OR IGNORE INTO chat_sessions ({', '.join(SESSION_COLUMNS)}) VALUES ({', '.join('?' * len(SESSION_COLUMNS))})",
+            [
+                [_to_millis(doc.get(column)) if column in DATETIME_COLUMNS else doc.get(column) for column in SESSION_COLUMNS]
+                for doc in docs
+            ],
+        )])
+
+    async def import_messages(self, docs: List[dict]) -> int:
+        return await self._run(self._write, [(
+            "INSERT OR IGNORE INTO chat_messages (id, session_id, role, content, timestamp) SELECT ?, ?, ?, ?, ? "
+            "WHERE EXISTS (SELECT 1 FROM chat_sessions WHERE session_id = ? AND deleted_at IS NULL)",
+            [
+                (doc['id'], doc['session_id'], doc['role'], doc['content'], _to_millis(doc['timestamp']), doc['session_id'])
+                for doc in docs
+            ],
+        )])
+
+
+# --- Memory -----------------------------------------------------------------
+
+def _message_key(doc: dict):
+    return doc['timestamp'], doc['id']
+
+
+def _session_key(doc: dict):
+    return doc['updated_at'], doc['session_id']
+
+
+class MemoryChatStorage(ChatStorage):
+    """Process-local storage; each worker has its own data and nothing survives a restart"""
+
+    backend = "memory"
+
+    def __init__(self):
+        self._status_checks: List[dict] = []
+        self._sessions: dict = {}
+        # Live (not deleted) sessions, kept sorted by (updated_at, session_id)
+        self._session_index: List[dict] = []
+        # Messages per session, kept sorted by (timestamp, id)
+        self._messages: dict = {}
+        self._messages_by_id: dict = {}
+        self._search_index = InvertedIndex()
+
+    async def add_status_check(self, doc: dict):
+        self._status_checks.append(dict(doc))
+
+    async def list_status_checks(self, limit: int) -> List[dict]:
+        return [dict(doc) for doc in self._status_checks[:limit]]
+
+    async def create_session(self, doc: dict):
+        if doc['session_id'] in self._sessions:
+            raise ValueError(f"Duplicate session_id: {doc['session_id']}")
+        session = dict(doc)
+        self._sessions[doc['session_id']] = session
+        if 'deleted_at' not in session:
+            bisect.insort(self._session_index, session, key=_session_key)
+
+    def _unindex_session(self, session: dict):
+        i = bisect.bisect_left(self._session_index, _session_key(session), key=_session_key)
+        if i < len(self._session_index) and self._session_index[i] is session:
+            del self._session_index[i]
+
+    async def get_session(self, session_id: str) -> Optional[dict]:
+        doc = self._sessions.get(session_id)
+        return dict(doc) if doc is not None else None
+
+    @staticmethod
+    def _page(docs: List[dict], key, fields, limit: int, cursor: Cursor, descending: bool) -> List[dict]:
+        """Slice a list sorted ascending by ``key`` after the cursor, in scan order"""
+        if cursor is None:
+            start, end = 0, len(docs)
+        elif descending:
+            start, end = 0, bisect.bisect_left(docs, tuple(cursor), key=key)
+        else:
+            start, end = bisect.bisect_right(docs, tuple(cursor), key=key), len(docs)
+        if descending:
+            selected = docs[max(start, end - limit):end][::-1]
+        else:
+            selected = docs[start:start + limit]
+        return [_project(doc, fields) for doc in selected]
+
+    async def list_sessions(self, limit: int, cursor: Cursor = None, descending: bool = True) -> List[dict]:
+        return self._page(self._session_index, _session_key, SESSION_FIELDS, limit, cursor, descending)
+
+    async def list_messages(self, session_id: str, limit: int, cursor: Cursor = None, descending: bool = False) -> List[dict]:
+        return self._page(
+            self._messages.get(session_id, []), _message_key, MESSAGE_FIELDS, limit, cursor, descending
+        )
+
+    async def recent_messages(self, session_id: str, limit: int) -> List[dict]:
+        return [_project(doc, HISTORY_FIELDS) for doc in self._messages.get(session_id, [])[-limit:]]
+
+    async def search_messages(self, terms: List[str], limit: int, cursor: ScoreCursor = None) -> List[dict]:
+        hits = []
+        for message_id, score in self._search_index.scores(terms).items():
+            if cursor is not None and (-score, message_id) <= (-cursor[0], cursor[1]):
+                continue
+            doc = self._messages_by_id[message_id]
+            session = self._sessions.get(doc['session_id'])
+            if session is None or 'deleted_at' in session:
+                continue
+            hits.append((-score, message_id, doc, session['title']))
+        return [
+            {**_project(doc, MESSAGE_FIELDS), "title": title, "score": -negated_score}
+            for negated_score, _, doc, title in heapq.nsmallest(limit, hits, key=lambda hit: hit[:2])
+        ]
+
+    def _add_message(self, doc: dict):
+        message = dict(doc)
+        self._messages_by_id[doc['id']] = message
+        self._search_index.add(doc['id'], doc['content'])
+        bisect.insort(self._messages.setdefault(doc['session_id'], []), message, key=_message_key)
+
+    async def save_turns(self, turns: List[dict]):
+        for turn in turns:
+            session = self._sessions.get(turn['session_id'])
+            if session is None or 'deleted_at' in session:
+                continue
+            for doc in turn['messages']:
+                if doc['id'] in self._messages_by_id:
+                    raise ValueError(f"Duplicate message id: {doc['id']}")
+                self._add_message(doc)
+            # Re-position the session under its new updated_at
+            self._unindex_session(session)
+            session.update(turn['session_update'])
+            bisect.insort(self._session_index, session, key=_session_key)
+
+    async def set_session_titles(self, titles: Dict[str, str], placeholder: str):
+        for session_id, title in titles.items():
+            session = self._sessions.get(session_id)
+            if session is not None and session['title'] == placeholder:
+                session['title'] = title
+
+    async def soft_delete_sessions(self, session_ids: List[str], deleted_at: datetime) -> int:
+        marked = 0
+        for session_id in session_ids:
+            session = self._sessions.get(session_id)
+            if session is not None and 'deleted_at' not in session:
+                self._unindex_session(session)
+                session['deleted_at'] = deleted_at
+                marked += 1
+        return marked
+
+    async def expire_sessions(self, idle_before: datetime, deleted_at: datetime) -> int:
+        idle = [
+            session_id for session_id, session in self._sessions.items()
+            if session['updated_at'] < idle_before
+        ]
+        return await self.soft_delete_sessions(idle, deleted_at)
+
+    async def deleted_sessions(self, limit: int) -> List[str]:
+        deleted = (session_id for session_id, session in self._sessions.items() if 'deleted_at' in session)
+        return [session_id for _, session_id in zip(range(limit), deleted)]
+
+    async def purge_messages(self, session_id: str, limit: int) -> int:
+        messages = self._messages.get(session_id, [])
+        purged, self._messages[session_id] = messages[:limit], messages[limit:]
+        for doc in purged:
+            del self._messages_by_id[doc['id']]
+            self._search_index.remove(doc['id'], doc['content'])
+        if not self._messages[session_id]:
+            del self._messages[session_id]
+        return len(purged)
+
+    async def purge_session(self, session_id: str):
+        session = self._sessions.get(session_id)
+        if session is not None and 'deleted_at' in session:
+            del self._sessions[session_id]
+
+    async def export_sessions(self, session_id: Optional[str] = None, since: Optional[datetime] = None,
+                              until: Optional[datetime] = None, batch_size: int = 1000) -> AsyncIterator[dict]:
+        for key in sorted(self._sessions) if session_id is None else [session_id]:
+            session = self._sessions.get(key)
+            if session is None or 'deleted_at' in session:
+                continue
+            if (since is None or session['updated_at'] >= since) and (until is None or session['created_at'] < until):
+                yield dict(session)
+
+    async def export_messages(self, session_id: Optional[str] = None, since: Optional[datetime] = None,
+                              until: Optional[datetime] = None, batch_size: int = 1000) -> AsyncIterator[dict]:
+        for key in sorted(self._messages) if session_id is None else [session_id]:
+            for doc in self._messages.get(key, []):
+                if (since is None or doc['timestamp'] >= since) and (until is None or doc['timestamp'] < until):
+                    yield _project(doc, MESSAGE_FIELDS)
+
+    async def import_sessions(self, docs: List[dict]) -> int:
+        inserted = 0
+        for doc in docs:
+            if doc['session_id'] not in self._sessions:
+                await self.create_session(doc)
+                inserted += 1
+        return inserted
+
+    async def import_messages(self, docs: List[dict]) -> int:
+        inserted = 0
+        for doc in docs:
+            session = self._sessions.get(doc['session_id'])
+            if doc['id'] in self._messages_by_id or session is None or 'deleted_at' in session:
+                continue
+            self._add_message(doc)
+            inserted += 1
+        return inserted
@@ -0,0 +1,79 @@
+"""Session titles generated from the first exchange of a conversation.
+
+Titles are produced off the request path: the chat turn only queues a job,
+and a background worker turns batches of jobs into titles, either with a
+cheap heuristic or a short LLM call (falling back to the heuristic when the
+call fails).
+"""
+
+import logging
+import re
+from typing import Dict, List
+
+from llm_clients import LlmProvider
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TITLE = "New Chat"
+
+TITLE_PROMPT = (
+    "Write a title of at most six words for a conversation that starts with the "
+    "message below. Reply with the title only, without quotes.\n\nMessage: {message}"
+)
+
+_MARKUP = re.compile(r"[`*_#>\[\]\"]+")
+_SPACE = re.compile(r"\s+")
+
+
+def heuristic_title(message: str, max_chars: int = 40) -> str:
+    """First sentence of ``message``, cleaned up and cut at a word boundary"""
+    text = _SPACE.sub(" ", _MARKUP.sub("", message)).strip()
+    text = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0].rstrip(".!?,;: ")
+    if len(text) > max_chars:
+        cut = text[:max_chars].rsplit(" ", 1)[0] or text[:max_chars]
+        text = cut.rstrip(".,;: ") + "…"
+    return text[:1].upper() + text[1:]
+
+
+class TitleGenerator:
+    """Titles for batches of ``{"session_id", "user_text", "assistant_text"}`` jobs.
+
+    ``mode`` is "heuristic" or "llm".
+    """
+
+    def __init__(self, mode: str, provider: LlmProvider, max_chars: int = 40):
+        self.mode = mode
+        self.provider = provider
+        self.max_chars = max_chars
+        self.llm_failures = 0
+
+    async def _llm_title(self, job: dict) -> str:
+        reply = await self.provider.complete(
+            f"title-{job['session_id']}",
+            [{"role": "user", "content": TITLE_PROMPT.format(message=job['user_text'][:1000])}]
+        )
+        return heuristic_title(reply.strip().splitlines()[0] if reply.strip() else "", self.max_chars)
+
+    async def title(self, job: dict) -> str:
+        if self.mode == "llm":
+            try:
+                title = await self._llm_title(job)
+                if title:
+                    return title
+            except Exception as e:
+                self.llm_failures += 1
+                logger.error(f"Error generating title for session {job['session_id']}: {str(e)}")
+        return heuristic_title(job['user_text'], self.max_chars)
+
+    async def titles(self, jobs: List[dict]) -> Dict[str, str]:
+        """Titles by session_id; jobs that yield no usable title are left out.
+
+        LLM titles are generated one at a time, so the worker adds at most one
+        model call to the load from user turns.
+        """
+        titles = {}
+        for job in jobs:
+            title = await self.title(job)
+            if title:
+                titles[job['session_id']] = title
+        return titles
@@ -0,0 +1,204 @@
+"""Serialization of concurrent chat turns per session.
+
+Two turns for the same session must not overlap: both would read the same
+history, pay for an LLM call, and interleave their message inserts. Turns of
+different sessions never wait on each other. Inside one process an
+``asyncio.Lock`` per session orders turns; with several workers a lease
+document in MongoDB additionally makes sure only one worker runs a turn for
+the session at a time.
+
+Policies for a turn that arrives while another is running:
+
+- ``queue``: wait (up to ``wait_timeout``) and run afterwards
+- ``reject``: fail immediately with ``TurnRejected``
+- ``merge``: if the running turn has the same message (double submit),
+  share its result; otherwise queue
+"""
+
+import asyncio
+import logging
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("queue", "reject", "merge")
+
+
+class TurnRejected(Exception):
+    """Raised when a turn cannot run because another one holds the session"""
+
+
+class MongoSessionLease:
+    """Cross-worker session lease stored as ``{_id: session_id, owner, expires_at}``.
+
+    Leases expire after ``ttl`` seconds so a crashed worker cannot block a
+    session forever; a TTL index removes expired documents.
+    """
+
+    def __init__(self, collection, ttl: float = 180.0):
+        self.collection = collection
+        self.ttl = ttl
+        self.owner = str(uuid.uuid4())
+
+    async def ensure_indexes(self):
+        await self.collection.create_indexes([
+            IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        ])
+
+    async def try_acquire(self, session_id: str) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            # Matches a free (expired) or own lease; otherwise the upsert hits the existing _id
+            await self.collection.update_one(
+                {"_id": session_id, "$or": [{"expires_at": {"$lte": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.ttl)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def release(self, session_id: str):
+        await self.collection.delete_one({"_id": session_id, "owner": self.owner})
+
+
+class SessionTurnScheduler:
+    def __init__(
+        self,
+        policy: str = "queue",
+        lease: Optional[MongoSessionLease] = None,
+        wait_timeout: float = 120.0,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown turn policy {policy!r}; expected one of {', '.join(POLICIES)}")
+        self.policy = policy
+        self.lease = lease
+        self.wait_timeout = wait_timeout
+        # session_id -> [lock, number of turns holding or waiting for it]
+        self._locks: Dict[str, list] = {}
+        # (session_id, message) -> future of the running turn, for merge
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.queued = 0
+        self.rejected = 0
+        self.merged = 0
+
+    async def acquire(self, session_id: str):
+        """Wait for (or, with the reject policy, demand) exclusive use of a session"""
+        entry = self._locks.setdefault(session_id, [asyncio.Lock(), 0])
+        lock = entry[0]
+        if lock.locked() and self.policy == "reject":
+            self.rejected += 1
+            raise TurnRejected("Another turn for this session is in progress")
+
+        entry[1] += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait_timeout
+        try:
+            if not lock.locked():
+                # Uncontended acquire completes without yielding to the loop
+                await lock.acquire()
+            else:
+                self.queued += 1
+                await asyncio.wait_for(lock.acquire(), timeout=self.wait_timeout)
+        except asyncio.TimeoutError:
+            self._forget(session_id)
+            self.rejected += 1
+            raise TurnRejected("Timed out waiting for the previous turn of this session")
+        except BaseException:
+            self._forget(session_id)
+            raise
+
+        if self.lease is None:
+            return
+        try:
+            await self._acquire_lease(session_id, deadline)
+        except BaseException:
+            lock.release()
+            self._forget(session_id)
+            raise
+
+    async def _acquire_lease(self, session_id: str, deadline: float):
+        loop = asyncio.get_running_loop()
+        delay = 0.05
+        while not await self.lease.try_acquire(session_id):
+            if self.policy == "reject" or loop.time() + delay > deadline:
+                self.rejected += 1
+                raise TurnRejected("Another worker is running a turn for this session")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    async def release(self, session_id: str):
+        entry = self._locks.get(session_id)
+        if entry is None:
+            return
+        try:
+            if self.lease is not None:
+                await self.lease.release(session_id)
+        except Exception as e:
+            # The lease expires on its own; never leave the local lock held
+            logger.error(f"Error releasing session lease for {session_id}: {str(e)}")
+        finally:
+            entry[0].release()
+            self._forget(session_id)
+
+    def _forget(self, session_id: str):
+        entry = self._locks.get(session_id)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self._locks[session_id]
+
+    @asynccontextmanager
+    async def turn(self, session_id: str):
+        await self.acquire(session_id)
+        try:
+            yield
+        finally:
+            await self.release(session_id)
+
+    async def run(self, session_id: str, message: str, turn: Callable[[], Awaitable]):
+        """Run ``turn`` exclusively for the session, coalescing duplicates under merge"""
+        if self.policy != "merge":
+            async with self.turn(session_id):
+                return await turn()
+
+        key = (session_id, message)
+        running = self._inflight.get(key)
+        if running is not None:
+            self.merged += 1
+            return await asyncio.shield(running)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            async with self.turn(session_id):
+                result = await turn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception retrieved when nobody merged into this turn
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "policy": self.policy,
+            "lease": "mongo" if self.lease is not None else "local",
+            "active_sessions": len(self._locks),
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "merged": self.merged,
+        }
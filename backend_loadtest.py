@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Offline Concurrent Load Test for AI Chatbot
+Drives N virtual users through the ChatbotAPITester scenarios (create session,
+multi-turn chat, list sessions, fetch messages, delete) against a locally
+launched backend that answers with the fake LLM provider, and reports throughput and
+latency percentiles per endpoint.
+
+Usage:
+    # Launch a local server (fake LLM, local MongoDB) and run 20 users
+    python backend_loadtest.py --users 20 --iterations 5
+
+    # No MongoDB at hand: in-memory or embedded SQLite storage
+    python backend_loadtest.py --storage memory
+    python backend_loadtest.py --storage sqlite
+
+    # Compare against an earlier run and fail on p95 regressions over 20%
+    python backend_loadtest.py --compare test_reports/loadtest/baseline.json
+
+    # Drive an already running server instead
+    python backend_loadtest.py --base-url http://localhost:8001
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+ROOT_DIR = Path(__file__).parent
+BACKEND_DIR = ROOT_DIR / "backend"
+REPORT_DIR = ROOT_DIR / "test_reports" / "loadtest"
+
+# Multi-turn conversation modelled on ChatbotAPITester.test_context_memory
+CONVERSATION = [
+    "Hello! My name is Alice and I love programming in Python.",
+    "What's my name and what do I love?",
+    "Can you suggest a small project I could build this weekend?",
+    "How long would that take a beginner?",
+    "Thanks! Summarize what we talked about.",
+]
+
+
+class LoadTestRecorder:
+    """Collects per-endpoint latency samples and errors"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    async def request(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.errors[name] += 1
+            self.statuses[name][0] += 1
+            print(f"❌ {name}: {type(e).__name__}: {e}")
+            return None
+        self.samples[name].append((time.perf_counter() - start) * 1000)
+        self.statuses[name][response.status_code] += 1
+        if response.status_code >= 400:
+            self.errors[name] += 1
+        return response
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name in sorted(set(self.samples) | set(self.errors)):
+            samples = sorted(self.samples[name])
+            endpoints[name] = {
+                "requests": len(samples) + self.statuses[name].get(0, 0),
+                "errors": self.errors[name],
+                "statuses": {str(code): count for code, count in sorted(self.statuses[name].items())},
+                "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(samples, 0.50),
+                "p95_ms": percentile(samples, 0.95),
+                "p99_ms": percentile(samples, 0.99),
+                "max_ms": samples[-1] if samples else 0.0,
+                "mean_ms": statistics.fmean(samples) if samples else 0.0,
+            }
+        total = sum(e["requests"] for e in endpoints.values())
+        return {
+            "elapsed_seconds": elapsed,
+            "total_requests": total,
+            "total_errors": sum(e["errors"] for e in endpoints.values()),
+            "throughput_rps": total / elapsed if elapsed else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    # Nearest rank: the smallest sample with at least q of the samples at or below it
+    rank = min(len(sorted_samples), max(1, math.ceil(q * len(sorted_samples))))
+    return sorted_samples[rank - 1]
+
+
+async def virtual_user(client: httpx.AsyncClient, recorder: LoadTestRecorder, api_base: str, iterations: int, turns: int):
+    """One user repeating the ChatbotAPITester flow"""
+    for _ in range(iterations):
+        await recorder.request(client, "GET /api/", "GET", f"{api_base}/")
+
+        response = await recorder.request(client, "POST /api/chat/sessions", "POST", f"{api_base}/chat/sessions")
+        if response is None or response.status_code != 200:
+            continue
+        session_id = response.json()["session_id"]
+
+        for turn in range(turns):
+            await recorder.request(
+                client, "POST /api/chat", "POST", f"{api_base}/chat",
+                json={"message": CONVERSATION[turn % len(CONVERSATION)], "session_id": session_id}
+            )
+
+        await recorder.request(client, "GET /api/chat/sessions", "GET", f"{api_base}/chat/sessions")
+        await recorder.request(
+            client, "GET /api/chat/sessions/{id}/messages", "GET",
+            f"{api_base}/chat/sessions/{session_id}/messages"
+        )
+        await recorder.request(
+            client, "DELETE /api/chat/sessions/{id}", "DELETE",
+            f"{api_base}/chat/sessions/{session_id}"
+        )
+
+
+async def run_load(base_url: str, users: int, iterations: int, turns: int, timeout: float) -> dict:
+    recorder = LoadTestRecorder()
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            virtual_user(client, recorder, f"{base_url}/api", iterations, turns)
+            for _ in range(users)
+        ))
+        elapsed = time.perf_counter() - start
+    return recorder.report(elapsed)
+
+
+# --- Local server -----------------------------------------------------------
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Local server exited with code {process.returncode}")
+            try:
+                if (await client.get(f"{base_url}/api/")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Local server did not become ready")
+
+
+def launch_local_server(args) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "MONGO_URL": os.environ.get("MONGO_URL", "mongodb://localhost:27017"),
+        "DB_NAME": args.db_name,
+        "STORAGE_BACKEND": args.storage,
+        "SQLITE_PATH": args.sqlite_path,
+        "CHECK_QUERY_PLANS": "false",
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_TTFT_MS": str(args.llm_ttft_ms),
+        "FAKE_LLM_TOKENS_PER_SECOND": str(args.llm_tokens_per_second),
+        "FAKE_LLM_REPLY_TOKENS": str(args.llm_tokens),
+        "FAKE_LLM_JITTER": str(args.llm_jitter),
+        "FAKE_LLM_ERROR_RATE": str(args.llm_error_rate),
+    }
+    command = [
+        sys.executable, "-m", "uvicorn", "server:app",
+        "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning",
+    ]
+    return subprocess.Popen(command, env=env, cwd=BACKEND_DIR)
+
+
+async def drop_database(db_name: str):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    try:
+        await client.drop_database(db_name)
+    finally:
+        client.close()
+
+
+# --- Reporting --------------------------------------------------------------
+
+def print_report(report: dict):
+    print("\n" + "=" * 96)
+    print("📊 LOAD TEST SUMMARY")
+    print("=" * 96)
+    print(f"{'endpoint':<40} {'reqs':>6} {'errs':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, stats in report["endpoints"].items():
+        print(
+            f"{name:<40} {stats['requests']:>6} {stats['errors']:>5} {stats['throughput_rps']:>8.1f} "
+            f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f}"
+        )
+    print(
+        f"\nTotal: {report['total_requests']} requests, {report['total_errors']} errors, "
+        f"{report['throughput_rps']:.1f} req/s in {report['elapsed_seconds']:.1f}s (latencies in ms)"
+    )
+
+
+def compare_reports(baseline: dict, current: dict, max_regression: float) -> List[str]:
+    """Return the endpoints whose p95 latency regressed by more than ``max_regression``"""
+    regressions = []
+    print(f"\n{'endpoint':<40} {'base p95':>10} {'p95':>10} {'change':>8}")
+    for name, stats in current["endpoints"].items():
+        base = baseline["endpoints"].get(name)
+        if not base or not base["p95_ms"]:
+            continue
+        change = (stats["p95_ms"] - base["p95_ms"]) / base["p95_ms"]
+        flag = ""
+        if change > max_regression:
+            regressions.append(name)
+            flag = " ❌"
+        print(f"{name:<40} {base['p95_ms']:>10.1f} {stats['p95_ms']:>10.1f} {change:>+7.0%}{flag}")
+    return regressions
+
+
+async def main_async(args) -> int:
+    process = None
+    base_url = args.base_url
+    if base_url is None:
+        args.port = args.port or free_port()
+        base_url = f"http://127.0.0.1:{args.port}"
+        process = launch_local_server(args)
+
+    try:
+        if process is not None:
+            await wait_until_ready(base_url, process)
+        print(f"🚀 {args.users} users x {args.iterations} iterations x {args.turns} turns against {base_url}")
+        report = await run_load(base_url, args.users, args.iterations, args.turns, args.timeout)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+            if args.storage == "mongo":
+                await drop_database(args.db_name)
+            elif args.storage == "sqlite":
+                for suffix in ("", "-wal", "-shm"):
+                    Path(args.sqlite_path + suffix).unlink(missing_ok=True)
+
+    report.update({
+        "timestamp": datetime.now().isoformat(),
+        "config": {
+            "users": args.users,
+            "iterations": args.iterations,
+            "turns": args.turns,
+            "base_url": args.base_url or "local",
+            "storage": args.storage if args.base_url is None else None,
+            "llm_ttft_ms": args.llm_ttft_ms,
+            "llm_tokens_per_second": args.llm_tokens_per_second,
+            "llm_tokens": args.llm_tokens,
+            "llm_error_rate": args.llm_error_rate,
+        },
+    })
+    print_report(report)
+
+    output = Path(args.output) if args.output else REPORT_DIR / f"loadtest_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results saved to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_reports(json.load(f), report, args.max_regression)
+        if regressions:
+            print(f"\n❌ p95 regressed by more than {args.max_regression:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0 if report["total_errors"] == 0 else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline concurrent load test for the chatbot backend")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--iterations", type=int, default=3, help="scenario repetitions per user")
+    parser.add_argument("--turns", type=int, default=3, help="chat turns per session")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout in seconds")
+    parser.add_argument("--base-url", help="drive a running server instead of launching one")
+    parser.add_argument("--storage", choices=["mongo", "sqlite", "memory"], default="mongo",
+                        help="storage backend of the local server (mongo uses MONGO_URL)")
+    parser.add_argument("--sqlite-path", default=str(ROOT_DIR / "test_reports" / "loadtest" / "loadtest.db"),
+                        help="database file for --storage sqlite (deleted afterwards)")
+    parser.add_argument("--db-name", default="chatbot_loadtest", help="database used (and dropped) by the local server")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--llm-ttft-ms", type=float, default=300.0, help="fake LLM time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--llm-tokens", type=int, default=50, help="tokens in each fake reply")
+    parser.add_argument("--llm-jitter", type=float, default=0.1, help="timing spread as a fraction, e.g. 0.1 = ±10%%")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of fake LLM calls that fail")
+    parser.add_argument("--output", help="results file (default: test_reports/loadtest/loadtest_<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare p95 latencies against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 increase, e.g. 0.2 = 20%%")
+    args = parser.parse_args()
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
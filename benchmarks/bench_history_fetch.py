@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-turn history read of POST /api/chat against a local MongoDB.
+
+Seeds sessions of growing length and times the old full-history read
+(sort ascending, to_list(1000), keep the last 10) against the bounded read
+(sort descending, limit N, reverse). The bounded read should stay flat as
+the session grows.
+
+Usage:
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_history_fetch.py
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, IndexModel
+
+
+async def seed_session(collection, size: int) -> str:
+    session_id = str(uuid.uuid4())
+    # Native BSON dates at millisecond precision, as the server stores them
+    now = datetime.now(timezone.utc)
+    start = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    docs = []
+    for i in range(size):
+        docs.append({
+            "id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"Message {i} " + "lorem ipsum dolor sit amet " * 20,
+            "timestamp": start + timedelta(milliseconds=i),
+        })
+    for i in range(0, len(docs), 1000):
+        await collection.insert_many(docs[i:i + 1000])
+    return session_id
+
+
+async def full_history(collection, session_id: str, window: int):
+    messages = await collection.find(
+        {"session_id": session_id},
+        {"_id": 0}
+    ).sort("timestamp", 1).to_list(1000)
+    context = [f"{m['role']}: {m['content']}" for m in messages]
+    return context[-window:]
+
+
+async def bounded_history(collection, session_id: str, window: int):
+    messages = await collection.find(
+        {"session_id": session_id},
+        {"_id": 0, "role": 1, "content": 1, "timestamp": 1}
+    ).sort("timestamp", -1).limit(window).to_list(window)
+    messages.reverse()
+    return [f"{m['role']}: {m['content']}" for m in messages]
+
+
+async def time_loader(loader, collection, session_id: str, window: int, iterations: int) -> float:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await loader(collection, session_id, window)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="10,100,1000,5000", help="comma separated session lengths")
+    parser.add_argument("--window", type=int, default=int(os.environ.get("CHAT_CONTEXT_MESSAGES", "10")))
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client["bench_history_fetch"]
+    collection = db.chat_messages
+    await collection.drop()
+    await collection.create_indexes([
+        IndexModel([("session_id", ASCENDING), ("timestamp", ASCENDING)], name="session_id_timestamp"),
+    ])
+
+    print(f"{'messages':>10} {'full (ms)':>12} {'bounded (ms)':>14}")
+    try:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            session_id = await seed_session(collection, size)
+            full_ms = await time_loader(full_history, collection, session_id, args.window, args.iterations)
+            bounded_ms = await time_loader(bounded_history, collection, session_id, args.window, args.iterations)
+            print(f"{size:>10} {full_ms:>12.2f} {bounded_ms:>14.2f}")
+    finally:
+        await client.drop_database("bench_history_fetch")
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
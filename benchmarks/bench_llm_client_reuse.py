@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Benchmark EmergentLlmProvider.complete() with and without HTTP connection reuse.
+
+A local stand-in for the Anthropic Messages API answers every call with a
+canned completion after an optional delay, and the provider is pointed at it
+through ``api_base``. Both runs go through the provider's real code path
+(litellm.acompletion):
+
+- ``per-request``: litellm's cached HTTP clients are dropped before every
+  call, so each one builds a new client and opens a new connection, as a
+  client created per request would
+- ``shared``: the provider as deployed; litellm reuses its cached
+  per-provider client and keeps connections alive
+
+The stand-in counts the TCP connections it accepts, so the output shows
+whether connections were really reused. Against a real provider each new
+connection also pays a TLS handshake, so the gap there is larger. Needs
+litellm (see backend/requirements.txt).
+
+Usage:
+    python benchmarks/bench_llm_client_reuse.py --requests 500 --concurrency 10
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+from llm_clients import EmergentLlmProvider  # noqa: E402
+
+COMPLETION = json.dumps({
+    "id": "msg_local",
+    "type": "message",
+    "role": "assistant",
+    "model": "stand-in",
+    "content": [{"type": "text", "text": "Hello from the local stand-in."}],
+    "stop_reason": "end_turn",
+    "stop_sequence": None,
+    "usage": {"input_tokens": 12, "output_tokens": 8},
+}).encode()
+
+
+class StandIn:
+    """Minimal HTTP/1.1 keep-alive Messages API responder"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.connections = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = head.decode("latin-1").lower()
+                length = 0
+                for line in headers.split("\r\n"):
+                    if line.startswith("content-length:"):
+                        length = int(line.split(":", 1)[1])
+                if length:
+                    await reader.readexactly(length)
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(COMPLETION)}\r\n\r\n".encode()
+                    + COMPLETION
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+async def run(provider: EmergentLlmProvider, stand_in: StandIn, total: int, concurrency: int, reuse: bool) -> dict:
+    import litellm
+
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+    connections_before = stand_in.connections
+
+    async def one(i: int):
+        async with semaphore:
+            if not reuse:
+                litellm.in_memory_llm_clients_cache.flush_cache()
+            start = time.perf_counter()
+            await provider.complete(f"bench-{i}", [{"role": "user", "content": "hi"}])
+            samples.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+
+    samples.sort()
+    return {
+        "throughput_rps": total / elapsed,
+        "p50_ms": statistics.median(samples),
+        "p99_ms": samples[int(len(samples) * 0.99) - 1],
+        "connections": stand_in.connections - connections_before,
+    }
+
+
+async def stop_litellm_logging():
+    """Drain and stop litellm's background logging task, which otherwise keeps asyncio.run from returning"""
+    try:
+        from litellm.litellm_core_utils.logging_worker import GLOBAL_LOGGING_WORKER
+    except ImportError:
+        return
+    await GLOBAL_LOGGING_WORKER.flush()
+    await GLOBAL_LOGGING_WORKER.stop()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="simulated provider latency")
+    args = parser.parse_args()
+
+    stand_in = StandIn(args.delay_ms / 1000)
+    server = await asyncio.start_server(stand_in.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    provider = EmergentLlmProvider(
+        api_key="bench", provider="anthropic", model="bench", system_message="bench",
+        api_base=f"http://127.0.0.1:{port}"
+    )
+
+    await provider.start()
+    try:
+        # Warm up both paths before measuring
+        await run(provider, stand_in, 20, args.concurrency, reuse=False)
+        await run(provider, stand_in, 20, args.concurrency, reuse=True)
+        results = {
+            "per-request": await run(provider, stand_in, args.requests, args.concurrency, reuse=False),
+            "shared": await run(provider, stand_in, args.requests, args.concurrency, reuse=True),
+        }
+    finally:
+        await provider.close()
+        await stop_litellm_logging()
+        # Not wait_closed(): the dropped per-request clients never close their connections
+        server.close()
+
+    print(f"{'client':>11} {'req/s':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'connections':>12}")
+    for name, result in results.items():
+        print(
+            f"{name:>11} {result['throughput_rps']:>10.1f} {result['p50_ms']:>10.2f} "
+            f"{result['p99_ms']:>10.2f} {result['connections']:>12}"
+        )
+    saved = results["per-request"]["p50_ms"] - results["shared"]["p50_ms"]
+    print(f"per-request overhead saved by reuse: {saved:.2f}ms (p50)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
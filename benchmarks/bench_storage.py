@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark the storage operations behind each chat request on every backend.
+
+Runs the same workload against the memory, SQLite and (when MONGO_URL is
+set) MongoDB backends: create sessions, save turns, read the history window,
+page through sessions and messages, then delete and purge the sessions.
+Prints the median and p95 latency of each operation per backend.
+
+Usage:
+    python benchmarks/bench_storage.py
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_storage.py --sessions 200 --turns 20
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+from storage import MemoryChatStorage, MongoChatStorage, SqliteChatStorage  # noqa: E402
+
+
+async def timed(samples: list, coro):
+    start = time.perf_counter()
+    result = await coro
+    samples.append((time.perf_counter() - start) * 1000)
+    return result
+
+
+async def run_workload(storage, sessions: int, turns: int, window: int) -> dict:
+    samples = defaultdict(list)
+    start = datetime.now(timezone.utc).replace(microsecond=0)
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+
+    for i, session_id in enumerate(session_ids):
+        at = start + timedelta(seconds=i)
+        await timed(samples["create_session"], storage.create_session(
+            {"session_id": session_id, "title": "New Chat", "created_at": at, "updated_at": at}
+        ))
+
+    for t in range(turns):
+        for i, session_id in enumerate(session_ids):
+            at = start + timedelta(seconds=i, milliseconds=2 * t)
+            messages = [
+                {"id": str(uuid.uuid4()), "session_id": session_id, "role": role,
+                 "content": f"{role} message {t} " + "lorem ipsum dolor sit amet " * 10,
+                 "timestamp": at + timedelta(milliseconds=offset)}
+                for offset, role in enumerate(("user", "assistant"))
+            ]
+            await timed(samples["recent_messages"], storage.recent_messages(session_id, window))
+            await timed(samples["get_session"], storage.get_session(session_id))
+            await timed(samples["save_turn"], storage.save_turns([{
+                "session_id": session_id,
+                "messages": messages,
+                "session_update": {"updated_at": messages[-1]["timestamp"]},
+            }]))
+
+    for session_id in session_ids:
+        await timed(samples["list_sessions"], storage.list_sessions(100))
+        await timed(samples["list_messages"], storage.list_messages(session_id, 100))
+
+    for session_id in session_ids:
+        await timed(samples["soft_delete"], storage.soft_delete_sessions([session_id], start))
+    for session_id in session_ids:
+        await timed(samples["purge_messages"], storage.purge_messages(session_id, 500))
+        await storage.purge_session(session_id)
+    return samples
+
+
+def summarize(samples: list) -> str:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"{statistics.median(ordered):>8.3f} {p95:>8.3f}"
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=10, help="turns saved per session")
+    parser.add_argument("--window", type=int, default=int(os.environ.get("CHAT_CONTEXT_MESSAGES", "10")) + 2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = {
+            "memory": MemoryChatStorage(),
+            "sqlite": SqliteChatStorage(os.path.join(tmp, "bench.db")),
+        }
+        if os.environ.get("MONGO_URL"):
+            backends["mongo"] = MongoChatStorage(os.environ["MONGO_URL"], "bench_storage")
+
+        print(f"{'backend':<8} {'operation':<16} {'p50 (ms)':>8} {'p95 (ms)':>8}")
+        for name, storage in backends.items():
+            await storage.setup()
+            try:
+                samples = await run_workload(storage, args.sessions, args.turns, args.window)
+            finally:
+                if name == "mongo":
+                    await storage.client.drop_database("bench_storage")
+                await storage.close()
+            for operation, values in samples.items():
+                print(f"{name:<8} {operation:<16} {summarize(values)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,7 @@
 import streamlit as st
 import requests
+import json
+from requests.adapters import HTTPAdapter
 import os
 from datetime import datetime
 
@@ -14,6 +16,18 @@ st.set_page_config(
 BACKEND_URL = os.environ.get('BACKEND_URL', 'http://localhost:8001')
 API_BASE = f"{BACKEND_URL}/api"
 
+# Sessions fetched per sidebar page; "Load more" follows the next cursor
+SESSION_PAGE_SIZE = 50
+MESSAGE_PAGE_SIZE = 500
+
+# (connect, read) timeouts in seconds; chat turns wait for the model
+REQUEST_TIMEOUT = (3.05, 15)
+CHAT_TIMEOUT = (3.05, 120)
+
+# How long fetched lists are reused; mutations made here clear them sooner
+SESSION_CACHE_TTL = 30
+MESSAGE_CACHE_TTL = 300
+
 # Custom CSS
 st.markdown("""
 <style>
@@ -46,36 +60,105 @@ if 'messages' not in st.session_state:
     st.session_state.messages = []
 if 'sessions' not in st.session_state:
     st.session_state.sessions = []
+if 'sessions_cursor' not in st.session_state:
+    st.session_state.sessions_cursor = None
+if 'streaming_supported' not in st.session_state:
+    st.session_state.streaming_supported = True
+
+@st.cache_resource
+def get_http_session():
+    """Keep-alive connection pool shared by every script run"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
-def load_sessions():
-    """Load all chat sessions from backend"""
+http = get_http_session()
+
+@st.cache_data(ttl=SESSION_CACHE_TTL, show_spinner=False)
+def fetch_sessions(cursor=None):
+    """One page of sessions and the cursor of the next page (None on the last one)"""
+    params = {"limit": SESSION_PAGE_SIZE}
+    if cursor:
+        params["before"] = cursor
+    response = http.get(
+        f"{API_BASE}/chat/sessions",
+        params=params,
+        timeout=REQUEST_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json(), response.headers.get("X-Next-Cursor")
+
+@st.cache_data(ttl=MESSAGE_CACHE_TTL, show_spinner=False)
+def fetch_messages(session_id):
+    messages = []
+    params = {"limit": MESSAGE_PAGE_SIZE}
+    while True:
+        response = http.get(
+            f"{API_BASE}/chat/sessions/{session_id}/messages",
+            params=params,
+            timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+        messages.extend(response.json())
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if not next_cursor:
+            return messages
+        params = {"limit": MESSAGE_PAGE_SIZE, "after": next_cursor}
+
+def load_sessions(refresh=False):
+    """Load the first page of chat sessions (cached for SESSION_CACHE_TTL seconds)"""
+    if refresh:
+        fetch_sessions.clear()
     try:
-        response = requests.get(f"{API_BASE}/chat/sessions")
-        if response.status_code == 200:
-            st.session_state.sessions = response.json()
+        st.session_state.sessions, st.session_state.sessions_cursor = fetch_sessions()
     except Exception as e:
         st.error(f"Error loading sessions: {str(e)}")
 
+def load_more_sessions():
+    """Append the next page of sessions to the sidebar"""
+    try:
+        page, st.session_state.sessions_cursor = fetch_sessions(st.session_state.sessions_cursor)
+    except Exception as e:
+        st.error(f"Error loading sessions: {str(e)}")
+        return
+    # Sessions touched here since the first page was loaded are already listed
+    shown = {s['session_id'] for s in st.session_state.sessions}
+    st.session_state.sessions = st.session_state.sessions + [
+        s for s in page if s['session_id'] not in shown
+    ]
+
 def load_messages(session_id):
-    """Load messages for a specific session"""
+    """Load messages for a specific session (cached for MESSAGE_CACHE_TTL seconds)"""
     try:
-        response = requests.get(f"{API_BASE}/chat/sessions/{session_id}/messages")
-        if response.status_code == 200:
-            return response.json()
-        return []
+        return list(fetch_messages(session_id))
     except Exception as e:
         st.error(f"Error loading messages: {str(e)}")
         return []
 
+def touch_session(session_id, updated_at):
+    """Move a session to the top of the sidebar after a turn, without refetching the list"""
+    sessions = st.session_state.sessions
+    current = next((s for s in sessions if s['session_id'] == session_id), None)
+    if current is None:
+        return
+    current = {**current, "updated_at": updated_at}
+    st.session_state.sessions = [current] + [s for s in sessions if s['session_id'] != session_id]
+    # Cached lists are now stale; the next explicit load refetches them
+    fetch_sessions.clear()
+    fetch_messages.clear()
+
 def create_new_session():
     """Create a new chat session"""
     try:
-        response = requests.post(f"{API_BASE}/chat/sessions")
+        response = http.post(f"{API_BASE}/chat/sessions", timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
             session = response.json()
             st.session_state.current_session_id = session['session_id']
             st.session_state.messages = []
-            load_sessions()
+            st.session_state.sessions = [session] + st.session_state.sessions
+            fetch_sessions.clear()
             return True
         return False
     except Exception as e:
@@ -89,7 +172,7 @@ def send_message(message, session_id=None):
             "message": message,
             "session_id": session_id
         }
-        response = requests.post(f"{API_BASE}/chat", json=payload)
+        response = http.post(f"{API_BASE}/chat", json=payload, timeout=CHAT_TIMEOUT)
         if response.status_code == 200:
             return response.json()
         else:
@@ -99,12 +182,46 @@ def send_message(message, session_id=None):
         st.error(f"Error sending message: {str(e)}")
         return None
 
+def open_stream(message, session_id):
+    """Start a streamed chat turn; returns None when the backend has no streaming endpoint"""
+    response = http.post(
+        f"{API_BASE}/chat/stream",
+        json={"message": message, "session_id": session_id},
+        stream=True,
+        timeout=CHAT_TIMEOUT
+    )
+    if response.status_code in (404, 405):
+        response.close()
+        return None
+    response.raise_for_status()
+    return response
+
+def stream_tokens(response, result):
+    """Yield token text from a chat SSE stream; the final ``done`` payload lands in ``result``"""
+    event = None
+    with response:
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+                if event == "token":
+                    yield data["text"]
+                elif event == "done":
+                    result.update(data)
+                elif event == "error":
+                    raise RuntimeError(data.get("detail", "stream failed"))
+
 def delete_session(session_id):
     """Delete a chat session"""
     try:
-        response = requests.delete(f"{API_BASE}/chat/sessions/{session_id}")
+        response = http.delete(f"{API_BASE}/chat/sessions/{session_id}", timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
-            load_sessions()
+            st.session_state.sessions = [
+                s for s in st.session_state.sessions if s['session_id'] != session_id
+            ]
+            fetch_sessions.clear()
+            fetch_messages.clear()
             if st.session_state.current_session_id == session_id:
                 st.session_state.current_session_id = None
                 st.session_state.messages = []
@@ -118,10 +235,16 @@ def delete_session(session_id):
 with st.sidebar:
     st.markdown("### Chat Sessions")
     
-    if st.button("➕ New Chat", use_container_width=True, type="primary"):
-        if create_new_session():
-            st.success("New chat created!")
-            st.rerun()
+    col1, col2 = st.columns([5, 1])
+    with col1:
+        if st.button("➕ New Chat", use_container_width=True, type="primary"):
+            if create_new_session():
+                st.success("New chat created!")
+                st.rerun()
+    with col2:
+        # Picks up changes made elsewhere, such as generated titles
+        if st.button("🔄", help="Refresh the chat list", use_container_width=True):
+            load_sessions(refresh=True)
     
     st.markdown("---")
     
@@ -151,6 +274,11 @@ with st.sidebar:
                 if delete_session(session['session_id']):
                     st.success("Deleted!")
                     st.rerun()
+    
+    if st.session_state.sessions_cursor:
+        if st.button("Load more", use_container_width=True):
+            load_more_sessions()
+            st.rerun()
 
 # Main content
 st.markdown("""
@@ -184,15 +312,34 @@ else:
             "timestamp": datetime.now().isoformat()
         })
         
-        # Get AI response
-        with st.spinner("Thinking..."):
-            response = send_message(prompt, st.session_state.current_session_id)
+        # Get AI response, token by token when the backend can stream
+        response = None
+        stream = None
+        if st.session_state.streaming_supported:
+            try:
+                stream = open_stream(prompt, st.session_state.current_session_id)
+            except Exception as e:
+                st.error(f"Error sending message: {str(e)}")
+            else:
+                if stream is None:
+                    st.session_state.streaming_supported = False
         
-        if response:
-            # Display assistant message
+        if stream is not None:
+            result = {}
             with st.chat_message("assistant"):
-                st.write(response['assistant_message'])
-            
+                try:
+                    st.write_stream(stream_tokens(stream, result))
+                except Exception as e:
+                    st.error(f"Error streaming response: {str(e)}")
+            response = result or None
+        elif not st.session_state.streaming_supported:
+            with st.spinner("Thinking..."):
+                response = send_message(prompt, st.session_state.current_session_id)
+            if response:
+                with st.chat_message("assistant"):
+                    st.write(response['assistant_message'])
+        
+        if response:
             # Add to messages
             st.session_state.messages.append({
                 "role": "assistant",
@@ -200,10 +347,9 @@ else:
                 "timestamp": response['timestamp']
             })
             
-            # Reload sessions to update timestamps
-            load_sessions()
-            
-            st.rerun()
+            # Move the session to the top locally; the sidebar catches up on the next
+            # interaction instead of rerunning the whole script after every turn
+            touch_session(st.session_state.current_session_id, response['timestamp'])
 
 # Footer
 st.markdown("---")
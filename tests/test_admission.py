@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def test_full_queue_rejects_at_once_with_429():
+    admission = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=1.0)
+
+    async def scenario():
+        held = await admission.acquire()
+        waiter = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0.01)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire()
+        admission.release(held)
+        admission.release(await waiter)
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+    assert rejected.status_code == 429
+    # One call running and one waiting, at the initial one second per call
+    assert rejected.retry_after == 2
+    stats = admission.stats()
+    assert stats["rejected_queue_full"] == 1
+    assert stats["admitted"] == 2
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0
+
+
+def test_wait_past_the_deadline_gives_up_with_503():
+    admission = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=0.01)
+
+    async def scenario():
+        held = await admission.acquire()
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire()
+        admission.release(held)
+        # The slot is free again for the next caller
+        admission.release(await asyncio.wait_for(admission.acquire(), timeout=0.1))
+        return rejected.value
+
+    rejected = asyncio.run(scenario())
+    assert rejected.status_code == 503
+    # The call that gave up still counts as waiting behind the running one
+    assert rejected.retry_after == 2
+    assert admission.stats()["rejected_timeout"] == 1
+    assert admission.stats()["queue_depth"] == 0
+
+
+def test_retry_after_scales_with_the_backlog_and_call_duration():
+    admission = AdmissionController(max_concurrency=2, max_queue=8)
+    admission._service_seconds = 3.0
+    assert admission.retry_after() == 2
+    admission.waiting = 4
+    # Five calls ahead across two slots at three seconds each
+    assert admission.retry_after() == 8
+    admission._service_seconds = 0.01
+    assert admission.retry_after() == 1
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from chat_socket import OutboxOverflow, SocketHub, SocketOutbox
+
+
+def drain(outbox: SocketOutbox, heartbeat_interval=None):
+    async def _drain():
+        outbox.close()
+        return [frame async for frame in outbox.frames(heartbeat_interval)]
+    return asyncio.run(_drain())
+
+
+def test_tokens_queued_behind_a_slow_reader_are_merged():
+    outbox = SocketOutbox(maxsize=4)
+    outbox.put({"type": "session", "session_id": "s1"})
+    for word in ("a ", "b ", "c"):
+        outbox.put({"type": "token", "text": word})
+    outbox.put({"type": "done"})
+    outbox.put({"type": "token", "text": "d"})
+
+    assert drain(outbox) == [
+        {"type": "session", "session_id": "s1"},
+        {"type": "token", "text": "a b c"},
+        {"type": "done"},
+        {"type": "token", "text": "d"},
+    ]
+    assert outbox.merged == 2
+
+
+def test_outbox_overflows_on_too_many_frames_or_characters():
+    outbox = SocketOutbox(maxsize=2)
+    outbox.put({"type": "pong"})
+    outbox.put({"type": "pong"})
+    with pytest.raises(OutboxOverflow):
+        outbox.put({"type": "pong"})
+    assert outbox.overflowed and outbox.closed
+    # Nothing more is buffered once the connection is being dropped
+    outbox.put({"type": "pong"})
+    assert len(outbox) == 0
+
+    outbox = SocketOutbox(maxsize=10, max_chars=5)
+    outbox.put({"type": "token", "text": "abc"})
+    with pytest.raises(OutboxOverflow):
+        outbox.put({"type": "token", "text": "def"})
+
+
+def test_sent_tokens_free_their_budget():
+    outbox = SocketOutbox(maxsize=10, max_chars=5)
+
+    async def scenario():
+        frames = outbox.frames()
+        for _ in range(3):
+            outbox.put({"type": "token", "text": "abcd"})
+            assert await frames.__anext__() == {"type": "token", "text": "abcd"}
+
+    asyncio.run(scenario())
+    assert not outbox.overflowed
+
+
+def test_idle_outbox_sends_heartbeats():
+    outbox = SocketOutbox()
+
+    async def scenario():
+        frames = outbox.frames(heartbeat_interval=0.01)
+        first = await frames.__anext__()
+        outbox.put({"type": "token", "text": "hi"})
+        second = await frames.__anext__()
+        return first, second
+
+    assert asyncio.run(scenario()) == ({"type": "ping"}, {"type": "token", "text": "hi"})
+
+
+def test_hub_caps_open_connections():
+    hub = SocketHub(max_connections=2)
+    assert hub.admit() and hub.admit()
+    assert not hub.admit()
+    hub.leave()
+    assert hub.admit()
+    assert hub.stats()["open"] == 2
+    assert hub.stats()["rejected"] == 1
@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta, timezone
+
+from context_builder import build_context, estimate_tokens
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def message(index: int, content: str = "") -> dict:
+    return {
+        "role": "user" if index % 2 == 0 else "assistant",
+        "content": content or f"message {index}",
+        "timestamp": START + timedelta(seconds=index),
+    }
+
+
+def run_turns(turns: int, max_messages: int = 4, fetch_limit: int = 6, **options):
+    """Drive build_context like the server: fetch a window, save the turn and the summary"""
+    history, summary, summary_until, fingerprint, windows = [], "", None, None, []
+    for turn in range(turns):
+        window = build_context(
+            history[-fetch_limit:], f"message {len(history)}",
+            summary=summary, summary_until=summary_until, max_messages=max_messages,
+            previous_fingerprint=fingerprint, **options
+        )
+        windows.append(window)
+        if window.summary_changed:
+            summary, summary_until = window.summary, window.summary_until
+        fingerprint = window.fingerprint
+        history += [message(len(history)), message(len(history) + 1)]
+    return windows
+
+
+def test_first_turn_sends_the_message_alone():
+    window = build_context([], "hello")
+    assert window.prompt == "hello"
+    assert window.messages == [{"role": "user", "content": "hello"}]
+    assert window.first_turn
+    assert not build_context([message(0), message(1)], "again").first_turn
+
+
+def test_history_is_sent_as_role_tagged_turns_after_the_summary():
+    window = build_context(
+        [message(i) for i in range(4)], "next",
+        summary="User: older", summary_until=START - timedelta(seconds=1),
+    )
+    assert window.messages == [
+        {"role": "system", "content": "Summary of earlier conversation:\nUser: older"},
+        {"role": "user", "content": "message 0"},
+        {"role": "assistant", "content": "message 1"},
+        {"role": "user", "content": "message 2"},
+        {"role": "assistant", "content": "message 3"},
+        {"role": "user", "content": "next"},
+    ]
+    assert window.prompt.startswith("Summary of earlier conversation:\nUser: older\n\nPrevious conversation:\nUser: message 0")
+    assert window.prompt.endswith("Assistant: message 3\n\nUser: next")
+
+
+def test_each_aged_out_message_is_folded_exactly_once():
+    windows = run_turns(10, summary_budget=1000)
+
+    folded = []
+    previous = ""
+    for window in windows:
+        assert window.summary.startswith(previous)
+        new_lines = window.summary[len(previous):].strip("\n").splitlines()
+        folded += new_lines
+        previous = window.summary
+
+    # Every message was either folded once or is still sent verbatim
+    assert len(folded) == len(set(folded))
+    verbatim = [f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}" for msg in windows[-1].messages[1:-1]]
+    assert folded + verbatim == [f"{'User' if i % 2 == 0 else 'Assistant'}: message {i}" for i in range(18)]
+    assert len(verbatim) <= 4
+
+
+def test_prompts_extend_the_previous_request_between_compactions():
+    windows = run_turns(20, max_messages=10, fetch_limit=12)
+
+    compactions = 0
+    for previous, window in zip(windows, windows[1:]):
+        if window.summary_changed:
+            compactions += 1
+            continue
+        # The whole previous request is repeated, and only it
+        assert window.messages[:len(previous.messages)] == previous.messages
+        assert window.reused_tokens == previous.prompt_tokens
+        assert len(window.messages) == len(previous.messages) + 2
+    # A compaction folds the window down to half, so it happens every few turns
+    assert 0 < compactions <= 20 // 3
+    assert sum(window.reused_tokens for window in windows) > 0.6 * sum(window.prompt_tokens for window in windows)
+
+
+def test_window_start_is_saved_without_a_summary():
+    windows = run_turns(12, summary_budget=0)
+    assert all(window.summary == "" for window in windows)
+    assert all(msg['role'] != "system" for window in windows for msg in window.messages)
+    # Dropped messages still move the saved window start, so prompts keep extending
+    assert sum(1 for window in windows if window.reused_tokens) >= 6
+
+
+def test_unchanged_window_does_not_refold():
+    history = [message(i) for i in range(6)]
+    first = build_context(history, "next", max_messages=4)
+    assert first.summary_changed
+    again = build_context(history, "next", summary=first.summary, summary_until=first.summary_until, max_messages=4)
+    assert not again.summary_changed
+    assert again.summary == first.summary
+
+
+def test_prompt_stays_within_the_token_budget():
+    long_text = "word " * 400
+    windows = run_turns(
+        8, max_messages=10, fetch_limit=12,
+        token_budget=600, summary_budget=150, message_token_limit=200,
+    )
+    history = [message(i, long_text) for i in range(12)]
+    windows.append(build_context(
+        history, "question", max_messages=10,
+        token_budget=600, summary_budget=150, message_token_limit=200,
+    ))
+    for window in windows:
+        assert window.prompt_tokens <= 600 + estimate_tokens("question")
+        assert estimate_tokens(window.summary) <= 150 + 10
@@ -0,0 +1,234 @@
+import asyncio
+import json
+
+import pytest
+
+from llm_clients import EmergentLlmProvider, FakeLlmError, FakeLlmProvider
+
+
+def turn(text):
+    return [{"role": "user", "content": text}]
+
+
+def collect(provider, text):
+    async def _collect():
+        return [chunk async for chunk in provider.stream("s1", turn(text))]
+    return asyncio.run(_collect())
+
+
+def test_fake_reply_depends_only_on_the_prompt():
+    first = FakeLlmProvider(ttft_ms=0, tokens_per_second=0, reply_tokens=8)
+    second = FakeLlmProvider(ttft_ms=0, tokens_per_second=0, reply_tokens=8, seed=3)
+
+    reply = asyncio.run(first.complete("s1", turn("hello")))
+    assert reply == asyncio.run(second.complete("s2", turn("hello")))
+    assert reply != asyncio.run(first.complete("s1", turn("goodbye")))
+    assert len(reply.split()) == 8
+    assert "".join(collect(first, "hello")) == reply
+
+
+def test_fake_streaming_can_be_turned_off():
+    provider = FakeLlmProvider(ttft_ms=0, tokens_per_second=0, reply_tokens=5, streaming=False)
+    assert len(collect(provider, "hello")) == 1
+    assert len(collect(FakeLlmProvider(ttft_ms=0, tokens_per_second=0, reply_tokens=5), "hello")) == 5
+
+
+def test_fake_errors_follow_the_error_rate():
+    provider = FakeLlmProvider(ttft_ms=0, tokens_per_second=0, reply_tokens=3, error_rate=1.0, seed=1)
+    with pytest.raises(FakeLlmError):
+        asyncio.run(provider.complete("s1", turn("hello")))
+
+    provider = FakeLlmProvider(ttft_ms=0, tokens_per_second=0, reply_tokens=3, error_rate=0.0)
+    assert asyncio.run(provider.complete("s1", turn("hello")))
+
+
+def test_fake_timing_follows_ttft_and_token_rate():
+    provider = FakeLlmProvider(ttft_ms=50, tokens_per_second=100, reply_tokens=6, jitter=0)
+
+    async def timed():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await provider.complete("s1", turn("hello"))
+        return loop.time() - start
+
+    assert 0.09 <= asyncio.run(timed()) < 0.5
+
+
+def test_fake_prefix_cache_reports_reused_input_and_skips_its_prefill():
+    provider = FakeLlmProvider(ttft_ms=0, tokens_per_second=0, reply_tokens=3, jitter=0, prefill_ms_per_1k_tokens=50)
+    history = [
+        {"role": "system", "content": "Summary of earlier conversation:\n" + "fact " * 2000},
+        {"role": "user", "content": "first question"},
+    ]
+
+    async def timed_turn(messages):
+        usage = {}
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        reply = await provider.complete("s1", messages, usage)
+        return reply, usage, loop.time() - start
+
+    reply, first, cold = asyncio.run(timed_turn(history))
+    assert first['cached_input_tokens'] == 0
+    history += [{"role": "assistant", "content": reply}, {"role": "user", "content": "second question"}]
+    _, second, warm = asyncio.run(timed_turn(history))
+    # The whole first request is the prefix of the second one
+    assert second['cached_input_tokens'] == first['input_tokens']
+    assert second['input_tokens'] > first['input_tokens']
+    assert cold > 0.09 and warm < cold / 2
+
+    _, changed, _ = asyncio.run(timed_turn([{"role": "user", "content": "other"}] + history))
+    assert changed['cached_input_tokens'] == 0
+
+
+class AnthropicStandIn:
+    """Local Messages API endpoint replying with ``words``, streamed ``delay`` apart.
+
+    Like the real prompt cache, input that repeats an earlier request up to
+    its last message is reported as ``cache_read_input_tokens``.
+    """
+
+    def __init__(self, words, delay=0.0):
+        self.words = words
+        self.delay = delay
+        self.requests = []
+        self.prefixes = []
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self.server.sockets[0].getsockname()[1]}"
+        return self
+
+    async def __aexit__(self, *exc):
+        # litellm keeps its connections open, so do not wait for them
+        self.server.close()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").lower()
+                length = next(
+                    (int(line.split(":", 1)[1]) for line in head.split("\r\n") if line.startswith("content-length:")), 0
+                )
+                body = json.loads(await reader.readexactly(length))
+                self.requests.append(body)
+                usage = self.usage(body)
+                if body.get("stream"):
+                    await self.stream(writer, usage)
+                else:
+                    reply = json.dumps(self.message(" ".join(self.words), usage)).encode()
+                    writer.write(
+                        b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                        + f"Content-Length: {len(reply)}\r\n\r\n".encode() + reply
+                    )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    def usage(self, body):
+        turns = [
+            json.dumps([{k: v for k, v in block.items() if k != "cache_control"} for block in msg["content"]])
+            for msg in body["messages"]
+        ]
+        cached = max(
+            (sum(map(len, prefix)) // 4 for prefix in self.prefixes if turns[:len(prefix)] == prefix), default=0
+        )
+        self.prefixes.append(turns)
+        return {"input_tokens": sum(map(len, turns)) // 4 - cached, "cache_read_input_tokens": cached, "output_tokens": 5}
+
+    @staticmethod
+    def message(text, usage):
+        return {
+            "id": "msg_1", "type": "message", "role": "assistant", "model": "stand-in",
+            "content": [{"type": "text", "text": text}], "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": usage,
+        }
+
+    async def stream(self, writer, usage):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+        async def event(name, data):
+            frame = f"event: {name}\ndata: {json.dumps({'type': name, **data})}\n\n".encode()
+            writer.write(f"{len(frame):x}\r\n".encode() + frame + b"\r\n")
+            await writer.drain()
+
+        await event("message_start", {"message": {**self.message("", usage), "content": [], "stop_reason": None}})
+        await event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+        for i, word in enumerate(self.words):
+            await asyncio.sleep(self.delay)
+            text = word if i == 0 else " " + word
+            await event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": text}})
+        await event("content_block_stop", {"index": 0})
+        await event("message_delta", {"delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": 5}})
+        await event("message_stop", {})
+        writer.write(b"0\r\n\r\n")
+
+
+def test_emergent_provider_streams_through_litellm():
+    pytest.importorskip("litellm")
+    words = ["streamed", "one", "word", "at", "a", "time"]
+
+    async def scenario():
+        async with AnthropicStandIn(words, delay=0.05) as stand_in:
+            provider = EmergentLlmProvider("key", "anthropic", "claude-test", "Be brief.", api_base=stand_in.url)
+            await provider.start()
+            try:
+                loop = asyncio.get_running_loop()
+                start = loop.time()
+                arrivals, chunks = [], []
+                async for chunk in provider.stream("s1", turn("hello")):
+                    arrivals.append(loop.time() - start)
+                    chunks.append(chunk)
+                reply = await provider.complete("s1", turn("hello"))
+            finally:
+                await provider.close()
+            return stand_in.requests, arrivals, chunks, reply
+
+    requests, arrivals, chunks, reply = asyncio.run(scenario())
+    assert "".join(chunks) == reply == " ".join(words)
+    assert len(chunks) == len(words)
+    # The first token arrives long before the last one
+    assert arrivals[0] < arrivals[-1] - 0.15
+    assert requests[0]["stream"] is True
+    assert requests[0]["model"] == "claude-test"
+    assert requests[0]["system"] == [{"type": "text", "text": "Be brief."}]
+    assert requests[0]["messages"] == [
+        {"role": "user", "content": [{"type": "text", "text": "hello", "cache_control": {"type": "ephemeral"}}]}
+    ]
+
+
+def test_emergent_provider_sends_role_tagged_turns_that_extend_the_cached_prefix():
+    pytest.importorskip("litellm")
+    summary = {"role": "system", "content": "Summary of earlier conversation:\nUser: my name is Ada"}
+
+    async def scenario():
+        async with AnthropicStandIn(["fine", "thanks"]) as stand_in:
+            provider = EmergentLlmProvider("key", "anthropic", "claude-test", "Be brief.", api_base=stand_in.url)
+            first, second = {}, {}
+            try:
+                messages = [summary, {"role": "user", "content": "how are you?"}]
+                reply = await provider.complete("s1", messages, first)
+                messages += [{"role": "assistant", "content": reply}, {"role": "user", "content": "and now?"}]
+                chunks = [chunk async for chunk in provider.stream("s1", messages, second)]
+            finally:
+                await provider.close()
+            return stand_in.requests, first, second, chunks
+
+    requests, first, second, chunks = asyncio.run(scenario())
+    assert "".join(chunks) == "fine thanks"
+    # The system message stays first and unchanged; the summary follows it
+    assert [block["text"] for block in requests[0]["system"]] == ["Be brief.", summary["content"]]
+    assert requests[1]["system"] == requests[0]["system"]
+    assert [msg["role"] for msg in requests[1]["messages"]] == ["user", "assistant", "user"]
+    assert requests[1]["messages"][-1]["content"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert first['cached_input_tokens'] == 0
+    assert second['cached_input_tokens'] > 0
+    assert second['input_tokens'] >= second['cached_input_tokens']
+
+
+def test_universal_key_without_api_base_uses_the_sdk():
+    assert not EmergentLlmProvider("sk-emergent-abc", "anthropic", "m", "s").streams
+    assert EmergentLlmProvider("sk-emergent-abc", "anthropic", "m", "s", api_base="http://proxy").streams
+    assert EmergentLlmProvider("sk-ant-abc", "anthropic", "m", "s").streams
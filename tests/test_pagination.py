@@ -0,0 +1,56 @@
+import base64
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from pagination import decode_cursor, decode_score_cursor, encode_cursor, encode_score_cursor
+
+AT = datetime(2025, 1, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+
+
+def raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(AT, "s1")) == (AT, "s1")
+
+
+@pytest.mark.parametrize("payload", [
+    {"v": {"$gt": ""}, "t": "datetime", "id": "s1"},
+    {"v": {"$gt": ""}, "id": "s1"},
+    {"v": "2025-01-01T12:00:00+00:00", "id": "s1"},
+    {"v": "yesterday", "t": "datetime", "id": "s1"},
+    {"v": "2025-01-01T12:00:00", "t": "datetime", "id": "s1"},
+    {"v": "2025-01-01T12:00:00+00:00", "t": "datetime", "id": {"$ne": None}},
+    {"v": "2025-01-01T12:00:00+00:00", "t": "datetime"},
+    ["not", "an", "object"],
+])
+def test_malformed_cursors_are_rejected(payload):
+    with pytest.raises(ValueError):
+        decode_cursor(raw_cursor(payload))
+
+
+def test_garbage_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor("not base64 at all!")
+
+
+def test_score_cursor_round_trip():
+    assert decode_score_cursor(encode_score_cursor(1.0000000000000002, "m1")) == (1.0000000000000002, "m1")
+
+
+@pytest.mark.parametrize("payload", [
+    {"v": {"$gt": 0}, "t": "score", "id": "m1"},
+    {"v": "1.5", "t": "score", "id": "m1"},
+    {"v": True, "t": "score", "id": "m1"},
+    {"v": 1.5, "t": "datetime", "id": "m1"},
+    {"v": 1.5, "t": "score", "id": 3},
+])
+def test_malformed_score_cursors_are_rejected(payload):
+    with pytest.raises(ValueError):
+        decode_score_cursor(raw_cursor(payload))
+    # Listing cursors and search cursors are not interchangeable
+    with pytest.raises(ValueError):
+        decode_cursor(encode_score_cursor(1.5, "m1"))
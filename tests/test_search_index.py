@@ -0,0 +1,34 @@
+from search_index import InvertedIndex, query_terms, snippet
+
+
+def test_query_terms_are_distinct_lowercase_words():
+    assert query_terms("Sourdough, sourdough STARTER?!") == ["sourdough", "starter"]
+    assert query_terms("!!!") == []
+    assert len(query_terms(" ".join(f"w{i}" for i in range(100)))) == 16
+
+
+def test_index_scores_follow_adds_and_removes():
+    index = InvertedIndex()
+    index.add("m1", "sourdough starter")
+    index.add("m2", "sourdough bread")
+    index.add("m3", "car starter motor")
+
+    scores = index.scores(["sourdough", "starter"])
+    assert set(scores) == {"m1", "m2", "m3"}
+    assert scores["m1"] > max(scores["m2"], scores["m3"])
+
+    index.remove("m1", "sourdough starter")
+    assert set(index.scores(["sourdough", "starter"])) == {"m2", "m3"}
+    index.remove("m2", "sourdough bread")
+    assert index.scores(["sourdough"]) == {}
+    assert len(index) == 1
+
+
+def test_snippet_centres_on_the_first_match():
+    text = "filler " * 50 + "the sourdough starter needs feeding " + "more " * 50
+    excerpt = snippet(text, ["sourdough"], width=60)
+    assert "sourdough starter" in excerpt
+    assert excerpt.startswith("…") and excerpt.endswith("…")
+    assert len(excerpt) <= 62
+    assert snippet("short text", ["missing"]) == "short text"
+    assert snippet(text, ["missing"], width=20).startswith("filler")
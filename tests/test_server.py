@@ -0,0 +1,160 @@
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+# server reads its configuration at import time
+os.environ.update(
+    STORAGE_BACKEND="memory", LLM_BACKEND="fake", PERSIST_MODE="sync", TITLE_MODE="off",
+    FAKE_LLM_TTFT_MS="0", FAKE_LLM_TOKENS_PER_SECOND="0", FAKE_LLM_REPLY_TOKENS="3", FAKE_LLM_JITTER="0",
+)
+
+import httpx  # noqa: E402
+
+import server  # noqa: E402
+
+
+def client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test")
+
+
+@pytest.fixture
+def prompts(monkeypatch):
+    """Contents of the messages of every prompt sent to the fake model"""
+    sent = []
+    complete = server.llm_provider.complete
+
+    async def recording(session_id, messages, usage=None):
+        sent.append([msg['content'] for msg in messages])
+        return await complete(session_id, messages, usage)
+
+    monkeypatch.setattr(server.llm_provider, "complete", recording)
+    return sent
+
+
+async def new_session(http) -> str:
+    return (await http.post("/api/chat/sessions")).json()['session_id']
+
+
+async def send(http, session_id: str, message: str):
+    return await http.post("/api/chat", json={"message": message, "session_id": session_id})
+
+
+def test_failed_save_leaves_the_turn_out_of_the_next_prompt(prompts, monkeypatch):
+    save_turns = server.storage.save_turns
+
+    async def failing(turns):
+        raise RuntimeError("write failed")
+
+    async def scenario():
+        async with client() as http:
+            session_id = await new_session(http)
+            assert (await send(http, session_id, "first")).status_code == 200
+            monkeypatch.setattr(server.storage, "save_turns", failing)
+            assert (await send(http, session_id, "lost")).status_code == 500
+            monkeypatch.setattr(server.storage, "save_turns", save_turns)
+            assert (await send(http, session_id, "third")).status_code == 200
+            return session_id
+
+    session_id = asyncio.run(scenario())
+    assert "lost" not in prompts[-1]
+    assert prompts[-1][0] == "first" and prompts[-1][-1] == "third"
+    saved = asyncio.run(server.storage.recent_messages(session_id, 10))
+    assert [msg['content'] for msg in saved if msg['role'] == "user"] == ["first", "third"]
+
+
+def test_cached_turns_skip_the_session_read_until_the_session_is_deleted(monkeypatch):
+    calls = []
+    get_session = server.storage.get_session
+
+    async def counting(session_id):
+        calls.append(session_id)
+        return await get_session(session_id)
+
+    async def scenario():
+        async with client() as http:
+            session_id = await new_session(http)
+            monkeypatch.setattr(server.storage, "get_session", counting)
+            for i in range(5):
+                assert (await send(http, session_id, f"turn {i}")).status_code == 200
+            hot_reads = len(calls)
+            await http.delete(f"/api/chat/sessions/{session_id}")
+            return hot_reads, (await send(http, session_id, "after delete")).status_code
+
+    hot_reads, status = asyncio.run(scenario())
+    assert hot_reads == 0
+    assert status == 404
+
+
+def test_cached_context_is_reloaded_after_another_worker_answers(prompts, monkeypatch):
+    monkeypatch.setattr(server, "REVALIDATE_CONTEXT", True)
+    loads = []
+    recent_messages = server.storage.recent_messages
+
+    async def counting(session_id, limit):
+        loads.append(session_id)
+        return await recent_messages(session_id, limit)
+
+    monkeypatch.setattr(server.storage, "recent_messages", counting)
+
+    async def other_worker_turn(session_id, text):
+        now = server.utc_now() + server.timedelta(milliseconds=10)
+        docs = [
+            {"id": f"{text}-q", "session_id": session_id, "role": "user", "content": text, "timestamp": now},
+            {"id": f"{text}-a", "session_id": session_id, "role": "assistant", "content": "reply",
+             "timestamp": now + server.timedelta(milliseconds=1)},
+        ]
+        await server.storage.save_turns([{
+            "session_id": session_id, "messages": docs, "session_update": {"updated_at": docs[-1]['timestamp']},
+        }])
+
+    async def scenario():
+        async with client() as http:
+            session_id = await new_session(http)
+            await send(http, session_id, "turn-A1")
+            await send(http, session_id, "turn-A2")
+            unchanged_loads = len(loads)
+            await other_worker_turn(session_id, "turn-B3")
+            await send(http, session_id, "turn-A4")
+            return unchanged_loads
+
+    unchanged_loads = asyncio.run(scenario())
+    # Unchanged sessions are served from the cache
+    assert unchanged_loads == 0
+    assert "turn-B3" in prompts[-1]
+    assert [text for text in prompts[-1] if text.startswith("turn-")] == ["turn-A1", "turn-A2", "turn-B3", "turn-A4"]
+
+
+def test_session_deleted_by_another_worker_is_gone_despite_the_cache(monkeypatch):
+    monkeypatch.setattr(server, "REVALIDATE_CONTEXT", True)
+
+    async def scenario():
+        async with client() as http:
+            session_id = await new_session(http)
+            await send(http, session_id, "hello")
+            # Another worker's delete does not evict this worker's cache
+            await server.storage.soft_delete_sessions([session_id], server.utc_now())
+            return (await send(http, session_id, "still there?")).status_code
+
+    assert asyncio.run(scenario()) == 404
+
+
+def test_rejected_model_call_answers_with_retry_after(monkeypatch):
+    admission = server.AdmissionController(max_concurrency=1, max_queue=0, queue_timeout=1.0)
+    monkeypatch.setattr(server, "llm_admission", admission)
+
+    async def scenario():
+        async with client() as http:
+            session_id = await new_session(http)
+            held = await admission.acquire()
+            try:
+                return await send(http, session_id, "hello")
+            finally:
+                admission.release(held)
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,392 @@
+"""Conformance tests shared by every storage backend.
+
+Memory and SQLite always run. MongoDB runs when TEST_MONGO_URL points at a
+server; each test uses (and drops) a throwaway database there.
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from storage import MemoryChatStorage, MongoChatStorage, SqliteChatStorage
+
+BACKENDS = ["memory", "sqlite", "mongo"]
+START = datetime(2025, 1, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+
+
+@pytest.fixture(params=BACKENDS)
+def run(request, tmp_path):
+    """Run ``scenario(storage)`` against a fresh storage of the parametrized backend"""
+    backend = request.param
+    mongo_url = os.environ.get("TEST_MONGO_URL")
+    if backend == "mongo" and not mongo_url:
+        pytest.skip("TEST_MONGO_URL not set")
+
+    async def _run(scenario):
+        if backend == "memory":
+            storage = MemoryChatStorage()
+        elif backend == "sqlite":
+            storage = SqliteChatStorage(str(tmp_path / "chat.db"))
+        else:
+            storage = MongoChatStorage(mongo_url, f"storage_test_{uuid.uuid4().hex[:8]}")
+        await storage.setup()
+        try:
+            await scenario(storage)
+        finally:
+            if backend == "mongo":
+                await storage.client.drop_database(storage.db.name)
+            await storage.close()
+
+    return lambda scenario: asyncio.run(_run(scenario))
+
+
+def session_doc(session_id: str, offset: int = 0) -> dict:
+    at = START + timedelta(seconds=offset)
+    return {"session_id": session_id, "title": "New Chat", "created_at": at, "updated_at": at}
+
+
+def message_doc(session_id: str, index: int, role: str = "user") -> dict:
+    return {
+        "id": f"{session_id}-{index:04d}",
+        "session_id": session_id,
+        "role": role,
+        "content": f"message {index}",
+        "timestamp": START + timedelta(milliseconds=index),
+    }
+
+
+def turn(session_id: str, messages: list, **session_update) -> dict:
+    return {
+        "session_id": session_id,
+        "messages": messages,
+        "session_update": {"updated_at": messages[-1]["timestamp"], **session_update},
+    }
+
+
+def test_session_round_trip(run):
+    async def scenario(storage):
+        await storage.create_session(session_doc("s1"))
+        session = await storage.get_session("s1")
+        assert session == session_doc("s1")
+        assert session["created_at"].tzinfo is not None
+        assert await storage.get_session("missing") is None
+
+    run(scenario)
+
+
+def test_list_sessions_pages_by_updated_at(run):
+    async def scenario(storage):
+        for i in range(5):
+            await storage.create_session(session_doc(f"s{i}", offset=i))
+
+        newest = await storage.list_sessions(3)
+        assert [doc["session_id"] for doc in newest] == ["s4", "s3", "s2"]
+        assert set(newest[0]) == {"session_id", "title", "created_at", "updated_at"}
+
+        last = newest[-1]
+        older = await storage.list_sessions(3, (last["updated_at"], last["session_id"]))
+        assert [doc["session_id"] for doc in older] == ["s1", "s0"]
+
+        newer = await storage.list_sessions(3, (last["updated_at"], last["session_id"]), descending=False)
+        assert [doc["session_id"] for doc in newer] == ["s3", "s4"]
+
+    run(scenario)
+
+
+def test_list_sessions_breaks_ties_by_session_id(run):
+    async def scenario(storage):
+        for session_id in ("b", "a", "c"):
+            await storage.create_session(session_doc(session_id))
+
+        first = await storage.list_sessions(2)
+        assert [doc["session_id"] for doc in first] == ["c", "b"]
+        rest = await storage.list_sessions(2, (first[-1]["updated_at"], first[-1]["session_id"]))
+        assert [doc["session_id"] for doc in rest] == ["a"]
+
+    run(scenario)
+
+
+def test_list_sessions_follows_updates(run):
+    async def scenario(storage):
+        for i in range(4):
+            await storage.create_session(session_doc(f"s{i}", offset=i))
+        await storage.save_turns([turn("s1", [{**message_doc("s1", 0), "timestamp": START + timedelta(seconds=10)}])])
+        await storage.soft_delete_sessions(["s2"], START)
+
+        assert [doc["session_id"] for doc in await storage.list_sessions(10)] == ["s1", "s3", "s0"]
+        first = await storage.list_sessions(1)
+        rest = await storage.list_sessions(10, (first[-1]["updated_at"], first[-1]["session_id"]))
+        assert [doc["session_id"] for doc in rest] == ["s3", "s0"]
+
+    run(scenario)
+
+
+def test_save_turns_inserts_messages_and_updates_sessions(run):
+    async def scenario(storage):
+        await storage.create_session(session_doc("s1"))
+        await storage.create_session(session_doc("s2", offset=1))
+        summary_until = START + timedelta(milliseconds=1)
+
+        await storage.save_turns([
+            turn("s1", [message_doc("s1", 1), message_doc("s1", 2, "assistant")],
+                 summary="user: hi", summary_until=summary_until),
+            turn("s2", [message_doc("s2", 3), message_doc("s2", 4, "assistant")]),
+        ])
+
+        session = await storage.get_session("s1")
+        assert session["updated_at"] == START + timedelta(milliseconds=2)
+        assert session["summary"] == "user: hi"
+        assert session["summary_until"] == summary_until
+        assert [doc["content"] for doc in await storage.list_messages("s2", 10)] == ["message 3", "message 4"]
+
+    run(scenario)
+
+
+def test_list_messages_pages_by_timestamp(run):
+    async def scenario(storage):
+        await storage.create_session(session_doc("s1"))
+        await storage.save_turns([turn("s1", [message_doc("s1", i) for i in range(5)])])
+
+        first = await storage.list_messages("s1", 2)
+        assert [doc["id"] for doc in first] == ["s1-0000", "s1-0001"]
+        assert first[0] == message_doc("s1", 0)
+
+        cursor = (first[-1]["timestamp"], first[-1]["id"])
+        rest = await storage.list_messages("s1", 10, cursor)
+        assert [doc["id"] for doc in rest] == ["s1-0002", "s1-0003", "s1-0004"]
+
+        back = await storage.list_messages("s1", 10, (rest[-1]["timestamp"], rest[-1]["id"]), descending=True)
+        assert [doc["id"] for doc in back] == ["s1-0003", "s1-0002", "s1-0001", "s1-0000"]
+        assert await storage.list_messages("other", 10) == []
+
+    run(scenario)
+
+
+def test_recent_messages_returns_the_last_window_oldest_first(run):
+    async def scenario(storage):
+        await storage.create_session(session_doc("s1"))
+        await storage.save_turns([turn("s1", [message_doc("s1", i) for i in range(6)])])
+
+        recent = await storage.recent_messages("s1", 3)
+        assert [doc["content"] for doc in recent] == ["message 3", "message 4", "message 5"]
+        assert set(recent[0]) == {"role", "content", "timestamp"}
+        assert await storage.recent_messages("other", 3) == []
+
+    run(scenario)
+
+
+def test_soft_deleted_sessions_are_hidden_then_purged(run):
+    async def scenario(storage):
+        for session_id in ("s1", "s2"):
+            await storage.create_session(session_doc(session_id))
+            await storage.save_turns([turn(session_id, [message_doc(session_id, i) for i in range(5)])])
+
+        assert await storage.soft_delete_sessions(["s1", "missing"], START) == 1
+        assert await storage.soft_delete_sessions(["s1"], START) == 0
+        assert [doc["session_id"] for doc in await storage.list_sessions(10)] == ["s2"]
+        assert await storage.deleted_sessions(10) == ["s1"]
+
+        assert await storage.purge_messages("s1", 3) == 3
+        assert await storage.purge_messages("s1", 3) == 2
+        assert await storage.purge_messages("s1", 3) == 0
+        await storage.purge_session("s1")
+        assert await storage.get_session("s1") is None
+        assert await storage.deleted_sessions(10) == []
+        assert len(await storage.list_messages("s2", 10)) == 5
+
+        # Sessions that are not marked deleted are never purged
+        await storage.purge_session("s2")
+        assert await storage.get_session("s2") is not None
+
+    run(scenario)
+
+
+def test_turns_of_deleted_or_missing_sessions_are_dropped(run):
+    async def scenario(storage):
+        for session_id in ("s1", "s2"):
+            await storage.create_session(session_doc(session_id))
+        await storage.soft_delete_sessions(["s1"], START)
+
+        await storage.save_turns([
+            turn("s1", [message_doc("s1", 1)]),
+            turn("s2", [message_doc("s2", 2)]),
+            turn("missing", [message_doc("missing", 3)]),
+        ])
+        assert await storage.list_messages("s1", 10) == []
+        assert await storage.list_messages("missing", 10) == []
+        assert [doc["id"] for doc in await storage.list_messages("s2", 10)] == ["s2-0002"]
+        assert (await storage.get_session("s1"))["updated_at"] == START
+
+    run(scenario)
+
+
+def search_turn(session_id: str, index: int, content: str) -> dict:
+    return turn(session_id, [{**message_doc(session_id, index), "content": content}])
+
+
+def test_search_ranks_messages_matching_more_terms_first(run):
+    async def scenario(storage):
+        await storage.create_session({**session_doc("s1"), "title": "Baking"})
+        await storage.create_session(session_doc("s2"))
+        await storage.save_turns([
+            search_turn("s1", 1, "my sourdough starter smells sour"),
+            search_turn("s1", 2, "sourdough bread recipe"),
+            search_turn("s2", 3, "the starter motor needs repair"),
+            search_turn("s2", 4, "unrelated text about cars"),
+        ])
+
+        hits = await storage.search_messages(["sourdough", "starter"], 10)
+        assert [hit["id"] for hit in hits][0] == "s1-0001"
+        assert {hit["id"] for hit in hits} == {"s1-0001", "s1-0002", "s2-0003"}
+        assert hits[0]["title"] == "Baking"
+        assert hits[0]["content"] == "my sourdough starter smells sour"
+        assert hits[0]["timestamp"] == START + timedelta(milliseconds=1)
+        assert hits[0]["score"] > hits[1]["score"]
+        assert await storage.search_messages(["nothing"], 10) == []
+
+    run(scenario)
+
+
+def test_search_pages_with_a_score_cursor(run):
+    async def scenario(storage):
+        await storage.create_session(session_doc("s1"))
+        await storage.save_turns([search_turn("s1", i, f"needle in haystack {i}") for i in range(5)])
+
+        everything = await storage.search_messages(["needle"], 10)
+        seen, cursor = [], None
+        while True:
+            page = await storage.search_messages(["needle"], 2, cursor)
+            if not page:
+                break
+            seen += page
+            cursor = (page[-1]["score"], page[-1]["id"])
+        assert [hit["id"] for hit in seen] == [hit["id"] for hit in everything]
+        assert len(everything) == 5
+        # Equal scores are ordered by id
+        assert [hit["id"] for hit in everything] == sorted(hit["id"] for hit in everything)
+
+    run(scenario)
+
+
+def test_search_follows_saves_deletes_and_purges(run):
+    async def scenario(storage):
+        for session_id in ("s1", "s2"):
+            await storage.create_session(session_doc(session_id))
+            await storage.save_turns([search_turn(session_id, 1, "needle")])
+        assert len(await storage.search_messages(["needle"], 10)) == 2
+
+        await storage.soft_delete_sessions(["s1"], START)
+        assert [hit["session_id"] for hit in await storage.search_messages(["needle"], 10)] == ["s2"]
+        await storage.purge_messages("s1", 10)
+        await storage.purge_session("s1")
+        assert [hit["session_id"] for hit in await storage.search_messages(["needle"], 10)] == ["s2"]
+
+        await storage.save_turns([search_turn("s2", 2, "another needle")])
+        assert len(await storage.search_messages(["needle"], 10)) == 2
+
+    run(scenario)
+
+
+def test_search_fills_pages_past_hits_of_deleted_sessions(run):
+    async def scenario(storage):
+        for session_id in ("s1", "s2"):
+            await storage.create_session(session_doc(session_id))
+        await storage.save_turns([search_turn("s1", i, "needle needle needle") for i in range(4)])
+        await storage.save_turns([search_turn("s2", i, f"needle in haystack {i}") for i in range(4)])
+        await storage.soft_delete_sessions(["s1"], START)
+
+        page = await storage.search_messages(["needle"], 3)
+        assert [hit["id"] for hit in page] == ["s2-0000", "s2-0001", "s2-0002"]
+        cursor = (page[-1]["score"], page[-1]["id"])
+        assert [hit["id"] for hit in await storage.search_messages(["needle"], 3, cursor)] == ["s2-0003"]
+
+    run(scenario)
+
+
+def collect_export(storage, **filters):
+    async def _collect():
+        return [(kind, doc) async for kind, doc in storage.export(batch_size=2, **filters)]
+    return _collect()
+
+
+def test_export_streams_each_session_followed_by_its_messages(run):
+    async def scenario(storage):
+        for i, session_id in enumerate(("s3", "s1", "s2")):
+            await storage.create_session(session_doc(session_id, offset=i))
+            await storage.save_turns([turn(session_id, [message_doc(session_id, j) for j in range(3)], summary="sum")])
+        await storage.create_session(session_doc("s0"))
+        await storage.soft_delete_sessions(["s2"], START)
+
+        records = await collect_export(storage)
+        assert [(kind, doc.get("id", doc["session_id"])) for kind, doc in records] == [
+            ("session", "s0"),
+            ("session", "s1"), ("message", "s1-0000"), ("message", "s1-0001"), ("message", "s1-0002"),
+            ("session", "s3"), ("message", "s3-0000"), ("message", "s3-0001"), ("message", "s3-0002"),
+        ]
+        session = records[1][1]
+        assert session["summary"] == "sum" and "deleted_at" not in session
+        assert records[2][1] == message_doc("s1", 0)
+
+        only = await collect_export(storage, session_id="s3")
+        assert [kind for kind, _ in only] == ["session", "message", "message", "message"]
+        # Sessions active in the range, and their messages sent in it
+        ranged = await collect_export(
+            storage, since=START + timedelta(milliseconds=1), until=START + timedelta(milliseconds=2)
+        )
+        # s0 was last updated before the range and s1 created after it
+        assert [doc.get("id", doc["session_id"]) for _, doc in ranged] == ["s3", "s3-0001"]
+
+    run(scenario)
+
+
+def test_import_skips_existing_documents_and_orphan_messages(run):
+    async def scenario(storage):
+        await storage.create_session(session_doc("s1"))
+        await storage.soft_delete_sessions(["s1"], START)
+
+        assert await storage.import_sessions([session_doc("s1"), session_doc("s2"), session_doc("s2")]) == 1
+        messages = [message_doc("s2", 0), message_doc("s2", 1), message_doc("s1", 2), message_doc("missing", 3)]
+        assert await storage.import_messages(messages) == 2
+        assert await storage.import_messages(messages) == 0
+        assert [doc["id"] for doc in await storage.list_messages("s2", 10)] == ["s2-0000", "s2-0001"]
+        assert [hit["id"] for hit in await storage.search_messages(["message"], 10)] == ["s2-0000", "s2-0001"]
+        assert await storage.list_messages("s1", 10) == []
+
+    run(scenario)
+
+
+def test_expire_sessions_marks_idle_sessions_deleted(run):
+    async def scenario(storage):
+        for i in range(3):
+            await storage.create_session(session_doc(f"s{i}", offset=i * 60))
+
+        assert await storage.expire_sessions(START + timedelta(seconds=90), START) == 2
+        assert [doc["session_id"] for doc in await storage.list_sessions(10)] == ["s2"]
+        assert sorted(await storage.deleted_sessions(10)) == ["s0", "s1"]
+
+    run(scenario)
+
+
+def test_status_checks_round_trip(run):
+    async def scenario(storage):
+        doc = {"id": "c1", "client_name": "probe", "timestamp": START}
+        await storage.add_status_check(doc)
+        assert await storage.list_status_checks(10) == [doc]
+
+    run(scenario)
+
+
+def test_set_session_titles_keeps_renamed_sessions(run):
+    async def scenario(storage):
+        await storage.create_session(session_doc("s1"))
+        await storage.create_session({**session_doc("s2"), "title": "Renamed"})
+
+        await storage.set_session_titles({"s1": "Sourdough", "s2": "Other", "missing": "X"}, "New Chat")
+        assert (await storage.get_session("s1"))["title"] == "Sourdough"
+        assert (await storage.get_session("s2"))["title"] == "Renamed"
+        await storage.set_session_titles({}, "New Chat")
+
+    run(scenario)
@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from turn_scheduler import SessionTurnScheduler, TurnRejected
+
+
+class Recorder:
+    """Turn body that records how many turns overlap"""
+
+    def __init__(self, delay: float = 0.02):
+        self.delay = delay
+        self.calls = 0
+        self.running = 0
+        self.max_running = 0
+
+    def __call__(self, result="reply"):
+        async def turn():
+            self.calls += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            try:
+                await asyncio.sleep(self.delay)
+                return result
+            finally:
+                self.running -= 1
+        return turn
+
+
+def test_queue_runs_turns_of_a_session_one_at_a_time():
+    scheduler = SessionTurnScheduler("queue")
+    same, other = Recorder(), Recorder()
+
+    async def scenario():
+        await asyncio.gather(
+            *(scheduler.run("s1", f"m{i}", same()) for i in range(3)),
+            *(scheduler.run(f"s{i}", "m", other()) for i in range(2, 5)),
+        )
+
+    asyncio.run(scenario())
+    assert same.calls == 3 and same.max_running == 1
+    # Different sessions never wait on each other
+    assert other.max_running == 3
+    assert scheduler.queued == 2
+    assert scheduler.stats()["active_sessions"] == 0
+
+
+def test_reject_fails_a_turn_while_another_runs():
+    scheduler = SessionTurnScheduler("reject")
+    recorder = Recorder()
+
+    async def scenario():
+        return await asyncio.gather(
+            scheduler.run("s1", "a", recorder()),
+            scheduler.run("s1", "b", recorder()),
+            return_exceptions=True,
+        )
+
+    first, second = asyncio.run(scenario())
+    assert first == "reply"
+    assert isinstance(second, TurnRejected)
+    assert recorder.calls == 1
+    assert scheduler.stats()["active_sessions"] == 0
+
+
+def test_merged_double_submit_makes_one_call():
+    scheduler = SessionTurnScheduler("merge")
+    recorder = Recorder()
+
+    async def scenario():
+        return await asyncio.gather(
+            scheduler.run("s1", "hello", recorder("first")),
+            scheduler.run("s1", "hello", recorder("second")),
+            scheduler.run("s1", "different", recorder("third")),
+        )
+
+    assert asyncio.run(scenario()) == ["first", "first", "third"]
+    assert recorder.calls == 2
+    assert recorder.max_running == 1
+    assert scheduler.merged == 1
+
+
+def test_merged_turns_share_a_failure():
+    scheduler = SessionTurnScheduler("merge")
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("model down")
+
+    async def scenario():
+        return await asyncio.gather(
+            scheduler.run("s1", "hello", failing),
+            scheduler.run("s1", "hello", failing),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert scheduler.stats()["active_sessions"] == 0
+
+
+def test_waiting_turn_times_out_and_forgets_its_lock():
+    scheduler = SessionTurnScheduler("queue", wait_timeout=0.01)
+    recorder = Recorder(delay=0.1)
+
+    async def scenario():
+        return await asyncio.gather(
+            scheduler.run("s1", "a", recorder()),
+            scheduler.run("s1", "b", recorder()),
+            return_exceptions=True,
+        )
+
+    first, second = asyncio.run(scenario())
+    assert first == "reply"
+    assert isinstance(second, TurnRejected)
+    assert scheduler.rejected == 1
+    assert scheduler.stats()["active_sessions"] == 0
+
+
+def test_cancelled_waiter_does_not_hold_the_session():
+    scheduler = SessionTurnScheduler("queue")
+
+    async def scenario():
+        await scheduler.acquire("s1")
+        waiter = asyncio.create_task(scheduler.acquire("s1"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await scheduler.release("s1")
+        assert scheduler.stats()["active_sessions"] == 0
+        # The session is free again
+        await asyncio.wait_for(scheduler.acquire("s1"), timeout=0.1)
+        await scheduler.release("s1")
+
+    asyncio.run(scenario())
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        SessionTurnScheduler("lifo")